@@ -1,5 +1,20 @@
-from typing import Any, Callable, Dict, Generic, List, Optional, Tuple, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Generic,
+    Iterable,
+    List,
+    Optional,
+    Tuple,
+    TypeVar,
+    Union,
+)
+from collections import OrderedDict
+from array import array
 from dataclasses import dataclass, field
+from functools import lru_cache
+from itertools import islice
 import json
 import hashlib
 import struct
@@ -7,10 +22,18 @@ import msgpack
 import marshal
 import types
 
+try:
+    import numpy as np
+except ImportError:  # optional extra; AtomTable selections fall back to pure Python
+    np = None
+
 T = TypeVar('T')
 V = TypeVar('V')
 C = TypeVar('C')
 
+# Propositional formula: variable name, constant, or (case_base symbol, *operands)
+Formula = Union[str, bool, Tuple[Any, ...]]
+
 @dataclass
 class Atom(Generic[T, V, C]):
     type: Union[str, str]
@@ -91,11 +114,343 @@ class Atom(Generic[T, V, C]):
     """
 
 
+class AtomView:
+    """Read-only view of one AtomTable row; call to_atom() for a full Atom."""
+    __slots__ = ('table', 'row')
+
+    def __init__(self, table: 'AtomTable', row: int):
+        self.table = table
+        self.row = row
+
+    @property
+    def type(self) -> str:
+        return self.table.type_names[self.table.type_codes[self.row]]
+
+    @property
+    def value(self) -> Any:
+        return self.table.value_at(self.row)
+
+    @property
+    def digest(self) -> bytes:
+        return self.table.digest_at(self.row)
+
+    def to_atom(self) -> Atom:
+        return Atom(type=self.type, value=self.value)
+
+    def __repr__(self):
+        return f"{self.value} : {self.type}"
+
+    def __eq__(self, other: Any) -> bool:
+        return isinstance(other, AtomView) and self.digest == other.digest
+
+    def __hash__(self) -> int:
+        return int.from_bytes(self.digest, 'big')
+
+
+class AtomTable:
+    """
+    Columnar storage for many atoms.
+
+    Each row has a type code, a storage kind and a slot into the column for that kind:
+    int64 values in array('q'), floats in array('d'), everything else in an object list.
+    Digests are the first 16 bytes of the same sha256(repr(value)) that Atom.hash uses,
+    kept back to back in one bytearray. Selections gather whole columns with numpy
+    when it is installed, and fall back to list comprehensions otherwise.
+    """
+    KIND_INT, KIND_FLOAT, KIND_OBJECT = 0, 1, 2
+    DIGEST_SIZE = 16
+    _INT_MIN, _INT_MAX = -(1 << 63), (1 << 63) - 1
+
+    def __init__(self):
+        self.type_names: List[str] = []
+        self._type_index: Dict[str, int] = {}
+        self.type_codes = array('H')
+        self.kinds = array('B')
+        self.slots = array('Q')
+        self.ints = array('q')
+        self.floats = array('d')
+        self.objects: List[Any] = []
+        self.digests = bytearray()
+
+    def __len__(self) -> int:
+        return len(self.type_codes)
+
+    def __getitem__(self, row: int) -> AtomView:
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("AtomTable row out of range")
+        return AtomView(self, row)
+
+    def __iter__(self):
+        return (AtomView(self, row) for row in range(len(self)))
+
+    def _type_code(self, type_name: str) -> int:
+        code = self._type_index.get(type_name)
+        if code is None:
+            code = self._type_index[type_name] = len(self.type_names)
+            self.type_names.append(type_name)
+        return code
+
+    def _append(self, code: int, value: Any, digest: bytes):
+        self.type_codes.append(code)
+        kind = type(value)
+        if kind is int and self._INT_MIN <= value <= self._INT_MAX:
+            self.kinds.append(self.KIND_INT)
+            self.slots.append(len(self.ints))
+            self.ints.append(value)
+        elif kind is float:
+            self.kinds.append(self.KIND_FLOAT)
+            self.slots.append(len(self.floats))
+            self.floats.append(value)
+        else:
+            self.kinds.append(self.KIND_OBJECT)
+            self.slots.append(len(self.objects))
+            self.objects.append(value)
+        self.digests += digest
+
+    @classmethod
+    def _digest(cls, value: Any) -> bytes:
+        return hashlib.sha256(repr(value).encode()).digest()[:cls.DIGEST_SIZE]
+
+    def append(self, atom: Atom):
+        self._append(
+            self._type_code(atom.type),
+            atom.value,
+            bytes.fromhex(atom.hash)[: self.DIGEST_SIZE],
+        )
+
+    def extend(self, atoms: Iterable[Atom]):
+        for atom in atoms:
+            self.append(atom)
+
+    def extend_values(self, type_name: str, values: Iterable[Any]):
+        """Append raw values of one type without building Atom objects."""
+        code = self._type_code(type_name)
+        for value in values:
+            self._append(code, value, self._digest(value))
+
+    @classmethod
+    def from_atoms(cls, atoms: Iterable[Atom]) -> 'AtomTable':
+        table = cls()
+        table.extend(atoms)
+        return table
+
+    def value_at(self, row: int) -> Any:
+        kind, slot = self.kinds[row], self.slots[row]
+        if kind == self.KIND_INT:
+            return self.ints[slot]
+        if kind == self.KIND_FLOAT:
+            return self.floats[slot]
+        return self.objects[slot]
+
+    def digest_at(self, row: int) -> bytes:
+        start = row * self.DIGEST_SIZE
+        return bytes(self.digests[start:start + self.DIGEST_SIZE])
+
+    def values(self) -> List[Any]:
+        return self._values_at(range(len(self)))
+
+    def _column(self, column: array) -> 'np.ndarray':
+        return np.frombuffer(column, np.dtype(column.typecode))
+
+    def _indices(self, rows: Iterable[int]) -> 'np.ndarray':
+        if isinstance(rows, range):
+            return np.arange(rows.start, rows.stop, rows.step, dtype=np.intp)
+        if isinstance(rows, np.ndarray):
+            return rows.astype(np.intp, copy=False)
+        return np.fromiter(rows, np.intp)
+
+    def _values_at(self, rows: Iterable[int]) -> List[Any]:
+        """Values of the given rows, gathered a column at a time."""
+        if np is None:
+            return [self.value_at(row) for row in rows]
+        rows = self._indices(rows)
+        kinds = self._column(self.kinds)[rows]
+        slots = self._column(self.slots)[rows].astype(np.intp)
+        values = np.empty(len(rows), object)
+        for kind, column in (
+            (self.KIND_INT, self.ints),
+            (self.KIND_FLOAT, self.floats),
+        ):
+            mask = kinds == kind
+            if mask.any():
+                values[mask] = self._column(column)[slots[mask]].tolist()
+        mask = kinds == self.KIND_OBJECT
+        if mask.any():
+            objects = self.objects
+            picked = slots[mask].tolist()
+            values[mask] = np.fromiter(
+                (objects[slot] for slot in picked), object, len(picked)
+            )
+        return values.tolist()
+
+    def _empty_like(self) -> 'AtomTable':
+        result = AtomTable()
+        result.type_names = list(self.type_names)
+        result._type_index = dict(self._type_index)
+        return result
+
+    def take(self, rows: Iterable[int]) -> 'AtomTable':
+        """New table holding the given rows, in order, gathered without re-hashing."""
+        if np is None:
+            return self._take_rows(rows)
+        result = self._empty_like()
+        rows = self._indices(rows)
+        size = self.DIGEST_SIZE
+        kinds = self._column(self.kinds)[rows]
+        slots = self._column(self.slots)[rows].astype(np.intp)
+        new_slots = np.empty(len(rows), np.uint64)
+        for kind, source, target in ((self.KIND_INT, self.ints, result.ints),
+                                     (self.KIND_FLOAT, self.floats, result.floats)):
+            mask = kinds == kind
+            new_slots[mask] = np.arange(np.count_nonzero(mask), dtype=np.uint64)
+            target.frombytes(self._column(source)[slots[mask]].tobytes())
+        mask = kinds == self.KIND_OBJECT
+        new_slots[mask] = np.arange(np.count_nonzero(mask), dtype=np.uint64)
+        objects = self.objects
+        result.objects = [objects[slot] for slot in slots[mask].tolist()]
+        result.type_codes.frombytes(self._column(self.type_codes)[rows].tobytes())
+        result.kinds.frombytes(kinds.tobytes())
+        result.slots.frombytes(new_slots.tobytes())
+        digests = np.frombuffer(self.digests, np.uint8).reshape(-1, size)
+        result.digests = bytearray(digests[rows].tobytes())
+        return result
+
+    def _take_rows(self, rows: Iterable[int]) -> 'AtomTable':
+        result = self._empty_like()
+        count = len(self)
+        rows = [row + count if row < 0 else row for row in rows]
+        kinds = [self.kinds[row] for row in rows]
+        slots = [self.slots[row] for row in rows]
+        counts = [0, 0, 0]
+        new_slots = []
+        for kind in kinds:
+            new_slots.append(counts[kind])
+            counts[kind] += 1
+        result.ints = array(
+            'q', [self.ints[s] for k, s in zip(kinds, slots) if k == self.KIND_INT]
+        )
+        result.floats = array(
+            'd', [self.floats[s] for k, s in zip(kinds, slots) if k == self.KIND_FLOAT]
+        )
+        result.objects = [
+            self.objects[s] for k, s in zip(kinds, slots) if k == self.KIND_OBJECT
+        ]
+        result.type_codes = array('H', [self.type_codes[row] for row in rows])
+        result.kinds = array('B', kinds)
+        result.slots = array('Q', new_slots)
+        view = memoryview(self.digests)
+        size = self.DIGEST_SIZE
+        result.digests = bytearray(
+            b''.join([view[row * size:(row + 1) * size] for row in rows])
+        )
+        return result
+
+    def _rows_of_type(self, code: int) -> Iterable[int]:
+        if np is None:
+            return [row for row, c in enumerate(self.type_codes) if c == code]
+        return np.flatnonzero(self._column(self.type_codes) == code)
+
+    def filter(
+        self,
+        predicate: Optional[Callable[[Any], bool]] = None,
+        type: Optional[str] = None,
+    ) -> 'AtomTable':
+        """Rows matching a type and/or a value predicate; types come from type_codes."""
+        if type is not None:
+            code = self._type_index.get(type)
+            if code is None:
+                return self.take(())
+            rows = self._rows_of_type(code)
+        else:
+            rows = range(len(self))
+        if predicate is not None:
+            rows = [
+                row
+                for row, value in zip(rows, self._values_at(rows))
+                if predicate(value)
+            ]
+        return self.take(rows)
+
+    def group_by_type(self) -> Dict[str, 'AtomTable']:
+        """One table per type, in order of each type's first row."""
+        if np is None:
+            groups: Dict[int, List[int]] = {}
+            for row, code in enumerate(self.type_codes):
+                groups.setdefault(code, []).append(row)
+            return {
+                self.type_names[code]: self.take(rows) for code, rows in groups.items()
+            }
+        codes = self._column(self.type_codes)
+        order = np.argsort(codes, kind='stable')
+        runs = (
+            np.split(order, np.flatnonzero(np.diff(codes[order])) + 1)
+            if len(order)
+            else []
+        )
+        runs.sort(key=lambda run: run[0])
+        return {self.type_names[codes[run[0]]]: self.take(run) for run in runs}
+
+    def dedup(self) -> 'AtomTable':
+        """Keep the first row for each digest."""
+        size = self.DIGEST_SIZE
+        if np is None:
+            first: Dict[bytes, int] = {}
+            for row in range(len(self)):
+                first.setdefault(bytes(self.digests[row * size:(row + 1) * size]), row)
+            return self.take(first.values())
+        # Digests as 64-bit words; a stable sort puts each digest's first row first in
+        # its run. Sorting on the leading word alone groups equal digests unless two
+        # differ only later
+        words = np.frombuffer(self.digests, np.uint64).reshape(-1, size // 8)
+        order = np.argsort(words[:, 0], kind='stable')
+        ordered = words[order]
+        if (
+            (ordered[1:, 0] == ordered[:-1, 0])
+            & (ordered[1:, 1:] != ordered[:-1, 1:]).any(axis=1)
+        ).any():
+            order = np.lexsort(words.T[::-1])
+            ordered = words[order]
+        starts = np.ones(len(order), bool)
+        starts[1:] = (ordered[1:] != ordered[:-1]).any(axis=1)
+        return self.take(np.sort(order[starts]))
+
+    def to_msgpack(self) -> bytes:
+        """Export all columns at once; typed columns travel as raw bytes."""
+        return msgpack.packb({
+            'types': self.type_names,
+            'type_codes': self.type_codes.tobytes(),
+            'kinds': self.kinds.tobytes(),
+            'slots': self.slots.tobytes(),
+            'ints': self.ints.tobytes(),
+            'floats': self.floats.tobytes(),
+            'objects': self.objects,
+            'digests': bytes(self.digests),
+        }, use_bin_type=True)
+
+    @classmethod
+    def from_msgpack(cls, data: bytes) -> 'AtomTable':
+        columns = msgpack.unpackb(data, raw=False)
+        table = cls()
+        table.type_names = columns['types']
+        table._type_index = {name: code for code, name in enumerate(table.type_names)}
+        table.type_codes.frombytes(columns['type_codes'])
+        table.kinds.frombytes(columns['kinds'])
+        table.slots.frombytes(columns['slots'])
+        table.ints.frombytes(columns['ints'])
+        table.floats.frombytes(columns['floats'])
+        table.objects = columns['objects']
+        table.digests = bytearray(columns['digests'])
+        return table
+
+
 @dataclass
 class HypercubeEmbedding(Atom[T, V, C]):
-    M: int
-    K: int
-    N: int
+    type: str = 'hypercube'
+    M: int = field(default=10, kw_only=True)
+    K: int = field(default=10, kw_only=True)
+    N: int = field(default=100, kw_only=True)
     hypercube: List[List[List[int]]] = field(init=False)
 
     def __post_init__(self):
@@ -107,6 +462,41 @@ class HypercubeEmbedding(Atom[T, V, C]):
         for dim in range(self.M):
             self.hypercube[dim][stream_index][config_index] = bytecode[dim % m_length]
 
+    def embed_batch(self, cells: Dict[Tuple[int, int], bytes]):
+        """Scatter many bytecodes at once, keyed by (stream_index, config_index)."""
+        if not cells:
+            return
+        coords = list(cells.keys())
+        codes = list(cells.values())
+        for dim in range(self.M):
+            plane = self.hypercube[dim]
+            for (stream_index, config_index), bytecode in zip(coords, codes):
+                plane[stream_index][config_index] = bytecode[dim % len(bytecode)]
+
+    _HEADER = struct.Struct('>3I')
+
+    def encode(self) -> bytes:
+        """M, K, N then every cell as one byte, dim-major; cells hold bytecode bytes."""
+        cells = bytes(
+            value for plane in self.hypercube for row in plane for value in row
+        )
+        return self._HEADER.pack(self.M, self.K, self.N) + cells
+
+    @classmethod
+    def decode(cls, data: bytes) -> 'HypercubeEmbedding':
+        M, K, N = cls._HEADER.unpack_from(data, 0)
+        cells = bytes(data[cls._HEADER.size:])
+        if len(cells) != M * K * N:
+            raise ValueError(
+                f"Hypercube data holds {len(cells)} cells, expected {M * K * N}"
+            )
+        embedding = cls(M=M, K=K, N=N)
+        embedding.hypercube = [
+            [list(cells[(dim * K + k) * N:(dim * K + k + 1) * N]) for k in range(K)]
+            for dim in range(M)
+        ]
+        return embedding
+
     def analyze_similarity(self, stream1: int, stream2: int) -> float:
         similarity = sum(
             sum(abs(self.hypercube[dim][stream1][config] - self.hypercube[dim][stream2][config])
@@ -118,8 +508,23 @@ class HypercubeEmbedding(Atom[T, V, C]):
     def visualize(self):
         print("Visualizing the hypercube...(use your imagination)")
 
+# Compiled layouts and code caches for the FormalTheory codec
+_THEORY_LENGTHS = struct.Struct('>5I')
+_CODE_LENGTH = struct.Struct('>I')
+_FUNCTION_CACHE: 'OrderedDict[bytes, Callable]' = OrderedDict()
+_FUNCTION_CACHE_SIZE = 4096
+
+_dump_code = lru_cache(maxsize=_FUNCTION_CACHE_SIZE)(marshal.dumps)
+
+
+@lru_cache(maxsize=256)
+def _theory_layout(*lengths: int) -> struct.Struct:
+    return struct.Struct('>3sB5I{}s{}s{}s{}s{}s'.format(*lengths))
+
+
 @dataclass
 class FormalTheory(Atom, Generic[T]):
+    type: str = 'theory'
     reflexivity: Callable[[T], bool] = lambda x: x == x
     symmetry: Callable[[T, T], bool] = lambda x, y: x == y
     transitivity: Callable[[T, T, T], bool] = lambda x, y, z: (x == y) and (y == z) and (x == z)
@@ -131,7 +536,7 @@ class FormalTheory(Atom, Generic[T]):
     hypercube_embedding: HypercubeEmbedding = field(init=False)
 
     def __post_init__(self):
-        self.hypercube_embedding = HypercubeEmbedding(10, 10, 100)
+        self.hypercube_embedding = HypercubeEmbedding(M=10, K=10, N=100)
         self.update_value()
         self.case_base = {
             '⊤': lambda x, _: x,
@@ -161,6 +566,36 @@ class FormalTheory(Atom, Generic[T]):
         self.hypercube_embedding.embed_bytecode(atom.serialize_data(atom.value), self.atom_count % self.hypercube_embedding.K, self.atom_count % self.hypercube_embedding.N)
         self.update_value()
 
+    def add_atoms(self, atoms: Iterable[Atom], chunk_size: int = 4096) -> int:
+        """
+        Add many atoms in chunks; accepts any iterable, including generators.
+
+        Each chunk is serialized with one reusable msgpack Packer, and only the last
+        atom landing on a given (stream, config) cell is scattered into the hypercube,
+        since add_atom would overwrite the earlier ones anyway. Counters and value are
+        updated once per chunk. Returns the number of atoms added.
+        """
+        embedding = self.hypercube_embedding
+        packer = msgpack.Packer(use_bin_type=True)
+        iterator = iter(atoms)
+        added = 0
+        while True:
+            chunk = list(islice(iterator, chunk_size))
+            if not chunk:
+                break
+            cells: Dict[Tuple[int, int], bytes] = {}
+            count = self.atom_count
+            for atom in chunk:
+                count += 1
+                cells[(count % embedding.K, count % embedding.N)] = packer.pack(
+                    atom.value
+                )
+            embedding.embed_batch(cells)
+            self.atom_count = count
+            added += len(chunk)
+            self.update_value()
+        return added
+
     def complete_atom(self):
         """Mark an atom as completed and update the completed atom count."""
         self.completed_atoms += 1
@@ -168,20 +603,27 @@ class FormalTheory(Atom, Generic[T]):
 
     def encode(self) -> bytes:
         # Encode FormalTheory attributes into bytes
-        reflexivity_code = marshal.dumps(self.reflexivity.__code__)
-        symmetry_code = marshal.dumps(self.symmetry.__code__)
-        transitivity_code = marshal.dumps(self.transitivity.__code__)
-        transparency_code = marshal.dumps(self.transparency.__code__)
-        case_base_bytes = b''.join(marshal.dumps(func.__code__) for func in self.case_base.values())
-
-        packed_data = struct.pack(
-            '>3sB5I{}s{}s{}s{}s{}s'.format(
-                len(reflexivity_code),
-                len(symmetry_code),
-                len(transitivity_code),
-                len(transparency_code),
-                len(case_base_bytes)
-            ),
+        reflexivity_code = _dump_code(self.reflexivity.__code__)
+        symmetry_code = _dump_code(self.symmetry.__code__)
+        transitivity_code = _dump_code(self.transitivity.__code__)
+        transparency_code = _dump_code(self.transparency.__code__)
+        # Each entry is its length-prefixed symbol then its length-prefixed code;
+        # the symbol is needed because most case_base entries are anonymous lambdas
+        case_base_bytes = b''.join(
+            _CODE_LENGTH.pack(len(name)) + name + _CODE_LENGTH.pack(len(code)) + code
+            for name, code in ((symbol.encode('utf-8'), _dump_code(func.__code__))
+                               for symbol, func in self.case_base.items())
+        )
+        hypercube_data = self.hypercube_embedding.encode()
+
+        layout = _theory_layout(
+            len(reflexivity_code), len(symmetry_code),
+            len(transitivity_code), len(transparency_code),
+            len(case_base_bytes)
+        )
+        packed_data = bytearray(layout.size + len(hypercube_data))
+        layout.pack_into(
+            packed_data, 0,
             b'THY', 1,
             len(reflexivity_code), len(symmetry_code),
             len(transitivity_code), len(transparency_code),
@@ -190,30 +632,30 @@ class FormalTheory(Atom, Generic[T]):
             transitivity_code, transparency_code,
             case_base_bytes
         )
-        hypercube_data = self.hypercube_embedding.encode()
-        packed_data += hypercube_data
+        packed_data[layout.size:] = hypercube_data
 
-        return packed_data
+        return bytes(packed_data)
 
     @classmethod
     def decode(cls, data: bytes) -> 'FormalTheory':
+        view = memoryview(data)
         offset = 4  # Skip the b'THY' part and version number
-        lengths = struct.unpack_from('>5I', data, offset)
-        offset += 4 * 5
+        lengths = _THEORY_LENGTHS.unpack_from(view, offset)
+        offset += _THEORY_LENGTHS.size
         reflexivity_len, symmetry_len, transitivity_len, transparency_len, case_base_len = lengths
 
-        reflexivity_code = data[offset:offset + reflexivity_len]
+        reflexivity_code = view[offset:offset + reflexivity_len]
         offset += reflexivity_len
-        symmetry_code = data[offset:offset + symmetry_len]
+        symmetry_code = view[offset:offset + symmetry_len]
         offset += symmetry_len
-        transitivity_code = data[offset:offset + transitivity_len]
+        transitivity_code = view[offset:offset + transitivity_len]
         offset += transitivity_len
-        transparency_code = data[offset:offset + transparency_len]
+        transparency_code = view[offset:offset + transparency_len]
         offset += transparency_len
-        case_base_bytes = data[offset:offset + case_base_len]
+        case_base_bytes = view[offset:offset + case_base_len]
         offset += case_base_len
 
-        hypercube_data = data[offset:]
+        hypercube_data = view[offset:]
 
         theory = cls()
         theory.reflexivity = cls.load_function(reflexivity_code)
@@ -227,19 +669,36 @@ class FormalTheory(Atom, Generic[T]):
 
     @staticmethod
     def load_function(bytecode: bytes) -> Callable:
+        """
+        Rebuild a function from marshalled code, reusing the function already built for
+        identical bytecode so known functions are never unmarshalled twice.
+        """
+        digest = hashlib.blake2b(bytecode, digest_size=16).digest()
+        func = _FUNCTION_CACHE.get(digest)
+        if func is not None:
+            _FUNCTION_CACHE.move_to_end(digest)
+            return func
         code = marshal.loads(bytecode)
-        return types.FunctionType(code, globals())
+        func = types.FunctionType(code, globals())
+        _FUNCTION_CACHE[digest] = func
+        if len(_FUNCTION_CACHE) > _FUNCTION_CACHE_SIZE:
+            _FUNCTION_CACHE.popitem(last=False)
+        return func
 
     @staticmethod
     def load_case_base(case_base_bytes: bytes) -> Dict[str, Callable[..., bool]]:
         case_base = {}
         offset = 0
         while offset < len(case_base_bytes):
-            length, = struct.unpack_from('>I', case_base_bytes, offset)
-            offset += 4
-            func_bytes = case_base_bytes[offset:offset + length]
-            func = FormalTheory.load_function(func_bytes)
-            case_base[func.__name__] = func
+            length, = _CODE_LENGTH.unpack_from(case_base_bytes, offset)
+            offset += _CODE_LENGTH.size
+            symbol = bytes(case_base_bytes[offset:offset + length]).decode('utf-8')
+            offset += length
+            length, = _CODE_LENGTH.unpack_from(case_base_bytes, offset)
+            offset += _CODE_LENGTH.size
+            case_base[symbol] = FormalTheory.load_function(
+                case_base_bytes[offset:offset + length]
+            )
             offset += length
         return case_base
 
@@ -252,6 +711,25 @@ class FormalTheory(Atom, Generic[T]):
 
     def contrapositive(self, a, b):
         return (not b) or (not a)
+
+    def compile_formula(
+        self, expression: Formula, variables: Optional[Iterable[str]] = None
+    ) -> 'CompiledFormula':
+        """Compile a formula over case_base symbols into a bitset evaluator."""
+        def check(node):
+            if isinstance(node, tuple):
+                if node[0] not in self.case_base:
+                    raise ValueError(f"Unknown case_base operator: {node[0]}")
+                for operand in node[1:]:
+                    check(operand)
+        check(expression)
+        return CompiledFormula(expression, variables)
+
+    def is_satisfiable(self, expression: Formula) -> bool:
+        return self.compile_formula(expression).is_satisfiable()
+
+    def is_tautology(self, expression: Formula) -> bool:
+        return self.compile_formula(expression).is_tautology()
     
     def to_dict(self) -> Dict[str, Any]:
         return {
@@ -263,7 +741,7 @@ class FormalTheory(Atom, Generic[T]):
             'value': self.value,
             'atom_count': self.atom_count,
             'completed_atoms': self.completed_atoms,
-            'hypercube_embedding': self.hypercube_embedding.encode()  # Not implemented yet
+            'hypercube_embedding': self.hypercube_embedding.encode()
         }
 
     @classmethod
@@ -273,7 +751,10 @@ class FormalTheory(Atom, Generic[T]):
         theory.symmetry = cls.load_function(data['symmetry'])
         theory.transitivity = cls.load_function(data['transitivity'])
         theory.transparency = cls.load_function(data['transparency'])
-        theory.case_base = cls.load_case_base(data['case_base'])
+        theory.case_base = {
+            symbol: cls.load_function(code)
+            for symbol, code in data['case_base'].items()
+        }
         theory.value = data['value']
         theory.atom_count = data['atom_count']
         theory.completed_atoms = data['completed_atoms']
@@ -281,6 +762,158 @@ class FormalTheory(Atom, Generic[T]):
         return theory
 
 
+# Bitwise templates for case_base symbols; M is the all-ones mask of the evaluation
+# width
+BITWISE_OPERATORS: Dict[str, Tuple[int, str]] = {
+    '⊤': (2, '{0}'),
+    '⊥': (2, '{1}'),
+    'a': (2, '({0} | {1})'),
+    '¬': (1, '(~{0} & M)'),
+    '∧': (2, '({0} & {1})'),
+    '∨': (2, '({0} | {1})'),
+    '→': (2, '((~{0} & M) | {1})'),
+    '↔': (2, '(~({0} ^ {1}) & M)'),
+    '¬∨': (2, '(~({0} | {1}) & M)'),
+    '¬∧': (2, '(~({0} & {1}) & M)'),
+    'contrapositive': (2, '(~({0} & {1}) & M)'),
+}
+
+
+@lru_cache(maxsize=1024)
+def _compile_bitwise(source: str, arity: int) -> Callable[..., int]:
+    args = ', '.join(f'v{i}' for i in range(arity))
+    return eval(
+        compile(f'lambda {args}{", " if args else ""}M: {source}', '<formula>', 'eval')
+    )
+
+
+class CompiledFormula:
+    """
+    A propositional formula compiled to bitwise operations over packed integer bitsets.
+
+    Formulas are nested tuples of a case_base symbol followed by its operands, e.g.
+    ('→', ('∧', 'p', 'q'), 'p'); strings are variables and bools are constants.
+    Bit r of an evaluation corresponds to one assignment, so a single call evaluates
+    as many rows as the bitsets are wide.
+    """
+    BLOCK_BITS = 20  # 1M assignments per truth-table block
+
+    def __init__(self, expression: Formula, variables: Optional[Iterable[str]] = None):
+        self.expression = expression
+        found: List[str] = []
+        self._collect(expression, found)
+        self.variables: Tuple[str, ...] = (
+            tuple(variables) if variables is not None else tuple(found)
+        )
+        missing = set(found) - set(self.variables)
+        if missing:
+            raise ValueError(f"Variables not listed: {sorted(missing)}")
+        self.source = self._emit(
+            expression, {name: i for i, name in enumerate(self.variables)}
+        )
+        self._fn = _compile_bitwise(self.source, len(self.variables))
+
+    @classmethod
+    def _collect(cls, node: Formula, found: List[str]):
+        if isinstance(node, str):
+            if node not in found:
+                found.append(node)
+        elif isinstance(node, tuple):
+            symbol, *operands = node
+            if symbol not in BITWISE_OPERATORS:
+                raise ValueError(f"No bitwise form for operator: {symbol}")
+            arity = BITWISE_OPERATORS[symbol][0]
+            if len(operands) != arity:
+                raise ValueError(
+                    f"Operator {symbol} takes {arity} operands, got {len(operands)}"
+                )
+            for operand in operands:
+                cls._collect(operand, found)
+        elif not isinstance(node, bool):
+            raise TypeError(f"Unsupported formula node: {node!r}")
+
+    @classmethod
+    def _emit(cls, node: Formula, index: Dict[str, int]) -> str:
+        if isinstance(node, bool):
+            return 'M' if node else '0'
+        if isinstance(node, str):
+            return f'v{index[node]}'
+        symbol, *operands = node
+        return BITWISE_OPERATORS[symbol][1].format(
+            *(cls._emit(op, index) for op in operands)
+        )
+
+    def evaluate(self, bitsets: Dict[str, int], width: int) -> int:
+        """Evaluate `width` rows at once; bit r of each bitset is the value in row r."""
+        return self._fn(*(bitsets[name] for name in self.variables), (1 << width) - 1)
+
+    def evaluate_batch(self, assignments: Iterable[Dict[str, bool]]) -> List[bool]:
+        """Pack a batch of assignments into bitsets and evaluate them in one pass."""
+        rows = list(assignments)
+        packed = {name: 0 for name in self.variables}
+        for r, row in enumerate(rows):
+            for name in self.variables:
+                if row[name]:
+                    packed[name] |= 1 << r
+        result = self.evaluate(packed, len(rows))
+        return [bool((result >> r) & 1) for r in range(len(rows))]
+
+    @staticmethod
+    def _column(i: int, width_bits: int) -> int:
+        """Bitset of the rows in which variable i is true, for 2**width_bits rows."""
+        half = 1 << i
+        column, length = ((1 << half) - 1) << half, half << 1
+        while length < (1 << width_bits):
+            column |= column << length
+            length <<= 1
+        return column
+
+    def iter_blocks(self, block_bits: Optional[int] = None):
+        """
+        Yield (first_row, width, result_bits) over the full truth table in blocks.
+        Row r assigns variable i the value (r >> i) & 1.
+        """
+        n = len(self.variables)
+        block_bits = min(n, self.BLOCK_BITS if block_bits is None else block_bits)
+        width = 1 << block_bits
+        mask = (1 << width) - 1
+        low = [self._column(i, block_bits) for i in range(block_bits)]
+        for block in range(1 << (n - block_bits)):
+            high = [mask if (block >> j) & 1 else 0 for j in range(n - block_bits)]
+            yield block << block_bits, width, self._fn(*low, *high, mask)
+
+    def truth_table(self) -> int:
+        """The whole truth table as one bitset; only sensible for few variables."""
+        table = 0
+        for first, _, bits in self.iter_blocks():
+            table |= bits << first
+        return table
+
+    def _row(self, r: int) -> Dict[str, bool]:
+        return {name: bool((r >> i) & 1) for i, name in enumerate(self.variables)}
+
+    def satisfying_assignment(self) -> Optional[Dict[str, bool]]:
+        for first, _, bits in self.iter_blocks():
+            if bits:
+                return self._row(first + (bits & -bits).bit_length() - 1)
+        return None
+
+    def counterexample(self) -> Optional[Dict[str, bool]]:
+        for first, width, bits in self.iter_blocks():
+            missing = ~bits & ((1 << width) - 1)
+            if missing:
+                return self._row(first + (missing & -missing).bit_length() - 1)
+        return None
+
+    def is_satisfiable(self) -> bool:
+        return self.satisfying_assignment() is not None
+
+    def is_tautology(self) -> bool:
+        return self.counterexample() is None
+
+    def count_models(self) -> int:
+        return sum(bits.bit_count() for _, _, bits in self.iter_blocks())
+
 
 # Caching decorator
 def memoize(func: Callable) -> Callable:
@@ -1,5 +1,15 @@
+import hashlib
+import re
+import struct
+import sys
+import time
 from abc import ABC, abstractmethod
+from bisect import bisect_left
+from collections import OrderedDict
+from array import array
 from dataclasses import asdict, astuple, dataclass, field
+from functools import lru_cache
+from itertools import accumulate, chain
 from struct import Struct
 from types import (
     CodeType,
@@ -14,15 +24,20 @@ from typing import (
     Callable,
     Dict,
     Generic,
+    Iterable,
+    Iterator,
     List,
     NamedTuple,
     Optional,
+    Set,
     Tuple,
     Type,
     TypeVar,
     Union,
 )
 
+T = TypeVar('T')
+
 
 @dataclass
 class GrammarRule:
@@ -109,6 +124,281 @@ class Atom(ABC):
         """
         pass
 
+# Data type names, keyed by Python type name
+TYPE_NAMES: Dict[str, str] = {
+    'str': 'string',
+    'int': 'integer',
+    'float': 'float',
+    'bool': 'boolean',
+    'list': 'list',
+    'array': 'list',
+    'dict': 'dictionary'
+}
+
+# One-byte type tags; booleans carry their value in the tag
+TAG_STRING = 0x01
+TAG_INTEGER = 0x02  # zigzag varint
+TAG_BIGINT = 0x03  # varint byte length + signed big-endian bytes
+TAG_FLOAT = 0x04
+TAG_FALSE = 0x05
+TAG_TRUE = 0x06
+TAG_LIST = 0x07  # varint element count + elements
+TAG_DICTIONARY = 0x08  # varint pair count + alternating keys and values
+TAG_INT64_ARRAY = 0x09  # varint count + little-endian int64 block
+TAG_FLOAT64_ARRAY = 0x0A  # varint count + little-endian float64 block
+TAG_STRING_ARRAY = (
+    0x0B  # varint count + u32 code point offsets + varint byte length + UTF-8 text
+)
+
+_FLOAT64 = Struct('!d')
+_END = object()
+_VARINT_LIMIT = 1 << 63  # magnitudes at or above this use TAG_BIGINT
+_PACK_MIN = 4  # shorter homogeneous lists are not worth a packed block
+_BIG_ENDIAN_HOST = sys.byteorder == 'big'
+
+
+def _write_varint(out: bytearray, n: int) -> None:
+    """Append an unsigned LEB128 varint."""
+    while n > 0x7F:
+        out.append((n & 0x7F) | 0x80)
+        n >>= 7
+    out.append(n)
+
+
+def _read_varint(view: memoryview, offset: int) -> Tuple[int, int]:
+    """Read an unsigned LEB128 varint, returning (value, next offset)."""
+    byte = view[offset]
+    if byte < 0x80:
+        return byte, offset + 1
+    n, shift = byte & 0x7F, 7
+    while True:
+        offset += 1
+        byte = view[offset]
+        n |= (byte & 0x7F) << shift
+        if byte < 0x80:
+            return n, offset + 1
+        shift += 7
+
+
+def _write_block(out: bytearray, block: array) -> None:
+    """Append an array's items as little-endian bytes."""
+    if _BIG_ENDIAN_HOST:
+        block = array(block.typecode, block)
+        block.byteswap()
+    out += memoryview(block).cast('B')
+
+
+def _read_block(
+    view: memoryview, offset: int, typecode: str, count: int
+) -> Tuple[array, int]:
+    """Rebuild an array from a little-endian block, returning (array, next offset)."""
+    block = array(typecode)
+    end = offset + count * block.itemsize
+    if end > len(view):
+        raise ValueError("Truncated packed block")
+    block.frombytes(view[offset:end])
+    if _BIG_ENDIAN_HOST:
+        block.byteswap()
+    return block, end
+
+
+def _pack_homogeneous(out: bytearray, items: Union[list, array]) -> bool:
+    """
+    Write a list of all-int, all-float or all-str items as one packed block.
+    
+    Returns:
+        bool: False if the items are mixed or out of int64 range and need
+        per-element records.
+    """
+    if isinstance(items, array):
+        kinds = (
+            {float}
+            if items.typecode in 'fd'
+            else {int} if items.typecode not in 'uw' else set()
+        )
+    else:
+        kinds = set(map(type, items))
+    if len(kinds) != 1:
+        return False
+    kind = kinds.pop()
+    if kind is int:
+        try:
+            block = (
+                items
+                if isinstance(items, array) and items.typecode == 'q'
+                else array('q', items)
+            )
+        except OverflowError:
+            return False
+        out.append(TAG_INT64_ARRAY)
+    elif kind is float:
+        block = (
+            items
+            if isinstance(items, array) and items.typecode == 'd'
+            else array('d', items)
+        )
+        out.append(TAG_FLOAT64_ARRAY)
+    elif kind is str:
+        text = ''.join(items).encode('utf-8')
+        out.append(TAG_STRING_ARRAY)
+        _write_varint(out, len(items))
+        _write_block(out, array('I', accumulate(map(len, items), initial=0)))
+        _write_varint(out, len(text))
+        out += text
+        return True
+    else:
+        return False
+    _write_varint(out, len(block))
+    _write_block(out, block)
+    return True
+
+
+def encode_tlv(value: Any) -> bytes:
+    """
+    Encode a value as nested tag-length-value records.
+
+    Every record starts with a one-byte tag. Integers are zigzag varints with a
+    signed-bytes fallback at 2**63 and beyond, strings carry a varint byte length,
+    and containers a varint element count followed by their elements' records.
+    Lists (or arrays) of only ints, only floats or only strings are written as one
+    packed block instead. Nesting is walked with an explicit stack, not recursion.
+    """
+    out = bytearray()
+    stack = [iter((value,))]
+    while stack:
+        item = next(stack[-1], _END)
+        if item is _END:
+            stack.pop()
+            continue
+        kind = type(item)
+        if kind is int:
+            if -_VARINT_LIMIT <= item < _VARINT_LIMIT:
+                out.append(TAG_INTEGER)
+                _write_varint(out, (item << 1) if item >= 0 else ((-item << 1) - 1))
+            else:
+                payload = item.to_bytes(
+                    (item.bit_length() + 8) // 8, 'big', signed=True
+                )
+                out.append(TAG_BIGINT)
+                _write_varint(out, len(payload))
+                out += payload
+        elif kind is str:
+            payload = item.encode('utf-8')
+            out.append(TAG_STRING)
+            _write_varint(out, len(payload))
+            out += payload
+        elif kind is float:
+            out.append(TAG_FLOAT)
+            out += _FLOAT64.pack(item)
+        elif kind is bool:
+            out.append(TAG_TRUE if item else TAG_FALSE)
+        elif kind is list or kind is array:
+            if len(item) >= _PACK_MIN and _pack_homogeneous(out, item):
+                continue
+            if kind is array:
+                item = item.tolist()
+            out.append(TAG_LIST)
+            _write_varint(out, len(item))
+            stack.append(iter(item))
+        elif kind is dict:
+            out.append(TAG_DICTIONARY)
+            _write_varint(out, len(item))
+            stack.append(chain.from_iterable(item.items()))
+        else:
+            raise ValueError(f"Unsupported data type: {kind.__name__}")
+    return bytes(out)
+
+
+def decode_tlv(
+    data: Union[bytes, bytearray, memoryview], packed_arrays: bool = False
+) -> Any:
+    """
+    Decode records produced by encode_tlv in a single pass over one memoryview.
+
+    Containers are created when their header is read and filled in place as the walk
+    continues; nothing is sliced, copied or re-encoded to find element boundaries.
+    Packed numeric blocks are rebuilt with array.frombytes and returned as lists, or
+    as the arrays themselves when packed_arrays is set.
+    """
+    view = memoryview(data).cast('B')
+    size = len(view)
+    root: List[Any] = []
+    # Frames: [container, remaining records, pending dictionary key]
+    stack: List[List[Any]] = [[root, 1, _END]]
+    offset = 0
+    try:
+        while stack:
+            frame = stack[-1]
+            if not frame[1]:
+                stack.pop()
+                continue
+            frame[1] -= 1
+            tag = view[offset]
+            offset += 1
+            count = 0
+            if tag == TAG_INTEGER:
+                n, offset = _read_varint(view, offset)
+                value = (n >> 1) ^ -(n & 1)
+            elif tag == TAG_STRING:
+                length, offset = _read_varint(view, offset)
+                if offset + length > size:
+                    raise ValueError("Truncated string record")
+                value = str(view[offset:offset + length], 'utf-8')
+                offset += length
+            elif tag == TAG_FLOAT:
+                value, = _FLOAT64.unpack_from(view, offset)
+                offset += 8
+            elif tag == TAG_TRUE or tag == TAG_FALSE:
+                value = tag == TAG_TRUE
+            elif tag == TAG_LIST:
+                count, offset = _read_varint(view, offset)
+                value = []
+            elif tag == TAG_DICTIONARY:
+                count, offset = _read_varint(view, offset)
+                count *= 2
+                value = {}
+            elif tag == TAG_INT64_ARRAY or tag == TAG_FLOAT64_ARRAY:
+                length, offset = _read_varint(view, offset)
+                value, offset = _read_block(
+                    view, offset, 'q' if tag == TAG_INT64_ARRAY else 'd', length
+                )
+                if not packed_arrays:
+                    value = value.tolist()
+            elif tag == TAG_STRING_ARRAY:
+                length, offset = _read_varint(view, offset)
+                bounds, offset = _read_block(view, offset, 'I', length + 1)
+                text_length, offset = _read_varint(view, offset)
+                if offset + text_length > size:
+                    raise ValueError("Truncated string block")
+                text = str(view[offset:offset + text_length], 'utf-8')
+                offset += text_length
+                value = [text[start:end] for start, end in zip(bounds, bounds[1:])]
+            elif tag == TAG_BIGINT:
+                length, offset = _read_varint(view, offset)
+                if offset + length > size:
+                    raise ValueError("Truncated integer record")
+                value = int.from_bytes(view[offset:offset + length], 'big', signed=True)
+                offset += length
+            else:
+                raise ValueError(f"Unsupported type tag: 0x{tag:02x}")
+            container = frame[0]
+            if isinstance(container, dict):
+                if frame[2] is _END:
+                    frame[2] = value
+                else:
+                    container[frame[2]] = value
+                    frame[2] = _END
+            else:
+                container.append(value)
+            if count:
+                stack.append([value, count, _END])
+    except (IndexError, struct.error):
+        raise ValueError("Truncated TLV data") from None
+    if offset != size:
+        raise ValueError(f"{size - offset} trailing bytes after TLV record")
+    return root[0]
+
+
 @dataclass
 class AtomDataclass(Generic[T], Atom):
     """
@@ -125,16 +415,10 @@ class AtomDataclass(Generic[T], Atom):
         """
         Initialize the data type based on the type of the value.
         """
-        type_map = {
-            'str': 'string',
-            'int': 'integer',
-            'float': 'float',
-            'bool': 'boolean',
-            'list': 'list',
-            'dict': 'dictionary'
-        }
         data_type_name = type(self.value).__name__
-        object.__setattr__(self, 'data_type', type_map.get(data_type_name, 'unsupported'))
+        object.__setattr__(
+            self, 'data_type', TYPE_NAMES.get(data_type_name, 'unsupported')
+        )
         self.define_grammar()
 
     def encode(self) -> bytes:
@@ -142,90 +426,22 @@ class AtomDataclass(Generic[T], Atom):
         Encode the AtomDataclass instance into bytes.
         
         Returns:
-            bytes: Encoded bytes of the AtomDataclass.
-        """
-        data_type_bytes = self.data_type.encode('utf-8')
-        data_bytes = self._encode_data()
-        header = struct.pack('!I', len(data_type_bytes))
-        return header + data_type_bytes + data_bytes
-
-    def _encode_data(self) -> bytes:
-        """
-        Encode the value into bytes based on its data type.
-        
-        Returns:
-            bytes: Encoded value bytes.
+            bytes: Encoded TLV bytes of the AtomDataclass.
         """
-        if self.data_type == 'string':
-            return self.value.encode('utf-8')
-        elif self.data_type == 'integer':
-            return struct.pack('!q', self.value)
-        elif self.data_type == 'float':
-            return struct.pack('!d', self.value)
-        elif self.data_type == 'boolean':
-            return struct.pack('?', self.value)
-        elif self.data_type == 'list':
-            return b''.join([AtomDataclass(element).encode() for element in self.value])
-        elif self.data_type == 'dictionary':
-            return b''.join(
-                [AtomDataclass(key).encode() + AtomDataclass(value).encode() for key, value in self.value.items()]
-            )
-        else:
+        if self.data_type == 'unsupported':
             raise ValueError(f"Unsupported data type: {self.data_type}")
+        return encode_tlv(self.value)
 
     def decode(self, data: bytes) -> None:
         """
         Decode the provided bytes into the AtomDataclass instance.
         
         Args:
-            data (bytes): The bytes to decode.
+            data (bytes): The TLV bytes to decode.
         """
-        header_length = struct.unpack('!I', data[:4])[0]
-        data_type_bytes = data[4:4 + header_length]
-        data_type = data_type_bytes.decode('utf-8')
-        data_bytes = data[4 + header_length:]
-        
-        type_map_reverse = {
-            'string': 'str',
-            'integer': 'int',
-            'float': 'float',
-            'boolean': 'bool',
-            'list': 'list',
-            'dictionary': 'dict'
-        }
-
-        if data_type == 'string':
-            value = data_bytes.decode('utf-8')
-        elif data_type == 'integer':
-            value = struct.unpack('!q', data_bytes)[0]
-        elif data_type == 'float':
-            value = struct.unpack('!d', data_bytes)[0]
-        elif data_type == 'boolean':
-            value = struct.unpack('?', data_bytes)[0]
-        elif data_type == 'list':
-            value = []
-            offset = 0
-            while offset < len(data_bytes):
-                element = AtomDataclass(None)
-                element.decode(data_bytes[offset:])
-                value.append(element.value)
-                offset += len(element.encode())
-        elif data_type == 'dictionary':
-            value = {}
-            offset = 0
-            while offset < len(data_bytes):
-                key = AtomDataclass(None)
-                key.decode(data_bytes[offset:])
-                offset += len(key.encode())
-                val = AtomDataclass(None)
-                val.decode(data_bytes[offset:])
-                offset += len(val.encode())
-                value[key.value] = val.value
-        else:
-            raise ValueError(f"Unsupported data type: {data_type}")
-
-        self.value = value
-        object.__setattr__(self, 'data_type', type_map_reverse.get(data_type, 'unsupported'))
+        self.value = decode_tlv(data)
+        object.__setattr__(self, 'data_type', TYPE_NAMES[type(self.value).__name__])
+        self.define_grammar()
 
     def execute(self, *args, **kwargs) -> Any:
         """
@@ -265,7 +481,10 @@ class AtomDataclass(Generic[T], Atom):
         Define the context-free grammar for the AtomDataclass.
         """
         if self.data_type == 'string':
-            self.grammar_rules = [GrammarRule("STRING", ["\".*\""])]
+            # One line, no unescaped quote inside, so "a" "b" is two strings
+            self.grammar_rules = [
+                GrammarRule("STRING", [r'"[^"\\\n]*(?:\\.[^"\\\n]*)*"'])
+            ]
         elif self.data_type == 'integer':
             self.grammar_rules = [GrammarRule("INTEGER", ["-?[0-9]+"])]
         elif self.data_type == 'float':
@@ -275,4 +494,1076 @@ class AtomDataclass(Generic[T], Atom):
         elif self.data_type == 'list':
             self.grammar_rules = [GrammarRule("LIST", ["[", "ELEMENTS", "]"])]
         elif self.data_type == 'dictionary':
-            self.grammar_rules = [GrammarRule("
+            self.grammar_rules = [GrammarRule("DICTIONARY", ["{", "PAIRS", "}"])]
+        else:
+            self.grammar_rules = []
+
+class ParseError(ValueError):
+    """
+    Raised when input does not match a grammar.
+    
+    Attributes:
+        offset (int): Character offset in the source where parsing failed.
+    """
+    def __init__(self, message: str, offset: int):
+        super().__init__(f"{message} at offset {offset}")
+        self.offset = offset
+
+
+class ParseSource:
+    """
+    Source text shared by every node of a parse tree, with a log of edits.
+    
+    Nodes keep spans in the coordinates of the version they were last synced at and
+    shift themselves through the edit log only when read, so an edit never has to
+    visit the nodes it does not touch. An edit can also move the end of every
+    non-empty span that ended at one old offset, which is how the nodes enclosing a
+    reparsed region follow it.
+    
+    Attributes:
+        text (str): Current source text.
+        edits (List[Tuple[int, int, int, int, int]]): (start, end, delta,
+            moved end, new end) per version; new end is in new coordinates, the
+            rest in old ones.
+        leaves (List[ParseTreeAtom]): Token nodes in source order, for locating edits.
+        parser (Optional[GrammarParser]): Parser that built the tree, if any.
+        root (Optional[ParseTreeAtom]): Root node of the tree, if any.
+    """
+    def __init__(self, text: str):
+        self.text = text
+        self.edits: List[Tuple[int, int, int, int, int]] = []
+        self.leaves: List['ParseTreeAtom'] = []
+        self.parser: Optional['GrammarParser'] = None
+        self.root: Optional['ParseTreeAtom'] = None
+
+    @property
+    def version(self) -> int:
+        return len(self.edits)
+
+    def apply_edit(self, start: int, end: int, replacement: str) -> int:
+        """
+        Replace text[start:end] and log the edit.
+        
+        Returns:
+            int: The length delta of the edit.
+        """
+        if not 0 <= start <= end <= len(self.text):
+            raise ValueError(
+                f"Edit range ({start}, {end}) outside source of length {len(self.text)}"
+            )
+        delta = len(replacement) - (end - start)
+        self.text = self.text[:start] + replacement + self.text[end:]
+        self.edits.append((start, end, delta, -1, -1))
+        return delta
+
+    def move_ends(self, moved_end: int, new_end: int) -> None:
+        """
+        Make the last edit also move non-empty spans ending at moved_end (old
+        coordinates) to new_end.
+        """
+        start, end, delta, _, _ = self.edits[-1]
+        self.edits[-1] = (start, end, delta, moved_end, new_end)
+
+
+class ParseTreeAtom(Atom):
+    """
+    A node of a parse tree.
+    
+    Nodes never copy source text: each one references the tree's shared ParseSource
+    and a (start, end) span into it, and `text` slices on demand. Spans are brought
+    up to date lazily after edits, so trees can be reparsed incrementally with
+    edit() and untouched nodes survive by identity.
+    
+    Attributes:
+        source (str): The full source text the tree was parsed from.
+        symbol (str): Grammar symbol (nonterminal or token kind) of the node.
+        start (int): Start offset of the node's span.
+        end (int): End offset of the node's span.
+        children (List[ParseTreeAtom]): Child nodes in order.
+        parent (Optional[ParseTreeAtom]): Parent node, None for the root.
+    """
+    def __init__(
+        self,
+        source: Union[str, ParseSource],
+        symbol: str = 'ATOM',
+        start: int = 0,
+        end: Optional[int] = None,
+        children: Optional[List['ParseTreeAtom']] = None,
+        parent: Optional['ParseTreeAtom'] = None,
+    ):
+        self._source = (
+            source if isinstance(source, ParseSource) else ParseSource(source)
+        )
+        self._version = self._source.version
+        self._start = start
+        self._end = len(self._source.text) if end is None else end
+        self.symbol = symbol
+        self.children = children if children is not None else []
+        self.parent = parent
+
+    def _sync(self):
+        """Shift the span through edits logged since it was last read."""
+        edits = self._source.edits
+        if self._version == len(edits):
+            return
+        start, end = self._start, self._end
+        for edit_start, edit_end, delta, moved_end, new_end in edits[self._version:]:
+            if start >= edit_end:
+                start += delta
+                end += delta
+            elif end == moved_end and start < end:
+                end = new_end
+            elif end > edit_end:
+                end += delta
+        self._start, self._end, self._version = start, end, len(edits)
+
+    @property
+    def source(self) -> str:
+        return self._source.text
+
+    @property
+    def start(self) -> int:
+        self._sync()
+        return self._start
+
+    @start.setter
+    def start(self, value: int):
+        self._sync()
+        self._start = value
+
+    @property
+    def end(self) -> int:
+        self._sync()
+        return self._end
+
+    @end.setter
+    def end(self, value: int):
+        self._sync()
+        self._end = value
+
+    @property
+    def text(self) -> str:
+        """
+        The source text covered by this node.
+        """
+        self._sync()
+        return self._source.text[self._start:self._end]
+
+    def walk(self):
+        """
+        Iterate over the subtree in preorder without recursion.
+        """
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(reversed(node.children))
+
+    def edit(self, start: int, end: int, replacement: str) -> 'ParseTreeAtom':
+        """
+        Replace source[start:end] and incrementally reparse this node's tree.
+        
+        Returns:
+            ParseTreeAtom: The tree's root, the same object as before the edit.
+        """
+        parser = self._source.parser
+        if parser is None:
+            raise ValueError("Tree was not built by a GrammarParser")
+        return parser.reparse(self._source.root, start, end, replacement)
+
+    def encode(self) -> bytes:
+        """
+        Encode the tree as TLV: the source, then preorder symbols, spans and arity.
+        
+        Returns:
+            bytes: Encoded bytes of the tree.
+        """
+        symbols, spans, counts = [], [], []
+        for node in self.walk():
+            symbols.append(node.symbol)
+            spans.extend((node.start, node.end))
+            counts.append(len(node.children))
+        return encode_tlv(
+            {
+                'source': self.source,
+                'symbols': symbols,
+                'spans': spans,
+                'counts': counts,
+            }
+        )
+
+    def decode(self, data: bytes) -> None:
+        """
+        Decode bytes produced by encode() into this node.
+        
+        Args:
+            data (bytes): The bytes to decode.
+        """
+        fields = decode_tlv(data)
+        source = ParseSource(fields['source'])
+        symbols, spans, counts = fields['symbols'], fields['spans'], fields['counts']
+        nodes = [
+            ParseTreeAtom(source, symbol, spans[2 * i], spans[2 * i + 1])
+            for i, symbol in enumerate(symbols)
+        ]
+        nodes[0] = self
+        self._source, self._version, self.symbol = source, source.version, symbols[0]
+        self._start, self._end, self.children, self.parent = (
+            spans[0],
+            spans[1],
+            [],
+            None,
+        )
+        pending: List[List[Any]] = []  # [node, children still to attach]
+        for node, count in zip(nodes, counts):
+            if pending:
+                parent = pending[-1]
+                parent[0].children.append(node)
+                node.parent = parent[0]
+                parent[1] -= 1
+                if not parent[1]:
+                    pending.pop()
+            if count:
+                pending.append([node, count])
+
+    def execute(self, *args, **kwargs) -> Any:
+        """
+        Execute the node; returns the text it covers.
+        """
+        return self.text
+
+    def __repr__(self):
+        """
+        Provide a string representation of the ParseTreeAtom instance.
+        
+        Returns:
+            str: The string representation.
+        """
+        return (f"ParseTreeAtom(symbol={self.symbol!r}, "
+                f"span=({self.start}, {self.end}), children={len(self.children)})")
+
+    def to_dataclass(self) -> 'AtomDataclass':
+        """
+        Convert the node's text to an AtomDataclass.
+        
+        Returns:
+            AtomDataclass: Dataclass holding the covered text.
+        """
+        return AtomDataclass(self.text)
+
+    def parse_tree(self) -> 'ParseTreeAtom':
+        """
+        A parse tree is its own parse tree.
+        
+        Returns:
+            ParseTreeAtom: The instance itself.
+        """
+        return self
+
+    def define_grammar(self) -> None:
+        """
+        Parse trees take their grammar from the parser that built them.
+        """
+        self.grammar_rules = []
+
+
+Token = Tuple[str, int, int]  # (kind, start, end)
+Production = Tuple[str, Tuple[str, ...]]
+
+
+@lru_cache(maxsize=128)
+def _compile_master(
+    patterns: Tuple[Tuple[str, str], ...], skip: Optional[str]
+) -> 're.Pattern':
+    groups = [f"(?P<_{index}>{pattern})" for index, (_, pattern) in enumerate(patterns)]
+    if skip:
+        groups.append(f"(?P<_skip>{skip})")
+    # DOTALL only here, so a stray newline is reported; user patterns keep their meaning
+    groups.append("(?P<_error>(?s:.))")
+    return re.compile('|'.join(groups))
+
+
+class Lexer:
+    """
+    Tokenizer compiled from terminal GrammarRules into one master regex.
+    
+    A terminal rule's lhs is the token kind and its rhs items are alternative
+    patterns for it, e.g. GrammarRule("BOOLEAN", ["true", "false"]). Literal
+    terminals are escaped and use themselves as their kind; they are tried
+    first, longest first, so "++" wins over "+". As in PLY, patterns follow
+    longest-pattern-first, so FLOAT wins over INTEGER on "1.5", and a literal
+    that a pattern matches in full is a reserved word of that pattern: with
+    IDENT = [a-z]+, "if" lexes as the keyword "if" but "iffy" as one IDENT.
+    Each distinct rule set is compiled once.
+    
+    Attributes:
+        patterns (Tuple[Tuple[str, str], ...]): (kind, regex) pairs in match order.
+        reserved (Dict[str, Set[str]]): Pattern kind -> literals it matches in full.
+        skip (Optional[str]): Pattern for text dropped between tokens.
+    """
+    def __init__(self, rules: Iterable[GrammarRule] = (), literals: Iterable[str] = (),
+                 skip: Optional[str] = r'\s+'):
+        patterns = [
+            (rule.lhs, '|'.join(f"(?:{alternative})" for alternative in rule.rhs))
+            for rule in rules
+        ]
+        patterns.sort(key=lambda entry: len(entry[1]), reverse=True)
+        self.reserved: Dict[str, Set[str]] = {}
+        escaped = []
+        for literal in sorted(filter(None, dict.fromkeys(literals)), key=len,
+                              reverse=True):
+            kind = next((kind for kind, pattern in patterns
+                         if re.fullmatch(pattern, literal)), None)
+            if kind is None:
+                escaped.append((literal, re.escape(literal)))
+            else:
+                self.reserved.setdefault(kind, set()).add(literal)
+        self.patterns = tuple(escaped + patterns)
+        self.skip = skip
+        self.kinds: Dict[str, Optional[str]] = {
+            f"_{index}": kind for index, (kind, _) in enumerate(self.patterns)
+        }
+        self.kinds['_skip'] = None
+        self.master = _compile_master(self.patterns, skip)
+
+    def tokenize(
+        self, text: str, start: int = 0, end: Optional[int] = None
+    ) -> Iterator[Token]:
+        """
+        Lazily yield (kind, start, end) for each token; substrings are only
+        created to look up reserved words.
+        
+        Raises:
+            ParseError: On text no pattern matches.
+        """
+        kinds, reserved = self.kinds, self.reserved
+        for match in self.master.finditer(
+            text, start, len(text) if end is None else end
+        ):
+            group = match.lastgroup
+            if group == '_error':
+                raise ParseError(
+                    f"Unexpected character {match.group()!r}", match.start()
+                )
+            kind = kinds[group]
+            if kind is not None:
+                if kind in reserved and match.group() in reserved[kind]:
+                    kind = match.group()
+                yield kind, match.start(), match.end()
+
+    @staticmethod
+    def text(source: str, token: Token) -> str:
+        """
+        Materialize the text of one token.
+        """
+        return source[token[1]:token[2]]
+
+
+class GrammarParser:
+    """
+    Parse tables compiled from a set of GrammarRules.
+    
+    Each GrammarRule is one production; several rules with the same lhs are
+    alternatives, and an empty rhs is an epsilon production. Any rhs symbol that is
+    not some rule's lhs is a terminal, matched against token kinds. Terminal rules
+    (see Lexer) define pattern-based token kinds; every other terminal is a literal.
+    An LL(1) table is
+    built when the grammar allows it; otherwise parsing falls back to Earley, which
+    accepts any context-free grammar, including ambiguous ones.
+    
+    Attributes:
+        productions (List[Production]): (lhs, rhs) pairs in rule order.
+        start (str): Start symbol; the first rule's lhs unless given.
+        is_ll1 (bool): Whether the LL(1) table is conflict-free.
+        table (Dict[Tuple[str, str], int]): (nonterminal, lookahead) -> production.
+        fingerprint (str): Digest identifying the grammar, used as the cache key.
+    """
+    END = '$'
+    # Inner regions reparse() tries before the root, and ancestors it looks through for
+    # them
+    REPARSE_ATTEMPTS = 4
+    REPARSE_CLIMB = 64
+
+    def __init__(self, rules: List[GrammarRule], start: Optional[str] = None,
+                 terminal_rules: Optional[List[GrammarRule]] = None):
+        self.productions = self._flatten(rules)
+        if not self.productions:
+            raise ValueError("Grammar has no rules")
+        self.start = start or self.productions[0][0]
+        self.fingerprint = grammar_fingerprint(rules, self.start, terminal_rules)
+        self.nonterminals = {lhs for lhs, _ in self.productions}
+        if self.start not in self.nonterminals:
+            raise ValueError(f"Start symbol {self.start!r} has no rules")
+        self.terminals = {
+            symbol
+            for _, rhs in self.productions
+            for symbol in rhs
+            if symbol not in self.nonterminals
+        }
+        self.by_lhs: Dict[str, List[int]] = {}
+        for index, (lhs, _) in enumerate(self.productions):
+            self.by_lhs.setdefault(lhs, []).append(index)
+        self._compute_sets()
+        self._build_table()
+        terminal_rules = terminal_rules or []
+        token_kinds = {rule.lhs for rule in terminal_rules}
+        self.lexer = Lexer(terminal_rules, sorted(self.terminals - token_kinds))
+
+    @staticmethod
+    def _flatten(rules: List[GrammarRule]) -> List[Production]:
+        productions: List[Production] = []
+        seen = set()
+        stack = list(reversed(rules))
+        while stack:
+            rule = stack.pop()
+            if id(rule) in seen:
+                continue
+            seen.add(id(rule))
+            rhs = tuple(
+                element.lhs if isinstance(element, GrammarRule) else element
+                for element in rule.rhs
+            )
+            productions.append((rule.lhs, rhs))
+            stack.extend(reversed(
+                [element for element in rule.rhs if isinstance(element, GrammarRule)]
+            ))
+        return productions
+
+    def _compute_sets(self):
+        """Fixpoint computation of nullable nonterminals, FIRST and FOLLOW sets."""
+        self.nullable: Set[str] = set()
+        # Production that first made each nonterminal nullable; epsilon subtrees follow
+        # these
+        self.epsilon_production: Dict[str, int] = {}
+        self.first: Dict[str, Set[str]] = {
+            symbol: set() for symbol in self.nonterminals
+        }
+        self.follow: Dict[str, Set[str]] = {
+            symbol: set() for symbol in self.nonterminals
+        }
+        self.follow[self.start].add(self.END)
+        changed = True
+        while changed:
+            changed = False
+            for index, (lhs, rhs) in enumerate(self.productions):
+                if lhs not in self.nullable and all(
+                    symbol in self.nullable for symbol in rhs
+                ):
+                    self.nullable.add(lhs)
+                    self.epsilon_production[lhs] = index
+                    changed = True
+                first = self.first_of(rhs)
+                if not first <= self.first[lhs]:
+                    self.first[lhs] |= first
+                    changed = True
+        changed = True
+        while changed:
+            changed = False
+            for lhs, rhs in self.productions:
+                for position, symbol in enumerate(rhs):
+                    if symbol not in self.nonterminals:
+                        continue
+                    rest = rhs[position + 1:]
+                    follow = set(self.first_of(rest))
+                    if self.sequence_nullable(rest):
+                        follow |= self.follow[lhs]
+                    if not follow <= self.follow[symbol]:
+                        self.follow[symbol] |= follow
+                        changed = True
+
+    def first_of(self, symbols: Tuple[str, ...]) -> Set[str]:
+        """FIRST set of a symbol sequence (terminals only; nullability is separate)."""
+        result: Set[str] = set()
+        for symbol in symbols:
+            if symbol not in self.nonterminals:
+                result.add(symbol)
+                break
+            result |= self.first[symbol]
+            if symbol not in self.nullable:
+                break
+        return result
+
+    def sequence_nullable(self, symbols: Tuple[str, ...]) -> bool:
+        return all(symbol in self.nullable for symbol in symbols)
+
+    def _build_table(self):
+        self.table: Dict[Tuple[str, str], int] = {}
+        self.conflicts: List[Tuple[str, str]] = []
+        for index, (lhs, rhs) in enumerate(self.productions):
+            lookaheads = self.first_of(rhs)
+            if self.sequence_nullable(rhs):
+                lookaheads = lookaheads | self.follow[lhs]
+            for lookahead in lookaheads:
+                key = (lhs, lookahead)
+                if key in self.table and self.table[key] != index:
+                    self.conflicts.append(key)
+                else:
+                    self.table[key] = index
+        self.is_ll1 = not self.conflicts
+
+    def tokenize(self, text: str) -> List[Token]:
+        """
+        Split text into tokens with the grammar's compiled Lexer.
+        """
+        return list(self.lexer.tokenize(text))
+
+    def parse(self, text: str) -> ParseTreeAtom:
+        """
+        Tokenize and parse text into a ParseTreeAtom rooted at the start symbol.
+        """
+        return self.parse_tokens(text, self.tokenize(text))
+
+    def parse_tokens(
+        self, source: str, tokens: List[Token], start: Optional[str] = None
+    ) -> ParseTreeAtom:
+        """
+        Parse an already tokenized source, with LL(1) if possible, else Earley.
+        """
+        document = ParseSource(source)
+        root = self._parse(document, tokens, start or self.start, len(source), self.END)
+        document.parser, document.root = self, root
+        document.leaves = [
+            node for node in root.walk() if node.symbol not in self.nonterminals
+        ]
+        return root
+
+    def _parse(
+        self,
+        document: ParseSource,
+        tokens: Iterable[Token],
+        start: str,
+        end_offset: int,
+        follow: str,
+        reuse: Optional[Callable] = None,
+        consumed: Optional[list] = None,
+    ) -> ParseTreeAtom:
+        if self.is_ll1:
+            return self._parse_ll1(
+                document, tokens, start, end_offset, follow, reuse, consumed
+            )
+        root = self._parse_earley(document, list(tokens), start, end_offset)
+        if consumed is not None:
+            consumed.extend(
+                (False, node)
+                for node in root.walk()
+                if node.symbol not in self.nonterminals
+            )
+        return root
+
+    def reparse(
+        self, root: ParseTreeAtom, start: int, end: int, replacement: str
+    ) -> ParseTreeAtom:
+        """
+        Apply an edit to a tree built by this parser and reparse only what it affects.
+        
+        Candidate regions are the nonterminals around the edit, innermost first, whose
+        span, up to the next token, touches the edit and whose first token ends before
+        it. Each is re-lexed and
+        reparsed as its own symbol, with the token after it as lookahead, and kept only
+        if the tokens at both of its ends still lex the same; after REPARSE_ATTEMPTS
+        failures the root is reparsed instead. Since the tokens before a region are
+        unchanged, an LL(1) grammar makes the same choices there as before, so the
+        result matches a full parse. With an LL(1) grammar, once the parse is past the
+        edit, any old subtree of the expected symbol starting at the current token is
+        grafted in whole and lexing resumes after it.
+        
+        Appending to a right-recursive list thus reparses only its last element or two.
+        The root and every node outside the reparsed tokens keep their identity, and
+        their spans shift lazily; enclosing nodes that ended with the region are moved
+        to its new end through the edit log, so they are not visited either.
+        
+        The Earley fallback is not incremental within a region: it re-reads every token
+        of the region and reuses no subtrees. Left-recursive lists nest to the left, so
+        the region around an edit spans everything before it, and an edit costs time
+        proportional to its offset. With an ambiguous grammar the result is a valid
+        derivation of the edited source, but not necessarily the one a full parse would
+        pick.
+        
+        If the edited source no longer parses, ParseError is raised and the tree
+        should be discarded.
+        
+        Returns:
+            ParseTreeAtom: The same root object, now describing the edited source.
+        """
+        document = root._source
+        if document.root is not root or document.parser is not self:
+            raise ValueError("reparse() needs the root of a tree built by this parser")
+        leaves = document.leaves
+        key = lambda leaf: leaf.start
+        index = bisect_left(leaves, start, key=key)
+        # (node, end, region end, first leaf, low, high) in pre-edit coordinates,
+        # innermost first
+        candidates = []
+        node = leaves[index - 1].parent if index else None
+        for _ in range(self.REPARSE_CLIMB):
+            if node is None or node is root or len(candidates) == self.REPARSE_ATTEMPTS:
+                break
+            node_start, node_end = node.start, node.end
+            low = bisect_left(leaves, node_start, key=key)
+            high = bisect_left(leaves, node_end, low, key=key)
+            # Whitespace up to the next token belongs to the region too
+            region_end = (
+                leaves[high].start if high < len(leaves) else len(document.text)
+            )
+            if end <= region_end and leaves[low].end <= start:
+                candidates.append((node, node_end, region_end, leaves[low], low, high))
+            node = node.parent
+        # Leaves from here on start after the edit, so they stay sorted once it is
+        # applied
+        after = bisect_left(leaves, end, key=key)
+        delta = document.apply_edit(start, end, replacement)
+        threshold = end + delta
+        attempts = [(node, node_end, region_end + delta, first_leaf, low, high)
+                    for node, node_end, region_end, first_leaf, low, high in candidates]
+        attempts.append(
+            (root, len(document.text), len(document.text), None, 0, len(leaves))
+        )
+
+        for region, region_old_end, region_end, first_leaf, low, high in attempts:
+            region_start = first_leaf.start if first_leaf is not None else 0
+            # A first token that ends right at the edit may have grown into it
+            if (
+                first_leaf is not None
+                and first_leaf.end == start
+                and not self._lexes_as(document.text, first_leaf.start, [first_leaf])
+            ):
+                continue
+            first = max(after, low)
+            # Reused nodes and their old parents, to undo a failed attempt
+            grafted: List[Tuple[ParseTreeAtom, Optional[ParseTreeAtom]]] = []
+
+            def reuse(symbol: str, offset: int):
+                if offset < threshold:
+                    return None
+                position = bisect_left(leaves, offset, first, high, key=key)
+                if position == high or leaves[position].start != offset:
+                    return None
+                # Climb only while that leaf stays the leftmost token, so candidates lie
+                # past the edit
+                child = leaves[position]
+                candidate = child.parent
+                while candidate is not None and candidate is not region:
+                    for sibling in candidate.children:
+                        if sibling is child:
+                            break
+                        if sibling.end != sibling.start:
+                            return None
+                    if candidate.symbol == symbol:
+                        if candidate.end > region_end:
+                            return None
+                        grafted.append((candidate, candidate.parent))
+                        return candidate, self.lexer.tokenize(
+                            document.text, candidate.end, region_end
+                        )
+                    child, candidate = candidate, candidate.parent
+                return None
+
+            follow_leaf = leaves[high] if high < len(leaves) else None
+            if follow_leaf is not None:
+                follow, follow_offset = follow_leaf.symbol, follow_leaf.start
+            else:
+                follow, follow_offset = self.END, len(document.text)
+            consumed: List[Tuple[bool, ParseTreeAtom]] = []
+            try:
+                tokens = self.lexer.tokenize(document.text, region_start, region_end)
+                subtree = self._parse(
+                    document,
+                    tokens,
+                    region.symbol,
+                    follow_offset,
+                    follow,
+                    reuse,
+                    consumed,
+                )
+                # The region was lexed on its own; its last fresh token must not run
+                # into the next one
+                if (
+                    region is root
+                    or consumed[-1][0]
+                    or self._lexes_as(
+                        document.text,
+                        consumed[-1][1].start,
+                        [consumed[-1][1], follow_leaf],
+                    )
+                ):
+                    break
+            except ParseError:
+                if region is root:
+                    raise
+            for node, parent in grafted:
+                node.parent = parent
+
+        region.children = subtree.children
+        for child in region.children:
+            child.parent = region
+        region._start, region._end, region._version = (
+            subtree._start,
+            subtree._end,
+            subtree._version,
+        )
+        if region is not root:
+            document.move_ends(region_old_end, region._end)
+        # Swap the region's old leaves for the new ones, keeping the runs under reused
+        # subtrees
+        cursor, pending = high, []
+        for reused, item in reversed(consumed):
+            if not reused:
+                pending.append(item)
+                continue
+            run_start = bisect_left(leaves, item.start, first, cursor, key=key)
+            run_end = bisect_left(leaves, item.end, run_start, cursor, key=key)
+            pending.reverse()
+            leaves[run_end:cursor] = pending
+            cursor, pending = run_start, []
+        pending.reverse()
+        leaves[low:cursor] = pending
+        return root
+
+    def _lexes_as(
+        self, text: str, offset: int, expected: List[Optional[ParseTreeAtom]]
+    ) -> bool:
+        """Whether lexing text from offset yields the expected leaves' tokens.
+        A None leaf stands for the end of the text."""
+        tokens = self.lexer.tokenize(text, offset)
+        try:
+            for leaf in expected:
+                token = next(tokens, None)
+                if token != (
+                    None if leaf is None else (leaf.symbol, leaf.start, leaf.end)
+                ):
+                    return False
+        except ParseError:
+            return False
+        return True
+
+    def _parse_ll1(
+        self,
+        document: ParseSource,
+        tokens: Iterable[Token],
+        start: str,
+        end_offset: int,
+        follow: str,
+        reuse: Optional[Callable] = None,
+        consumed: Optional[list] = None,
+    ) -> ParseTreeAtom:
+        """
+        Table-driven predictive parse; one table lookup or match per stack step.
+        
+        reuse(symbol, offset) may return an existing node for a nonterminal about to be
+        expanded, plus a token iterator resuming after it; consumed collects
+        (reused, node) for fresh leaves and grafted nodes in source order.
+        """
+        tokens = iter(tokens)
+        lookahead = next(tokens, None)
+        root = ParseTreeAtom(
+            document, start, lookahead[1] if lookahead else end_offset, end_offset
+        )
+        # Entries: (symbol, parent) to expand, or (None, node, consumed-at-open) to
+        # close a node
+        stack: List[Tuple[Any, ...]] = [(None, root, 0), (start, None)]
+        table, nonterminals, productions = (
+            self.table,
+            self.nonterminals,
+            self.productions,
+        )
+        position, last_end = 0, root._start
+        while stack:
+            entry = stack.pop()
+            symbol = entry[0]
+            if symbol is None:
+                node, opened = entry[1], entry[2]
+                node._end = last_end if position > opened else node._start
+                continue
+            kind, token_start, token_end = (
+                lookahead if lookahead else (follow, end_offset, end_offset)
+            )
+            if symbol in nonterminals:
+                parent = entry[1]
+                if reuse is not None and parent is not None and lookahead:
+                    reused = reuse(symbol, token_start)
+                    if reused is not None:
+                        node, tokens = reused
+                        node.parent = parent
+                        parent.children.append(node)
+                        consumed.append((True, node))
+                        position += 1
+                        last_end = node.end
+                        lookahead = next(tokens, None)
+                        continue
+                index = table.get((symbol, kind))
+                if index is None:
+                    raise ParseError(
+                        f"Unexpected {kind!r} while parsing {symbol}", token_start
+                    )
+                if parent is None:
+                    node = root
+                else:
+                    node = ParseTreeAtom(
+                        document, symbol, token_start, token_start, parent=parent
+                    )
+                    parent.children.append(node)
+                    stack.append((None, node, position))
+                stack.extend((child, node) for child in reversed(productions[index][1]))
+            elif symbol == kind and lookahead:
+                leaf = ParseTreeAtom(
+                    document, kind, token_start, token_end, parent=entry[1]
+                )
+                entry[1].children.append(leaf)
+                if consumed is not None:
+                    consumed.append((False, leaf))
+                position += 1
+                last_end = token_end
+                lookahead = next(tokens, None)
+            else:
+                raise ParseError(f"Expected {symbol!r}, found {kind!r}", token_start)
+        if lookahead:
+            raise ParseError(f"Unexpected trailing {lookahead[0]!r}", lookahead[1])
+        return root
+
+    def _parse_earley(self, document: ParseSource, tokens: List[Token], start: str,
+                      end_offset: int) -> ParseTreeAtom:
+        """Earley recognition, then extraction of one derivation from the chart."""
+        productions, nonterminals, nullable = (
+            self.productions,
+            self.nonterminals,
+            self.nullable,
+        )
+        count = len(tokens)
+        chart: List[Set[Tuple[int, int, int]]] = [set() for _ in range(count + 1)]
+        completed: List[List[Tuple[int, int]]] = [[] for _ in range(count + 1)]
+        waiting: List[Dict[str, List[Tuple[int, int, int]]]] = [
+            {} for _ in range(count + 1)
+        ]
+        for index in self.by_lhs[start]:
+            chart[0].add((index, 0, 0))
+        for position in range(count + 1):
+            agenda = list(chart[position])
+            while agenda:
+                item = agenda.pop()
+                index, dot, origin = item
+                lhs, rhs = productions[index]
+                if dot == len(rhs):
+                    completed[position].append((index, origin))
+                    for parent, parent_dot, parent_origin in waiting[origin].get(
+                        lhs, ()
+                    ):
+                        advanced = (parent, parent_dot + 1, parent_origin)
+                        if advanced not in chart[position]:
+                            chart[position].add(advanced)
+                            agenda.append(advanced)
+                    continue
+                symbol = rhs[dot]
+                if symbol in nonterminals:
+                    waiting[position].setdefault(symbol, []).append(item)
+                    new = [(child, 0, position) for child in self.by_lhs[symbol]]
+                    if symbol in nullable:
+                        new.append((index, dot + 1, origin))
+                    for candidate in new:
+                        if candidate not in chart[position]:
+                            chart[position].add(candidate)
+                            agenda.append(candidate)
+                elif position < count and tokens[position][0] == symbol:
+                    chart[position + 1].add((index, dot + 1, origin))
+            if position < count and not chart[position + 1]:
+                raise ParseError(
+                    f"Unexpected {tokens[position][0]!r}", tokens[position][1]
+                )
+        accepted = [index for index, origin in completed[count]
+                    if origin == 0 and productions[index][0] == start]
+        if not accepted:
+            offset = tokens[-1][2] if tokens else end_offset
+            raise ParseError(f"Incomplete input for {start}", offset)
+        return self._build_earley_tree(
+            document, tokens, chart, completed, accepted[0], end_offset
+        )
+
+    def _build_earley_tree(
+        self, document, tokens, chart, completed, root_index, end_offset
+    ) -> ParseTreeAtom:
+        productions, nonterminals = self.productions, self.nonterminals
+        count = len(tokens)
+
+        def offset_at(position: int) -> int:
+            return tokens[position][1] if position < count else end_offset
+
+        root = ParseTreeAtom(document, productions[root_index][0], offset_at(0),
+                             tokens[-1][2] if tokens else end_offset)
+        used = set()
+        tasks = [(root, root_index, 0, count)]
+        while tasks:
+            node, index, origin, end = tasks.pop()
+            rhs = productions[index][1]
+            children: List[ParseTreeAtom] = []
+            position = end
+            for dot in range(len(rhs) - 1, -1, -1):
+                symbol = rhs[dot]
+                if symbol not in nonterminals:
+                    kind, token_start, token_end = tokens[position - 1]
+                    children.append(
+                        ParseTreeAtom(
+                            document, kind, token_start, token_end, parent=node
+                        )
+                    )
+                    position -= 1
+                    continue
+                for child_index, child_origin in completed[position]:
+                    if (
+                        productions[child_index][0] == symbol
+                        and child_origin >= origin
+                        and (index, dot, origin) in chart[child_origin]
+                        and (
+                            child_origin == position
+                            or (child_index, child_origin, position) not in used
+                        )
+                    ):
+                        break
+                else:
+                    raise ParseError(
+                        f"No cycle-free derivation for {symbol}", offset_at(position)
+                    )
+                if child_origin == position:
+                    children.append(
+                        self._epsilon_tree(document, symbol, offset_at(position), node)
+                    )
+                else:
+                    used.add((child_index, child_origin, position))
+                    child = ParseTreeAtom(
+                        document,
+                        symbol,
+                        offset_at(child_origin),
+                        tokens[position - 1][2],
+                        parent=node,
+                    )
+                    children.append(child)
+                    tasks.append((child, child_index, child_origin, position))
+                position = child_origin
+            children.reverse()
+            node.children = children
+        return root
+
+    def _epsilon_tree(self, document: ParseSource, symbol: str, offset: int,
+                      parent: ParseTreeAtom) -> ParseTreeAtom:
+        """Empty-span subtree for a nullable symbol, via its epsilon productions."""
+        root = ParseTreeAtom(document, symbol, offset, offset, parent=parent)
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            for child_symbol in self.productions[self.epsilon_production[node.symbol]][
+                1
+            ]:
+                child = ParseTreeAtom(
+                    document, child_symbol, offset, offset, parent=node
+                )
+                node.children.append(child)
+                stack.append(child)
+        return root
+
+
+def grammar_fingerprint(rules: List[GrammarRule], start: Optional[str] = None,
+                        terminal_rules: Optional[List[GrammarRule]] = None) -> str:
+    """
+    Digest of a rule set, start symbol and terminal rules; equal grammars share
+    compiled tables.
+    
+    Returns:
+        str: Hex digest.
+    """
+    productions = GrammarParser._flatten(rules)
+    start = start or (productions[0][0] if productions else '')
+    hasher = hashlib.sha256(start.encode('utf-8'))
+    for lhs, rhs in productions:
+        hasher.update(b'\x00' + lhs.encode('utf-8'))
+        for symbol in rhs:
+            hasher.update(b'\x01' + symbol.encode('utf-8'))
+    for rule in terminal_rules or ():
+        hasher.update(b'\x02' + rule.lhs.encode('utf-8'))
+        for pattern in rule.rhs:
+            hasher.update(b'\x03' + str(pattern).encode('utf-8'))
+    return hasher.hexdigest()
+
+
+PARSER_CACHE_SIZE = 64
+# fingerprint -> parser, least recently used first
+_PARSER_CACHE: 'OrderedDict[str, GrammarParser]' = OrderedDict()
+
+
+def compile_grammar(
+    rules: List[GrammarRule],
+    start: Optional[str] = None,
+    terminal_rules: Optional[List[GrammarRule]] = None,
+) -> GrammarParser:
+    """
+    Compile rules into a GrammarParser, reusing tables built for the same grammar.
+    The PARSER_CACHE_SIZE most recently used grammars are kept.
+    
+    Returns:
+        GrammarParser: The compiled parser.
+    """
+    fingerprint = grammar_fingerprint(rules, start, terminal_rules)
+    parser = _PARSER_CACHE.get(fingerprint)
+    if parser is not None:
+        _PARSER_CACHE.move_to_end(fingerprint)
+        return parser
+    parser = _PARSER_CACHE[fingerprint] = GrammarParser(rules, start, terminal_rules)
+    while len(_PARSER_CACHE) > PARSER_CACHE_SIZE:
+        _PARSER_CACHE.popitem(last=False)
+    return parser
+
+
+def atom_terminal_rules() -> List[GrammarRule]:
+    """
+    The terminal rules AtomDataclass.define_grammar declares for scalar values.
+    
+    Returns:
+        List[GrammarRule]: STRING, INTEGER, FLOAT and BOOLEAN rules.
+    """
+    return [
+        rule
+        for value in ("", 0, 0.0, False)
+        for rule in AtomDataclass(value).grammar_rules
+    ]
+
+
+def atom_lexer() -> Lexer:
+    """
+    Lexer for the scalar AtomDataclass terminals.
+    
+    Returns:
+        Lexer: The compiled lexer.
+    """
+    return Lexer(atom_terminal_rules())
+
+
+def benchmark_codec(size: int = 1 << 20, rounds: int = 3) -> Dict[str, float]:
+    """
+    Time encode/decode of roughly `size` bytes worth of mixed lists.
+    
+    Returns:
+        Dict[str, float]: Payload size and best encode and decode times in seconds.
+    
+    Raises:
+        ValueError: If a round does not decode back to the encoded value.
+    """
+    count = size // 64
+    value = [[i, i * 0.5, f"item-{i}", i % 2 == 0] for i in range(count)]
+    atom = AtomDataclass(value)
+    encode_times, decode_times = [], []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        data = atom.encode()
+        encode_times.append(time.perf_counter() - start)
+        start = time.perf_counter()
+        decoded = AtomDataclass(None)
+        decoded.decode(data)
+        decode_times.append(time.perf_counter() - start)
+        if decoded.value != value:
+            raise ValueError("Codec round trip does not reproduce the value")
+    return {
+        'bytes': len(data),
+        'encode': min(encode_times),
+        'decode': min(decode_times),
+    }
+
+
+if __name__ == "__main__":
+    print(benchmark_codec())
@@ -0,0 +1,179 @@
+from bisect import bisect_right
+from collections import OrderedDict
+import threading
+from typing import Callable, Dict, List, Optional, Tuple, Union
+
+Buffer = Union[bytes, bytearray, memoryview]
+
+
+def coalesce(ranges: List[Tuple[int, int]]) -> List[Tuple[int, int]]:
+    """Merge (start, length) ranges into sorted, non-overlapping contiguous runs"""
+    runs: List[Tuple[int, int]] = []
+    for start, length in sorted(r for r in ranges if r[1] > 0):
+        if runs and start <= runs[-1][0] + runs[-1][1]:
+            run_start, run_length = runs[-1]
+            runs[-1] = (run_start, max(run_length, start + length - run_start))
+        else:
+            runs.append((start, length))
+    return runs
+
+
+def gather(ranges: List[Tuple[int, int]], runs: List[Tuple[int, int]],
+           data: List[memoryview], unit: int = 1) -> List[memoryview]:
+    """Slice each (start, length) range out of the data read for coalesce(ranges).
+    Addresses and lengths count units of `unit` bytes."""
+    starts = [start for start, _ in runs]
+    views = []
+    for start, length in ranges:
+        if length <= 0:
+            views.append(memoryview(b''))
+            continue
+        run = bisect_right(starts, start) - 1
+        offset = (start - starts[run]) * unit
+        views.append(data[run][offset:offset + length * unit])
+    return views
+
+
+def scatter(
+    writes: List[Tuple[int, Buffer]], unit: int = 1
+) -> List[Tuple[int, bytearray]]:
+    """Merge (start, buffer) writes into one buffer per contiguous run.
+    Where writes overlap, the later one wins."""
+    runs = coalesce([(start, len(buffer) // unit) for start, buffer in writes])
+    starts = [start for start, _ in runs]
+    buffers = [bytearray(length * unit) for _, length in runs]
+    for start, buffer in writes:
+        if len(buffer):
+            run = bisect_right(starts, start) - 1
+            offset = (start - starts[run]) * unit
+            buffers[run][offset:offset + len(buffer)] = buffer
+    return list(zip(starts, buffers))
+
+
+class PageCache:
+    """
+    Fixed-capacity write-back cache over a byte-addressed store, in PAGE_SIZE pages
+    with LRU eviction. Writes only mark the touched span of a page dirty; dirty spans
+    go back to the store in one batch on flush(), when the flush timer fires, or
+    for a single page when it is evicted.
+    """
+    PAGE_SIZE = 4096
+
+    def __init__(self, load: Callable[[int, int], bytes],
+                 store: Callable[[List[Tuple[int, bytes]]], None],
+                 capacity: int = 16, page_size: int = PAGE_SIZE,
+                 flush_interval: Optional[float] = 1.0):
+        """
+        load(address, length) fetches a page from the backing store, and
+        store([(address, data), ...]) writes a batch of dirty spans back.
+        """
+        if capacity < 1:
+            raise ValueError("Capacity must be at least one page")
+        self.load = load
+        self.store = store
+        self.capacity = capacity
+        self.page_size = page_size
+        self.flush_interval = flush_interval
+        self._pages: 'OrderedDict[int, bytearray]' = OrderedDict()
+        # page -> dirty [low, high) offsets
+        self._dirty: Dict[int, Tuple[int, int]] = {}
+        self._lock = threading.RLock()
+        self._timer: Optional[threading.Timer] = None
+        self.hits = self.misses = self.evictions = self.flushes = 0
+
+    def _page(self, number: int) -> bytearray:
+        page = self._pages.get(number)
+        if page is not None:
+            self.hits += 1
+            self._pages.move_to_end(number)
+            return page
+        self.misses += 1
+        page = bytearray(self.load(number * self.page_size, self.page_size))
+        self._pages[number] = page
+        # A loop, so pages whose write-back failed before are retried
+        while len(self._pages) > self.capacity:
+            self._evict()
+        return page
+
+    def _evict(self):
+        number, page = next(iter(self._pages.items()))
+        span = self._dirty.get(number)
+        if span is not None:
+            low, high = span
+            # If this raises, the page stays cached and dirty
+            self.store([(number * self.page_size + low, bytes(page[low:high]))])
+            del self._dirty[number]
+        del self._pages[number]
+        self.evictions += 1
+
+    def _schedule_flush(self):
+        if self.flush_interval is not None and self._timer is None:
+            self._timer = threading.Timer(self.flush_interval, self._timed_flush)
+            self._timer.daemon = True
+            self._timer.start()
+
+    def _timed_flush(self):
+        with self._lock:
+            self._timer = None
+            self.flush()
+
+    def resident(self, address: int, length: int) -> bool:
+        """Whether every page under [address, address + length) is cached"""
+        first = address // self.page_size
+        last = (address + max(length, 1) - 1) // self.page_size
+        return all(number in self._pages for number in range(first, last + 1))
+
+    def read(self, address: int, length: int) -> bytes:
+        with self._lock:
+            out = bytearray()
+            end = address + length
+            while address < end:
+                number, offset = divmod(address, self.page_size)
+                chunk = min(end - address, self.page_size - offset)
+                out += self._page(number)[offset:offset + chunk]
+                address += chunk
+            return bytes(out)
+
+    def write(self, address: int, data: bytes):
+        with self._lock:
+            position, end = 0, len(data)
+            while position < end:
+                number, offset = divmod(address + position, self.page_size)
+                chunk = min(end - position, self.page_size - offset)
+                page = self._page(number)
+                page[offset:offset + chunk] = data[position:position + chunk]
+                low, high = self._dirty.get(number, (offset, offset + chunk))
+                self._dirty[number] = (min(low, offset), max(high, offset + chunk))
+                position += chunk
+            if self._dirty:
+                self._schedule_flush()
+
+    def flush(self):
+        """Write every dirty span back to the store in one batch"""
+        with self._lock:
+            if self._timer is not None:
+                self._timer.cancel()
+                self._timer = None
+            if not self._dirty:
+                return
+            batch = [
+                (number * self.page_size + low, bytes(self._pages[number][low:high]))
+                for number, (low, high) in sorted(self._dirty.items())
+            ]
+            # Spans stay dirty until the store has them, so a failed flush
+            # can be retried
+            self.store(batch)
+            self._dirty.clear()
+            self.flushes += 1
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'flushes': self.flushes,
+            'resident_pages': len(self._pages),
+            'dirty_pages': len(self._dirty),
+        }
@@ -1,9 +1,15 @@
 from pathlib import Path
 import os
 import struct
-from typing import Dict, Optional, Union
+import weakref
+from typing import Dict, List, Optional, Set, Tuple, Union
 from dataclasses import dataclass
 
+try:
+    from src.mem.pages import PageCache, coalesce, gather, scatter
+except ImportError:  # run as a script from src/mem/
+    from pages import PageCache, coalesce, gather, scatter
+
 WORD_SIZE = 2  # 16-bit word (4 hex digits)
 BASE_DIR = "/app/vmem"
 
@@ -12,32 +18,7 @@ class MemoryCell:
     """Represents a single addressable memory location"""
     value: bytes = b'\x00' * WORD_SIZE
     
-class VirtualMemoryFS:
-    def __init__(self):
-        """Initialize the virtual memory filesystem structure using word-addressed layout"""
-        self.base_path = Path(BASE_DIR)
-        self.word_max = 0xFFFF  # Maximum address for 16-bit word
-        self.dir_bits = 8  # Use first byte for directory
-        self.file_bits = 8  # Use second byte for file
-        self.memory_map: Dict[int, MemoryCell] = {}
-        
-        # Create base directory if it doesn't exist
-        self.base_path.mkdir(parents=True, exist_ok=True)
-        
-        # Initialize directory structure
-        self._init_directory_structure()
-        
-    def _init_directory_structure(self):
-        """Create the directory structure based on word addressing"""
-        # Create directories for each possible high byte (00-FF)
-        for high_byte in range(0x100):
-            dir_path = self.base_path / f"{high_byte:02x}"
-            dir_path.mkdir(exist_ok=True)
-            
-            # Add __init__.py to make it a package
-            init_file = dir_path / "__init__.py"
-            if not init_file.exists():
-                init_content = f"""\
+SEGMENT_SOURCE = """\
 from dataclasses import dataclass
 import array
 
@@ -48,15 +29,37 @@ class MemorySegment:
 # Initialize memory segment with 256 bytes (low byte addressing)
 segment = MemorySegment(array.array('B', [0] * 256))
 """
-                init_file.write_text(init_content)
-            
-            # Create files for each possible low byte (00-FF)
-            for low_byte in range(0x100):
-                file_path = dir_path / f"{low_byte:02x}.mem"
-                if not file_path.exists():
-                    file_path.touch()
 
-    def _address_to_path(self, address: int) -> Path:
+class WordFiles:
+    """One file per word, <base>/<high byte>/<low byte>.mem, byte-addressed"""
+    def __init__(self, base_path: Path, word_max: int = 0xFFFF, file_bits: int = 8):
+        self.base_path = base_path
+        self.word_max = word_max
+        self.file_bits = file_bits
+        # Directories are created on first write; until then their words read as zeros
+        self.directories = self._scan_directories()
+
+    def _scan_directories(self) -> Set[int]:
+        """High bytes whose directories already exist, from a single listing"""
+        try:
+            names = os.listdir(self.base_path)
+        except FileNotFoundError:
+            return set()
+        return {int(name, 16) for name in names
+                if len(name) == 2 and all(c in '0123456789abcdef' for c in name)}
+
+    def ensure_directory(self, high_byte: int):
+        """Create a directory and its __init__.py package module on first write"""
+        if high_byte in self.directories:
+            return
+        dir_path = self.base_path / f"{high_byte:02x}"
+        dir_path.mkdir(parents=True, exist_ok=True)
+        init_file = dir_path / "__init__.py"
+        if not init_file.exists():
+            init_file.write_text(SEGMENT_SOURCE)
+        self.directories.add(high_byte)
+
+    def path(self, address: int) -> Path:
         """Convert a 16-bit address to directory/file path"""
         if not 0 <= address <= self.word_max:
             raise ValueError(f"Address {address:04x} out of range")
@@ -66,42 +69,124 @@ segment = MemorySegment(array.array('B', [0] * 256))
         
         return self.base_path / f"{high_byte:02x}" / f"{low_byte:02x}.mem"
 
-    def read(self, address: int) -> bytes:
-        """Read a word from the specified address"""
-        if address not in self.memory_map:
-            # Load from file if not in memory
-            path = self._address_to_path(address)
+    def load(self, offset: int, length: int) -> bytes:
+        """PageCache loader: read the word files covering a byte range"""
+        out = bytearray(length)
+        first = offset // WORD_SIZE
+        for index, address in enumerate(
+            range(first, min(first + length // WORD_SIZE, self.word_max + 1))
+        ):
+            if address >> self.file_bits not in self.directories:
+                continue  # untouched directory, reads as zeros
             try:
-                with open(path, 'rb') as f:
-                    data = f.read(WORD_SIZE) or b'\x00' * WORD_SIZE
-                self.memory_map[address] = MemoryCell(data)
+                with open(self.path(address), 'rb') as f:
+                    data = f.read(WORD_SIZE)
             except IOError:
-                self.memory_map[address] = MemoryCell()
-                
-        return self.memory_map[address].value
+                continue
+            out[index * WORD_SIZE:index * WORD_SIZE + len(data)] = data
+        return bytes(out)
+
+    def store(self, spans: List[Tuple[int, bytes]]):
+        """PageCache writer: write dirty byte spans back to their word files"""
+        for offset, data in spans:
+            first = offset // WORD_SIZE
+            for index in range(len(data) // WORD_SIZE):
+                self.ensure_directory((first + index) >> self.file_bits)
+                with open(self.path(first + index), 'wb') as f:
+                    f.write(data[index * WORD_SIZE:(index + 1) * WORD_SIZE])
+
+class VirtualMemoryFS:
+    def __init__(self, cache_pages: int = 16, flush_interval: Optional[float] = 1.0):
+        """Initialize the virtual memory filesystem with a word-addressed layout"""
+        self.base_path = Path(BASE_DIR)
+        self.word_max = 0xFFFF  # Maximum address for 16-bit word
+        self.dir_bits = 8  # Use first byte for directory
+        self.file_bits = 8  # Use second byte for file
+        self.files = WordFiles(self.base_path, self.word_max, self.file_bits)
+        self.directories = self.files.directories
+        # Pages are byte-addressed: word address * WORD_SIZE
+        self.page_cache = PageCache(self.files.load, self.files.store, cache_pages,
+                                    flush_interval=flush_interval)
+        # Dirty pages survive collection and interpreter exit. The cache only
+        # references self.files, so the finalizer does not keep self alive.
+        weakref.finalize(self, self.page_cache.flush)
+
+    def _ensure_directory(self, high_byte: int):
+        self.files.ensure_directory(high_byte)
+
+    def _address_to_path(self, address: int) -> Path:
+        """Convert a 16-bit address to directory/file path"""
+        return self.files.path(address)
+
+    def read(self, address: int) -> bytes:
+        """Read a word from the specified address"""
+        self._check_range(address, 1)
+        return self.page_cache.read(address * WORD_SIZE, WORD_SIZE)
 
     def write(self, address: int, value: bytes):
         """Write a word to the specified address"""
         if len(value) != WORD_SIZE:
             raise ValueError(f"Value must be {WORD_SIZE} bytes")
             
-        path = self._address_to_path(address)
-        
-        # Update memory map
-        self.memory_map[address] = MemoryCell(value)
-        
-        # Write to file
-        with open(path, 'wb') as f:
-            f.write(value)
+        self._check_range(address, 1)
+        self.page_cache.write(address * WORD_SIZE, value)
+
+    def flush(self):
+        """Write all dirty cached words back to their files"""
+        self.page_cache.flush()
             
+    def _check_range(self, start: int, length: int):
+        if length < 0 or not 0 <= start <= start + length <= self.word_max + 1:
+            raise ValueError(f"Range {start:04x}+{length} out of range")
+
+    def read_range(self, start: int, length: int) -> memoryview:
+        """Read `length` consecutive words from `start` in one pass"""
+        self._check_range(start, length)
+        return memoryview(self.page_cache.read(start * WORD_SIZE, length * WORD_SIZE))
+
+    def write_range(self, start: int, buffer: Union[bytes, bytearray, memoryview]):
+        """Write whole words from `buffer` to consecutive addresses from `start`"""
+        data = bytes(buffer)
+        if len(data) % WORD_SIZE:
+            raise ValueError(f"Buffer length must be a multiple of {WORD_SIZE} bytes")
+        self._check_range(start, len(data) // WORD_SIZE)
+        self.page_cache.write(start * WORD_SIZE, data)
+
+    def readv(self, ranges: List[Tuple[int, int]]) -> List[memoryview]:
+        """Read several (start, length) word ranges, one pass per contiguous run"""
+        runs = coalesce(ranges)
+        return gather(
+            ranges,
+            runs,
+            [self.read_range(start, length) for start, length in runs],
+            WORD_SIZE,
+        )
+
+    def writev(self, writes: List[Tuple[int, Union[bytes, bytearray, memoryview]]]):
+        """Write several (start, buffer) pairs, one pass per contiguous run.
+        Where writes overlap, the later one wins."""
+        for _, buffer in writes:
+            if len(buffer) % WORD_SIZE:
+                raise ValueError(
+                    f"Buffer length must be a multiple of {WORD_SIZE} bytes"
+                )
+        for start, buffer in scatter(writes, WORD_SIZE):
+            self.write_range(start, buffer)
+
     def get_directory_segment(self, high_byte: int):
         """Get reference to runtime memory segment for a directory"""
         if not 0 <= high_byte <= 0xFF:
             raise ValueError("Invalid directory address")
             
         dir_path = self.base_path / f"{high_byte:02x}"
-        if not dir_path.exists():
-            raise ValueError("Directory does not exist")
+        if high_byte not in self.directories:
+            # Never written, so there is no package yet; build the segment from source
+            namespace: Dict[str, object] = {'__name__': f"vmem_{high_byte:02x}"}
+            exec(
+                compile(SEGMENT_SOURCE, str(dir_path / "__init__.py"), 'exec'),
+                namespace,
+            )
+            return namespace['segment']
             
         # Import the segment from the directory's __init__.py
         import importlib.util
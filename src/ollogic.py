@@ -4,16 +4,48 @@ import http.client
 import urllib.parse
 import pathlib
 from pathlib import Path
-from typing import Dict, Optional, Set, Tuple, List, Union
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    Iterator,
+    Optional,
+    Set,
+    Tuple,
+    List,
+    Union,
+)
+from collections import OrderedDict, deque
 from dataclasses import dataclass, field
 from array import array
+from itertools import chain
 import struct
 from struct import calcsize
+import hashlib
+import heapq
 import math
+import random
 import time
 import importlib.util
+from types import ModuleType
+import mmap
 import sys
 import os
+import threading
+import weakref
+
+try:
+    import numpy as np
+except ImportError:  # optional extra; embedding search falls back to pure Python
+    np = None
+
+try:
+    from src.mem.pages import PageCache, coalesce, gather, scatter
+except ImportError:  # run as a script from src/
+    from mem.pages import PageCache, coalesce, gather, scatter
 
 @dataclass
 class MemoryCell:
@@ -35,36 +67,103 @@ class MemorySegment:
         """Write a byte to the segment"""
         self.cells[address] = MemoryCell(value)
 
-class VirtualMemoryFS:
+    def write_range(self, address: int, data: bytes):
+        """Write consecutive bytes from address"""
+        self.cells.update(
+            (address + offset, MemoryCell(data[offset:offset + 1]))
+            for offset in range(len(data))
+        )
+
+class MemoryImage:
     """
-    Maps a hexadecimal word-addressed virtual memory to filesystem structure.
-    Uses 16-bit addressing (0x0000 to 0xFFFF) split into:
-    - Upper byte (0x00-0xFF): Directory address
-    - Lower byte (0x00-0xFF): File address
+    The whole address space in one preallocated file, mapped with mmap.
+    Reads and writes are slices of the mapping, so no syscall per access.
     """
-    WORD_SIZE = 2  # 16-bit addressing (two bytes)
-    CELL_SIZE = 1  # 1 byte per cell
-    BASE_DIR = "./app/"
-    
-    def __init__(self):
-        """Initialize the virtual memory filesystem structure"""
-        self.base_path = pathlib.Path(self.BASE_DIR)
-        self._init_filesystem()
-        self._memory_cache: Dict[int, MemoryCell] = {}
-        self._segments: Dict[int, MemorySegment] = {addr: MemorySegment() for addr in range(0x100)}  # 256 segments
-        
-    def _init_filesystem(self):
-        """Create the filesystem structure for virtual memory"""
-        # Create base directory if it doesn't exist
-        self.base_path.mkdir(parents=True, exist_ok=True)
-        
-        # Create directory structure (0x00-0xFF)
-        for dir_addr in range(0x100):
-            dir_path = self.base_path / f"{dir_addr:02x}"
-            dir_path.mkdir(exist_ok=True)
-            
-            # Create __init__.py for the directory
-            init_content = f"""
+    SIZE = 0x10000  # 16-bit address space
+
+    def __init__(self, path: Union[str, Path], size: int = SIZE):
+        self.path = Path(path)
+        self.size = size
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.created = not self.path.exists()
+        self._file = open(self.path, 'a+b')
+        if os.fstat(self._file.fileno()).st_size < size:
+            self._file.truncate(size)  # sparse on most filesystems, reads back as zeros
+        self._map = mmap.mmap(self._file.fileno(), size)
+
+    def _check_range(self, address: int, length: int):
+        if not 0 <= address <= address + length <= self.size:
+            raise ValueError(f"Address {address:04x} out of range")
+
+    def read(self, address: int, length: int = 1) -> bytes:
+        """Read `length` bytes starting at `address`"""
+        self._check_range(address, length)
+        return self._map[address:address + length]
+
+    def write(self, address: int, data: bytes):
+        """Write `data` starting at `address`"""
+        self._check_range(address, len(data))
+        self._map[address:address + len(data)] = data
+
+    def flush(self):
+        """Sync dirty pages of the mapping to the image file"""
+        self._map.flush()
+
+    def close(self):
+        if not self._map.closed:
+            self._map.flush()
+            self._map.close()
+            self._file.close()
+
+    def export_files(self, base_path: Union[str, Path]):
+        """Write the image out as base_path/<high byte>/<low byte>, one byte per file"""
+        base_path = Path(base_path)
+        for dir_addr in range(self.size >> 8):
+            dir_path = base_path / f"{dir_addr:02x}"
+            dir_path.mkdir(parents=True, exist_ok=True)
+            offset = dir_addr << 8
+            for file_addr in range(0x100):
+                (dir_path / f"{file_addr:02x}").write_bytes(
+                    self._map[offset + file_addr:offset + file_addr + 1]
+                )
+
+    def import_files(self, base_path: Union[str, Path]):
+        """Load whatever byte files exist in a per-file layout into the image"""
+        base_path = Path(base_path)
+        for dir_addr in range(self.size >> 8):
+            dir_path = base_path / f"{dir_addr:02x}"
+            if not dir_path.is_dir():
+                continue
+            for file_addr in range(0x100):
+                file_path = dir_path / f"{file_addr:02x}"
+                if file_path.is_file():
+                    self._map[(dir_addr << 8) | file_addr] = (
+                        file_path.read_bytes() or b'\x00'
+                    )[0]
+
+class MemoryFiles:
+    """
+    The address space as one file per byte, <base>/<high byte>/<low byte>.
+    Segment directories and their __init__.py modules are created on first write,
+    and bytes of untouched segments read as zeros without touching the disk.
+    """
+    def __init__(self, base_path: Union[str, Path]):
+        self.base_path = Path(base_path)
+        self.materialized = self._scan_segments()
+
+    def _scan_segments(self) -> Set[int]:
+        """Segment directories already on disk, from a single directory listing"""
+        try:
+            names = os.listdir(self.base_path)
+        except FileNotFoundError:
+            return set()
+        return {int(name, 16) for name in names
+                if len(name) == 2 and all(c in '0123456789abcdef' for c in name)}
+
+    @staticmethod
+    def segment_source(dir_addr: int) -> str:
+        """Source of the __init__.py segment module for a directory"""
+        return f"""
 # Auto-generated __init__.py for virtual memory directory 0x{dir_addr:02x}
 from dataclasses import dataclass, field
 import array
@@ -73,15 +172,19 @@ import array
 class MemorySegment:
     data: array.array = field(default_factory=lambda: array.array('B', [0] * 256))
 """
-            (dir_path / "__init__.py").write_text(init_content)
-            
-            # Create file structure (0x00-0xFF) within each directory
-            for file_addr in range(0x100):
-                file_path = dir_path / f"{file_addr:02x}"
-                if not file_path.exists():
-                    file_path.write_bytes(b'\x00')  # Initialize with null byte
-                    
-    def _address_to_path(self, address: int) -> pathlib.Path:
+
+    def ensure_segment(self, dir_addr: int):
+        """Create a segment directory and its __init__.py on first write"""
+        if dir_addr in self.materialized:
+            return
+        dir_path = self.base_path / f"{dir_addr:02x}"
+        dir_path.mkdir(parents=True, exist_ok=True)
+        init_path = dir_path / "__init__.py"
+        if not init_path.exists():
+            init_path.write_text(self.segment_source(dir_addr))
+        self.materialized.add(dir_addr)
+
+    def path(self, address: int) -> Path:
         """Convert a 16-bit address to filesystem path"""
         if not 0 <= address <= 0xFFFF:
             raise ValueError(f"Address {address:04x} out of range")
@@ -90,123 +193,382 @@ class MemorySegment:
         file_addr = address & 0xFF        # Lower byte
         
         return self.base_path / f"{dir_addr:02x}" / f"{file_addr:02x}"
-        
+
+    def read(self, start: int, length: int) -> bytes:
+        out = bytearray(length)
+        for addr in range(start, start + length):
+            if (addr >> 8) & 0xFF not in self.materialized:
+                continue  # untouched segment, reads as zeros
+            try:
+                out[addr - start] = (self.path(addr).read_bytes() or b'\x00')[0]
+            except FileNotFoundError:
+                pass
+        return bytes(out)
+
+    def write(self, start: int, data: bytes):
+        for offset in range(len(data)):
+            self.ensure_segment(((start + offset) >> 8) & 0xFF)
+            self.path(start + offset).write_bytes(data[offset:offset + 1])
+
+    def write_spans(self, spans: List[Tuple[int, bytes]]):
+        for start, data in spans:
+            self.write(start, data)
+
+class VirtualMemoryFS:
+    """
+    Maps a hexadecimal word-addressed virtual memory to filesystem structure.
+    Uses 16-bit addressing (0x0000 to 0xFFFF) split into:
+    - Upper byte (0x00-0xFF): Directory address
+    - Lower byte (0x00-0xFF): File address
+    
+    Cell contents live in a single mmap-backed MemoryImage by default; pass
+    per_file=True to keep one file per byte instead. Segment directories and
+    their __init__.py modules are only created when a segment is first written,
+    and reads of untouched segments return zeros without touching the disk.
+    """
+    WORD_SIZE = 2  # 16-bit addressing (two bytes)
+    CELL_SIZE = 1  # 1 byte per cell
+    BASE_DIR = "./app/"
+    IMAGE_FILE = "memory.img"
+
+    def __init__(
+        self,
+        image_path: Optional[Union[str, Path]] = None,
+        per_file: bool = False,
+        cache_pages: int = 16,
+        flush_interval: Optional[float] = 1.0,
+    ):
+        """Initialize the virtual memory filesystem structure"""
+        self.base_path = pathlib.Path(self.BASE_DIR)
+        self.image: Optional[MemoryImage] = None
+        self.page_cache: Optional[PageCache] = None
+        self.files = MemoryFiles(self.base_path)
+        self.materialized = self.files.materialized
+        if per_file:
+            self.page_cache = PageCache(
+                self.files.read,
+                self.files.write_spans,
+                cache_pages,
+                flush_interval=flush_interval,
+            )
+            # Dirty pages survive collection and interpreter exit. The cache only
+            # references self.files, so the finalizer does not keep self alive.
+            weakref.finalize(self, self.page_cache.flush)
+        else:
+            # The image is already write-back through the OS page cache
+            self.image = MemoryImage(image_path or self.base_path / self.IMAGE_FILE)
+            # A fresh image picks up any cells left in an older per-file tree
+            if self.image.created and self.materialized:
+                self.image.import_files(self.base_path)
+        # 256 segments
+        self._segments: Dict[int, MemorySegment] = {
+            addr: MemorySegment() for addr in range(0x100)
+        }
+
+    def segment_source(self, dir_addr: int) -> str:
+        """Source of the __init__.py segment module for a directory"""
+        return self.files.segment_source(dir_addr)
+
+    def _ensure_segment(self, dir_addr: int):
+        self.files.ensure_segment(dir_addr)
+
+    def _address_to_path(self, address: int) -> pathlib.Path:
+        """Convert a 16-bit address to filesystem path"""
+        return self.files.path(address)
+
     async def read(self, address: int) -> bytes:
         """Asynchronously read a byte from the specified address."""
-        if address in self._memory_cache:
-            return self._memory_cache[address].value
-        
-        path = self._address_to_path(address)
+        if self.image is not None:
+            return self.image.read(address)
+        self._check_range(address, 1)
+        if self.page_cache.resident(address, 1):
+            return self.page_cache.read(address, 1)
         loop = asyncio.get_event_loop()
-        value = await loop.run_in_executor(None, path.read_bytes)
-        self._memory_cache[address] = MemoryCell(value)
-        return value
+        return await loop.run_in_executor(None, self.page_cache.read, address, 1)
 
     async def write(self, address: int, value: bytes):
         """Asynchronously write a byte to the specified address."""
         if len(value) != self.CELL_SIZE:
             raise ValueError(f"Value must be {self.CELL_SIZE} byte")
         
-        path = self._address_to_path(address)
-        loop = asyncio.get_event_loop()
-        await loop.run_in_executor(None, path.write_bytes, value)
-        self._memory_cache[address] = MemoryCell(value)
-        
-        segment_index = (address >> 8) & 0xFF
-        self._segments[segment_index].write(address & 0xFF, value)
+        if self.image is not None:
+            self.image.write(address, value)
+            self._ensure_segment((address >> 8) & 0xFF)
+        else:
+            self._check_range(address, 1)
+            if self.page_cache.resident(address, 1):
+                self.page_cache.write(address, value)
+            else:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, self.page_cache.write, address, value)
+        self._mirror(address, value)
+
+    def _mirror(self, start: int, data: bytes):
+        """Pass a write on to the runtime segments, one call per segment. In image
+        mode plain MemorySegments would only duplicate the image and are skipped."""
+        end = start + len(data)
+        for dir_addr in range(start >> 8, (end + 0xFF) >> 8):
+            segment = self._segments[dir_addr]
+            if self.image is not None and type(segment) is MemorySegment:
+                continue
+            low, high = max(start, dir_addr << 8), min(end, (dir_addr + 1) << 8)
+            segment.write_range(low & 0xFF, data[low - start:high - start])
         
     async def dump_segment(self, start_addr, length):
-        result = bytearray()
-        for addr in range(start_addr, start_addr + length):
-            # Await the read coroutine to get the actual result
-            data = await self.read(addr)
-            result.extend(data)  # 'data' is expected to be bytes
-        return result
+        return bytearray(await self.read_range(start_addr, length))
+
+    def _check_range(self, start: int, length: int):
+        if length < 0 or not 0 <= start <= start + length <= 0x10000:
+            raise ValueError(f"Range {start:04x}+{length} out of range")
+
+    async def read_range(self, start: int, length: int) -> memoryview:
+        """Read `length` bytes from `start` as one I/O operation."""
+        self._check_range(start, length)
+        if self.image is not None:
+            return memoryview(self.image.read(start, length))
+        if self.page_cache.resident(start, length):
+            return memoryview(self.page_cache.read(start, length))
+        loop = asyncio.get_event_loop()
+        return memoryview(
+            await loop.run_in_executor(None, self.page_cache.read, start, length)
+        )
+
+    async def write_range(
+        self, start: int, buffer: Union[bytes, bytearray, memoryview]
+    ):
+        """Write `buffer` from `start` as one I/O operation."""
+        data = bytes(buffer)
+        self._check_range(start, len(data))
+        if self.image is not None:
+            self.image.write(start, data)
+            for dir_addr in range(start >> 8, (start + len(data) + 0xFF) >> 8):
+                self._ensure_segment(dir_addr)
+        elif self.page_cache.resident(start, len(data)):
+            self.page_cache.write(start, data)
+        else:
+            loop = asyncio.get_event_loop()
+            await loop.run_in_executor(None, self.page_cache.write, start, data)
+        self._mirror(start, data)
+
+    async def readv(self, ranges: List[Tuple[int, int]]) -> List[memoryview]:
+        """Read several (start, length) ranges, one I/O operation per contiguous run."""
+        runs = coalesce(ranges)
+        return gather(
+            ranges,
+            runs,
+            [await self.read_range(start, length) for start, length in runs],
+        )
+
+    async def writev(
+        self, writes: List[Tuple[int, Union[bytes, bytearray, memoryview]]]
+    ):
+        """Write several (start, buffer) pairs, one I/O operation per contiguous run.
+        Where writes overlap, the later one wins."""
+        for start, buffer in scatter(writes):
+            await self.write_range(start, buffer)
+
+    def export_files(self, base_path: Optional[Union[str, Path]] = None):
+        """Write the image out one file per byte (defaults to base_path)"""
+        if self.image is None:
+            raise ValueError("Already using the per-file layout")
+        self.image.export_files(base_path or self.base_path)
+
+    def flush(self):
+        """Sync pending writes to disk"""
+        if self.image is not None:
+            self.image.flush()
+        else:
+            self.page_cache.flush()
+
+    def close(self):
+        if self.image is not None:
+            self.image.close()
+        else:
+            self.page_cache.flush()
 
 @dataclass
 class MemoryWavefront:
     """
     Represents the propagating wavefront of memory traversal.
     Tracks both physical state and nominative properties.
+    
+    Visited addresses are one bit each in an 8 KB bitmap, and their last visit
+    times are uint32 milliseconds since `epoch` in a flat array.
     """
     position: int = 0x0000  # Current address position
-    visited: Set[int] = field(default_factory=set)
-    timestamps: Dict[int, float] = field(default_factory=dict)
+    visited: bytearray = field(default_factory=lambda: bytearray(0x10000 >> 3))
+    timestamps: array = field(default_factory=lambda: array('I', [0]) * 0x10000)
+    epoch: float = field(default_factory=time.time)
+    # (from, to) of each seek
+    intervals: List[Tuple[int, int]] = field(default_factory=list)
     namespace_cache: Dict[str, object] = field(default_factory=dict)
 
+    def mark(self, start: int, stop: int):
+        """Mark addresses [start, stop) visited now"""
+        if start >= stop:
+            return
+        stamp = min(int((time.time() - self.epoch) * 1000), 0xFFFFFFFF)
+        self.timestamps[start:stop] = array('I', [stamp]) * (stop - start)
+        first, last = start >> 3, (stop - 1) >> 3
+        low_mask = (0xFF << (start & 7)) & 0xFF
+        high_mask = 0xFF >> (7 - ((stop - 1) & 7))
+        if first == last:
+            self.visited[first] |= low_mask & high_mask
+        else:
+            self.visited[first] |= low_mask
+            self.visited[first + 1:last] = b'\xff' * (last - first - 1)
+            self.visited[last] |= high_mask
+
+    def is_visited(self, address: int) -> bool:
+        return bool(self.visited[address >> 3] >> (address & 7) & 1)
+
+    def visited_at(self, address: int) -> Optional[float]:
+        """Wall-clock time of the last visit to an address, or None"""
+        if not self.is_visited(address):
+            return None
+        return self.epoch + self.timestamps[address] / 1000
+
+    def visited_count(self) -> int:
+        return int.from_bytes(self.visited, 'little').bit_count()
+
 class MemoryHead:
     """
     Manages the propagation of memory access and modification through the virtual
     memory space while maintaining intensive (physical) and nominative (naming) properties.
     """
-    def __init__(self, vmem: 'VirtualMemoryFS'):
+    def __init__(
+        self,
+        vmem: 'VirtualMemoryFS',
+        module_cache_size: int = 64,
+        stat_interval: float = 1.0,
+    ):
         self.vmem = vmem
         self.wavefront = MemoryWavefront()
-        self.module_cache: Dict[Tuple[int, int], object] = {}
+        # segment -> (mtime when loaded, module, monotonic time of last mtime
+        # check), oldest first
+        self.module_cache: 'OrderedDict[int, Tuple[Optional[float], ModuleType, float]]'
+        self.module_cache = OrderedDict()
+        self.module_cache_size = module_cache_size
+        self.stat_interval = stat_interval
         
+    def _segment_mtime(self, segment_addr: int) -> Optional[float]:
+        """mtime of a segment's __init__.py, or None if the segment was never written"""
+        if segment_addr not in self.vmem.materialized:
+            return None
+        path = self.vmem.base_path / f"{segment_addr:02x}" / "__init__.py"
+        return path.stat().st_mtime
+
+    def _evict_segment_module(self, segment_addr: int):
+        _, module, _ = self.module_cache.pop(segment_addr)
+        if sys.modules.get(module.__name__) is module:
+            del sys.modules[module.__name__]
+
     def _load_segment_module(self, segment_addr: int) -> object:
         """
         Dynamically loads the Python module corresponding to a memory segment.
         Creates a namespace bridge between memory and code.
+        
+        Loaded modules are kept in a bounded LRU. A cached module's file is
+        re-stat'ed at most once per stat_interval seconds, and a module that is
+        replaced or evicted is also dropped from sys.modules.
         """
+        now = time.monotonic()
+        entry = self.module_cache.get(segment_addr)
+        if entry is not None:
+            mtime, module, checked = entry
+            if now - checked < self.stat_interval:
+                self.module_cache.move_to_end(segment_addr)
+                return module
+            current = self._segment_mtime(segment_addr)
+            if current == mtime:
+                self.module_cache[segment_addr] = (mtime, module, now)
+                self.module_cache.move_to_end(segment_addr)
+                return module
+            self._evict_segment_module(segment_addr)
+        
         dir_path = self.vmem.base_path / f"{segment_addr:02x}"
         module_path = dir_path / "__init__.py"
+        name = f"vmem.seg_{segment_addr:02x}"
+        mtime = self._segment_mtime(segment_addr)
         
-        # Check cache first
-        cache_key = (segment_addr, module_path.stat().st_mtime)
-        if cache_key in self.module_cache:
-            return self.module_cache[cache_key]
-            
-        # Load module dynamically
-        spec = importlib.util.spec_from_file_location(
-            f"vmem.seg_{segment_addr:02x}",
-            module_path
-        )
-        module = importlib.util.module_from_spec(spec)
-        sys.modules[spec.name] = module
-        spec.loader.exec_module(module)
+        if mtime is None:
+            # Segments never written have no file yet; build them from source in memory
+            module = ModuleType(name)
+            sys.modules[name] = module
+            exec(
+                compile(
+                    self.vmem.segment_source(segment_addr), str(module_path), 'exec'
+                ),
+                module.__dict__,
+            )
+        else:
+            # Load module dynamically
+            spec = importlib.util.spec_from_file_location(name, module_path)
+            module = importlib.util.module_from_spec(spec)
+            sys.modules[spec.name] = module
+            spec.loader.exec_module(module)
         
         # Cache the loaded module
-        self.module_cache[cache_key] = module
+        self.module_cache[segment_addr] = (mtime, module, now)
+        while len(self.module_cache) > self.module_cache_size:
+            self._evict_segment_module(next(iter(self.module_cache)))
         return module
+
+    def preload(self, segments: Iterable[int]) -> int:
+        """Load a batch of segment modules ahead of use. Returns how many are cached."""
+        for segment_addr in segments:
+            self._load_segment_module(segment_addr)
+        return len(self.module_cache)
+
+    def warm_up(self, target_addr: int) -> int:
+        """Preload the segments a sweep from the current position to target_addr
+        will cross, up to the cache size"""
+        crossed = self._segments_between(self.wavefront.position, target_addr)
+        return self.preload(crossed[:self.module_cache_size])
+
+    @staticmethod
+    def _segments_between(start: int, stop: int) -> range:
+        """Segments crossed moving from start towards stop, in traversal order"""
+        first, last = (start >> 8) & 0xFF, (stop >> 8) & 0xFF
+        return range(first, last + 1) if last >= first else range(first, last - 1, -1)
         
-    def propagate(self, target_addr: int, max_steps: Optional[int] = None) -> List[int]:
+    def _touch_segment(self, segment_addr: int):
+        """Load a segment's module and create its runtime segment if needed"""
+        module = self._load_segment_module(segment_addr)
+        if segment_addr not in self.vmem._segments:
+            self.vmem._segments[segment_addr] = module.MemorySegment()
+
+    def propagate(self, target_addr: int, max_steps: Optional[int] = None,
+                  seek: bool = False) -> Union[List[int], range]:
         """
         Propagate the wavefront from current position to target address.
         Returns the path of addresses traversed.
+        
+        The sweep marks the whole path visited at once and touches each segment
+        module it crosses once. With seek=True the head jumps straight there
+        instead: the move is recorded as one (from, to) interval, nothing in
+        between is marked, only the landing segment is touched, and the path
+        comes back as a range rather than a list.
         """
-        path = []
-        steps = 0
+        start = self.wavefront.position
+        step = 1 if target_addr >= start else -1
+        stop = target_addr
+        if max_steps and abs(target_addr - start) > max_steps:
+            stop = start + step * max_steps
+        path = range(start, stop, step)
+        if not path:
+            return path if seek else []
         
-        while self.wavefront.position != target_addr:
-            if max_steps and steps >= max_steps:
-                break
-                
-            # Record current position
-            current_addr = self.wavefront.position
-            path.append(current_addr)
-            
-            # Mark as visited with timestamp
-            self.wavefront.visited.add(current_addr)
-            self.wavefront.timestamps[current_addr] = time.time()
-            
-            # Load corresponding segment module
-            segment_addr = (current_addr >> 8) & 0xFF
-            module = self._load_segment_module(segment_addr)
-            
-            # Create segment instance if needed
-            if segment_addr not in self.vmem._segments:
-                self.vmem._segments[segment_addr] = module.MemorySegment()
-            
-            # Determine next position (simple for now, can be made more sophisticated)
-            if current_addr < target_addr:
-                self.wavefront.position += 1
-            else:
-                self.wavefront.position -= 1
-                
-            steps += 1
-            
-        return path
+        self.wavefront.position = stop
+        if seek:
+            self.wavefront.intervals.append((start, stop))
+            self._touch_segment((stop >> 8) & 0xFF)
+            return path
+        
+        self.wavefront.mark(min(path), max(path) + 1)
+        for segment_addr in self._segments_between(path[0], path[-1]):
+            self._touch_segment(segment_addr)
+        return list(path)
         
     def read(self, address: int) -> bytes:
         """
@@ -228,7 +590,7 @@ class MemoryHead:
         """
         return {
             'position': f"0x{self.wavefront.position:04x}",
-            'visited_count': len(self.wavefront.visited),
+            'visited_count': self.wavefront.visited_count(),
             'current_segment': f"0x{(self.wavefront.position >> 8):02x}",
             'loaded_modules': len(self.module_cache)
         }
@@ -258,81 +620,2112 @@ class EmbeddingCell(MemoryCell):
         cell.metadata = parsed['metadata']
         return cell
 
+def _vector_norm(vector: array) -> float:
+    if np is not None:
+        return float(np.linalg.norm(np.frombuffer(vector, dtype=np.float32)))
+    return math.sqrt(math.fsum(x * x for x in vector))
+
+def _quantize(vector: array, dtype: str) -> Tuple[array, float]:
+    """Codes and scale for a float32 vector; float16 codes are raw half-float bits"""
+    if dtype == 'float32':
+        return vector, 1.0
+    if dtype == 'float16':
+        if np is not None:
+            return (
+                array(
+                    'H',
+                    np.frombuffer(vector, dtype=np.float32)
+                    .astype(np.float16)
+                    .tobytes(),
+                ),
+                1.0,
+            )
+        return array('H', struct.pack(f'{len(vector)}e', *vector)), 1.0
+    if np is not None:
+        values = np.frombuffer(vector, dtype=np.float32)
+        peak = float(np.abs(values).max()) if len(values) else 0.0
+        scale = peak / 127 if peak else 1.0
+        return array('b', np.rint(values / scale).astype(np.int8).tobytes()), scale
+    peak = max(map(abs, vector), default=0.0)
+    scale = peak / 127 if peak else 1.0
+    return array('b', (round(x / scale) for x in vector)), scale
+
+def _dequantize(codes: array, scale: float, dtype: str) -> array:
+    if dtype == 'float32':
+        return array('f', codes)
+    if dtype == 'float16':
+        return array('f', struct.unpack(f'{len(codes)}e', codes.tobytes()))
+    return array('f', (code * scale for code in codes))
+
+class EmbeddingStore:
+    """
+    Append-only on-disk embedding store, a directory of three files:
+    
+    - matrix.f32: raw float32 rows, mapped with mmap when read
+    - index.bin: header (magic, version, dim) then (key, row) records; the last
+      record for a key wins and row DELETED marks a removal
+    - metadata.jsonl: one {"key", "value", "metadata"} line per append
+    
+    Reopening replays index.bin and maps the matrix; nothing is parsed from
+    text but the metadata. Overwrites and deletes leave dead rows behind until
+    compact() rewrites the files.
+    """
+    MATRIX_FILE = "matrix.f32"
+    INDEX_FILE = "index.bin"
+    METADATA_FILE = "metadata.jsonl"
+    MAGIC = b'EMBS'
+    VERSION = 1
+    HEADER = struct.Struct('<4sII')  # magic, version, dim
+    RECORD = struct.Struct('<qI')  # key, row
+    DELETED = 0xFFFFFFFF
+
+    def __init__(self, path: Union[str, Path], dim: int = 0):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.dim = dim
+        self._rows: Dict[int, int] = {}
+        self._cells: Dict[int, Tuple[bytes, Dict]] = {}
+        self._row_count = 0
+        self._map: Optional[mmap.mmap] = None
+        self._open()
+
+    def _open(self):
+        """
+        Replay the index and metadata. A crash can tear the end off any of the
+        three files, so each is cut back to what the others agree on: index
+        records past the last complete matrix row, and metadata lines past the
+        appends still in the index, are dropped along with any partial record
+        or line, and later appends continue from there.
+        """
+        index_path = self.path / self.INDEX_FILE
+        matrix_path = self.path / self.MATRIX_FILE
+        metadata_path = self.path / self.METADATA_FILE
+        data = index_path.read_bytes() if index_path.exists() else b''
+        usable = 0  # bytes of index.bin to keep; 0 rewrites the header
+        appends = 0  # index records that added a row, one metadata line each
+        dim = 0
+        if len(data) >= self.HEADER.size:
+            magic, version, dim = self.HEADER.unpack_from(data)
+            if magic != self.MAGIC or version != self.VERSION:
+                raise ValueError(
+                    f"{index_path} is not a version {self.VERSION} embedding index"
+                )
+            if self.dim and dim and dim != self.dim:
+                raise ValueError(
+                    f"Store holds {dim}-dimensional embeddings, not {self.dim}"
+                )
+            self.dim = dim or self.dim
+            row_count = (
+                matrix_path.stat().st_size // (self.dim * 4)
+                if matrix_path.exists() and self.dim
+                else 0
+            )
+            usable = self.HEADER.size
+            records = data[usable:]
+            for key, row in self.RECORD.iter_unpack(
+                records[: len(records) // self.RECORD.size * self.RECORD.size]
+            ):
+                if row == self.DELETED:
+                    self._rows.pop(key, None)
+                elif row < row_count:
+                    self._rows[key] = row
+                    appends += 1
+                else:
+                    break  # its matrix row never made it to disk
+                usable += self.RECORD.size
+        
+        lines = 0
+        kept = 0  # bytes of metadata.jsonl to keep
+        if metadata_path.exists():
+            with open(metadata_path, 'rb') as f:
+                for line in f:
+                    if lines == appends or not line.endswith(b'\n'):
+                        break
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        break
+                    self._cells[entry['key']] = (
+                        bytes.fromhex(entry['value']),
+                        entry['metadata'],
+                    )
+                    lines += 1
+                    kept += len(line)
+        
+        # Cut torn tails so later appends stay aligned
+        for path, size in ((index_path, usable), (metadata_path, kept)):
+            if path.exists() and path.stat().st_size > size:
+                with open(path, 'r+b') as f:
+                    f.truncate(size)
+        self._matrix_file = open(matrix_path, 'a+b')
+        self._index_file = open(index_path, 'a+b')
+        if self._index_file.tell() == 0:
+            self._index_file.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.dim))
+        elif self.dim != dim:
+            self._rewrite_header()  # created without a dim, opened with one
+        self._metadata_file = open(metadata_path, 'a', encoding='utf-8')
+        row_bytes = self.dim * 4
+        self._row_count = self._matrix_file.tell() // row_bytes if row_bytes else 0
+        if self._matrix_file.tell() != self._row_count * row_bytes:
+            self._matrix_file.truncate(self._row_count * row_bytes)
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._rows
+
+    def keys(self) -> List[int]:
+        return list(self._rows)
+
+    def append(
+        self,
+        key: int,
+        embedding: array,
+        value: bytes = b'',
+        metadata: Optional[Dict] = None,
+    ):
+        """Append a new row for key; any earlier row for it becomes dead"""
+        if not self.dim:
+            self.dim = len(embedding)
+            self._rewrite_header()
+        elif len(embedding) != self.dim:
+            raise ValueError(
+                f"Embedding has {len(embedding)} dimensions, store holds {self.dim}"
+            )
+        vector = (
+            embedding
+            if isinstance(embedding, array) and embedding.typecode == 'f'
+            else array('f', embedding)
+        )
+        self._matrix_file.write(vector.tobytes())
+        row = self._row_count
+        self._row_count += 1
+        self._index_file.write(self.RECORD.pack(key, row))
+        self._metadata_file.write(
+            json.dumps({'key': key, 'value': value.hex(), 'metadata': metadata or {}})
+            + '\n'
+        )
+        self._rows[key] = row
+        self._cells[key] = (value, metadata or {})
+
+    def delete(self, key: int):
+        if self._rows.pop(key, None) is not None:
+            self._cells.pop(key, None)
+            self._index_file.write(self.RECORD.pack(key, self.DELETED))
+
+    def _rewrite_header(self):
+        self._index_file.flush()
+        with open(self.path / self.INDEX_FILE, 'r+b') as f:
+            f.write(self.HEADER.pack(self.MAGIC, self.VERSION, self.dim))
+
+    def _mapped(self, row: int) -> mmap.mmap:
+        """The matrix mapping, remapped if it does not reach `row` yet"""
+        end = (row + 1) * self.dim * 4
+        if self._map is None or len(self._map) < end:
+            self._matrix_file.flush()
+            # Older maps stay valid for any views still using them
+            self._map = mmap.mmap(
+                self._matrix_file.fileno(), 0, access=mmap.ACCESS_READ
+            )
+        return self._map
+
+    def get(self, key: int) -> Optional[array]:
+        """Copy of the live row for key"""
+        row = self._rows.get(key)
+        if row is None:
+            return None
+        start = row * self.dim * 4
+        return array('f', self._mapped(row)[start:start + self.dim * 4])
+
+    def vectors(self, keys: List[int]) -> 'np.ndarray':
+        """Live rows for keys as a (len(keys), dim) float32 matrix"""
+        rows = [self._rows[key] for key in keys]
+        if not rows:
+            return np.empty((0, self.dim), dtype=np.float32)
+        matrix = np.frombuffer(self._mapped(max(rows)), dtype=np.float32)
+        return matrix[:self._row_count * self.dim].reshape(-1, self.dim)[rows]
+
+    def cell(self, key: int) -> Optional[EmbeddingCell]:
+        """The stored value, metadata and embedding for key"""
+        if key not in self._rows:
+            return None
+        value, metadata = self._cells.get(key, (b'', {}))
+        return EmbeddingCell(value, self.get(key), dict(metadata))
+
+    def items(self) -> Iterator[Tuple[int, EmbeddingCell]]:
+        for key in list(self._rows):
+            yield key, self.cell(key)
+
+    def flush(self):
+        for f in (self._matrix_file, self._index_file, self._metadata_file):
+            f.flush()
+
+    def close(self):
+        if self._matrix_file.closed:
+            return
+        self.flush()
+        self._map = None
+        for f in (self._matrix_file, self._index_file, self._metadata_file):
+            f.close()
+
+    def compact(self):
+        """Rewrite the files with only live rows, in key order"""
+        cells = [(key, self.cell(key)) for key in sorted(self._rows)]
+        self.close()
+        for name in (self.MATRIX_FILE, self.INDEX_FILE, self.METADATA_FILE):
+            (self.path / name).unlink(missing_ok=True)
+        self._rows, self._cells, self._row_count = {}, {}, 0
+        self._open()
+        for key, cell in cells:
+            self.append(key, cell.embedding, cell.value, cell.metadata)
+        self.flush()
+
+class EmbeddingMatrix:
+    """
+    Keyed embeddings as rows of one contiguous array with their norms kept
+    alongside, so a search is a single matrix-vector product (numpy when it is
+    installed). Rows are appended at the end and deleted by moving the last row
+    into the gap, both amortized O(1).
+    
+    With dtype 'float16' or 'int8' (scaled per row) the rows are stored
+    quantized and searched at that precision; the best top_k * rescore
+    candidates are then rescored against a full-precision copy. rescore=0
+    keeps no full-precision copy and returns the quantized scores. Given an
+    EmbeddingStore as full_store, full-precision rows are read from its mapped
+    matrix instead of being kept in memory.
+    
+    Searches are exact up to quantization, so this doubles as the brute-force index.
+    """
+    CODE_TYPES = {'float32': 'f', 'float16': 'H', 'int8': 'b'}
+    BLOCK_ROWS = 16384  # quantized rows are widened to float32 this many at a time
+
+    def __init__(
+        self,
+        dtype: str = 'float32',
+        rescore: int = 4,
+        full_store: Optional[EmbeddingStore] = None,
+    ):
+        if dtype not in self.CODE_TYPES:
+            raise ValueError(f"Unsupported dtype {dtype!r}")
+        self.dtype = dtype
+        self.rescore = rescore
+        self.dim = 0
+        self._codes = array(self.CODE_TYPES[dtype])
+        self._scales = array('f')  # per row, int8 only
+        quantized = dtype != 'float32' and rescore > 0
+        self.full_store = full_store if quantized else None
+        self._full = array('f') if quantized and full_store is None else None
+        self._norms = array('f')
+        self._keys: List[int] = []  # row -> key
+        self._rows: Dict[int, int] = {}  # key -> row
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._rows
+
+    def keys(self) -> List[int]:
+        return list(self._keys)
+
+    def add(self, key: int, embedding: array):
+        """Insert or replace the embedding stored under key"""
+        if not self._keys:
+            self.dim = len(embedding)
+        elif len(embedding) != self.dim:
+            raise ValueError(
+                f"Embedding has {len(embedding)} dimensions, index holds {self.dim}"
+            )
+        vector = (
+            embedding
+            if isinstance(embedding, array) and embedding.typecode == 'f'
+            else array('f', embedding)
+        )
+        codes, scale = _quantize(vector, self.dtype)
+        row = self._rows.get(key)
+        if row is None:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+            self._codes.extend(codes)
+            if self._full is not None:
+                self._full.extend(vector)
+            if self.dtype == 'int8':
+                self._scales.append(scale)
+            self._norms.append(_vector_norm(vector))
+        else:
+            span = slice(row * self.dim, (row + 1) * self.dim)
+            self._codes[span] = codes
+            if self._full is not None:
+                self._full[span] = vector
+            if self.dtype == 'int8':
+                self._scales[row] = scale
+            self._norms[row] = _vector_norm(vector)
+
+    def remove(self, key: int):
+        """Drop a key's embedding, moving the last row into its slot"""
+        row = self._rows.pop(key, None)
+        if row is None:
+            return
+        last = len(self._keys) - 1
+        dim = self.dim
+        if row != last:
+            moved = self._keys[last]
+            self._codes[row * dim:(row + 1) * dim] = self._codes[last * dim:]
+            if self._full is not None:
+                self._full[row * dim:(row + 1) * dim] = self._full[last * dim:]
+            if self.dtype == 'int8':
+                self._scales[row] = self._scales[last]
+            self._norms[row] = self._norms[last]
+            self._keys[row] = moved
+            self._rows[moved] = row
+        del self._codes[last * dim:]
+        if self._full is not None:
+            del self._full[last * dim:]
+        if self.dtype == 'int8':
+            self._scales.pop()
+        self._norms.pop()
+        self._keys.pop()
+
+    def _row(self, row: int) -> array:
+        span = slice(row * self.dim, (row + 1) * self.dim)
+        if self._full is not None:
+            return self._full[span]
+        if self.full_store is not None and self._keys[row] in self.full_store:
+            return self.full_store.get(self._keys[row])
+        scale = self._scales[row] if self.dtype == 'int8' else 1.0
+        return _dequantize(self._codes[span], scale, self.dtype)
+
+    def get(self, key: int) -> Optional[array]:
+        """Copy of the embedding stored under key, at full precision if it is kept"""
+        row = self._rows.get(key)
+        return None if row is None else self._row(row)
+
+    def _code_matrix(self) -> 'np.ndarray':
+        """The stored codes as a (len, dim) matrix at storage precision, uncopied"""
+        dtype = {'float32': np.float32, 'float16': np.float16, 'int8': np.int8}[
+            self.dtype
+        ]
+        return np.frombuffer(self._codes, dtype=dtype).reshape(-1, self.dim)
+
+    def to_numpy(self, rows: Optional['np.ndarray'] = None) -> 'np.ndarray':
+        """Copy of the rows, or just those indexed by `rows`, as a float32 matrix"""
+        select = slice(None) if rows is None else rows
+        if not self._keys:
+            return np.empty((0, self.dim), dtype=np.float32)
+        if self._full is not None:
+            return np.array(
+                np.frombuffer(self._full, dtype=np.float32).reshape(-1, self.dim)[
+                    select
+                ]
+            )
+        keys = (
+            self._keys if rows is None else [self._keys[row] for row in rows.tolist()]
+        )
+        if self.full_store is not None and all(key in self.full_store for key in keys):
+            return self.full_store.vectors(keys)
+        matrix = self._code_matrix()[select].astype(np.float32)
+        if self.dtype == 'int8':
+            matrix *= np.frombuffer(self._scales, dtype=np.float32)[select][:, None]
+        return matrix
+
+    def extend_rows(self, source: 'EmbeddingMatrix', rows: 'np.ndarray'):
+        """Append rows of a matrix built with the same settings, copied at storage
+        precision so nothing is re-quantized. Their keys must be new here."""
+        if source.dtype != self.dtype or (source._full is None) != (self._full is None):
+            raise ValueError(
+                "Rows can only move between matrices with the same dtype and rescore"
+            )
+        if not len(rows):
+            return
+        if not self._keys:
+            self.dim = source.dim
+        elif source.dim != self.dim:
+            raise ValueError(
+                f"Rows have {source.dim} dimensions, index holds {self.dim}"
+            )
+        keys = [source._keys[row] for row in rows.tolist()]
+        if any(key in self._rows for key in keys):
+            raise ValueError("Rows can only be appended for new keys")
+        self._codes.frombytes(source._code_matrix()[rows].tobytes())
+        if self._full is not None:
+            self._full.frombytes(
+                np.frombuffer(source._full, dtype=np.float32)
+                .reshape(-1, self.dim)[rows]
+                .tobytes()
+            )
+        if self.dtype == 'int8':
+            self._scales.frombytes(
+                np.frombuffer(source._scales, dtype=np.float32)[rows].tobytes()
+            )
+        self._norms.frombytes(
+            np.frombuffer(source._norms, dtype=np.float32)[rows].tobytes()
+        )
+        for key in keys:
+            self._rows[key] = len(self._keys)
+            self._keys.append(key)
+
+    def _approximate_scores(
+        self, query: 'np.ndarray', rows: Optional['np.ndarray'] = None
+    ) -> 'np.ndarray':
+        """Dot products of every stored row, or those indexed by `rows`, with the
+        query or with each column of a (dim, n) query matrix, at storage precision"""
+        select = slice(None) if rows is None else rows
+        codes = self._code_matrix()[select]
+        if self.dtype == 'float32':
+            return codes @ query
+        scores = np.empty((len(codes),) + query.shape[1:], dtype=np.float32)
+        for start in range(0, len(codes), self.BLOCK_ROWS):
+            scores[start:start + self.BLOCK_ROWS] = (
+                codes[start:start + self.BLOCK_ROWS].astype(np.float32) @ query
+            )
+        if self.dtype == 'int8':
+            scales = np.frombuffer(self._scales, dtype=np.float32)[select]
+            scores *= scales.reshape((-1,) + (1,) * (query.ndim - 1))
+        return scores
+
+    def search(self, query_embedding: array, top_k: int = 5, exact: bool = True,
+               keys: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """Top-k (key, cosine similarity) pairs, best first, among `keys` if given.
+        The flag only lets it stand in for IVFFlatIndex."""
+        rows = (
+            None
+            if keys is None
+            else [self._rows[key] for key in keys if key in self._rows]
+        )
+        if not self._keys or top_k <= 0 or rows == []:
+            return []
+        if len(query_embedding) != self.dim:
+            raise ValueError(
+                f"Query has {len(query_embedding)} dimensions, index holds {self.dim}"
+            )
+
+        if np is None:
+            query_norm = math.sqrt(math.fsum(x * x for x in query_embedding))
+            similarities = (
+                (
+                    self._keys[row],
+                    (
+                        sum(x * y for x, y in zip(query_embedding, self._row(row)))
+                        / (self._norms[row] * query_norm)
+                        if self._norms[row] and query_norm
+                        else 0.0
+                    ),
+                )
+                for row in (range(len(self._keys)) if rows is None else rows)
+            )
+            return heapq.nlargest(top_k, similarities, key=lambda x: x[1])
+        
+        query = np.asarray(query_embedding, dtype=np.float32)
+        # Scores are over the selected rows; `selected` maps them back to matrix rows
+        selected = None if rows is None else np.array(rows, dtype=np.intp)
+        norms = np.frombuffer(self._norms, dtype=np.float32)
+        denominators = (norms if selected is None else norms[selected]) * np.float32(
+            np.linalg.norm(query)
+        )
+        scores = np.divide(
+            self._approximate_scores(query, selected),
+            denominators,
+            out=np.zeros(len(denominators), dtype=np.float32),
+            where=denominators > 0,
+        )
+        rescoring = self._full is not None or self.full_store is not None
+        k = min(top_k * max(self.rescore, 1) if rescoring else top_k, len(scores))
+        top = np.argpartition(-scores, k - 1)[:k]
+        top_rows = top if selected is None else selected[top]
+        if self._full is not None:
+            full = np.frombuffer(self._full, dtype=np.float32).reshape(-1, self.dim)[
+                top_rows
+            ]
+            stored = np.ones(len(top), dtype=bool)
+        elif self.full_store is not None:
+            # Rows the store has never seen keep their quantized score
+            stored = np.array(
+                [self._keys[row] in self.full_store for row in top_rows], dtype=bool
+            )
+            full = self.full_store.vectors(
+                [self._keys[row] for row in top_rows[stored]]
+            )
+        if rescoring and stored.any():
+            candidates = denominators[top[stored]]
+            scores[top[stored]] = np.divide(
+                full @ query,
+                candidates,
+                out=np.zeros(len(candidates), dtype=np.float32),
+                where=candidates > 0,
+            )
+        order = np.argsort(-scores[top])[:top_k]
+        return [
+            (self._keys[row], float(score))
+            for row, score in zip(top_rows[order].tolist(), scores[top][order])
+        ]
+
+class IVFFlatIndex:
+    """
+    Inverted-file index over cosine similarity. Vectors are bucketed under the
+    nearest of `nlist` spherical k-means centroids, each bucket an
+    EmbeddingMatrix with the given dtype, rescore and full_store, and a search
+    scans only the `nprobe` buckets whose centroids are closest to the query.
+    Raising nprobe trades speed for recall.
+    
+    Until `train_size` vectors have been added everything sits in one bucket
+    searched exhaustively. The centroids are retrained whenever the index has
+    grown `retrain_factor` times since the last training, by add() itself unless
+    auto_train=False; then the caller checks needs_training and runs train(),
+    which is thread-safe, wherever suits it (InferenceHead uses an executor).
+    Requires numpy.
+    """
+
+    def __init__(
+        self,
+        nlist: int = 64,
+        nprobe: int = 8,
+        train_size: Optional[int] = None,
+        retrain_factor: float = 4.0,
+        iterations: int = 10,
+        seed: int = 0,
+        dtype: str = 'float32',
+        rescore: int = 4,
+        full_store: Optional[EmbeddingStore] = None,
+        sample_size: Optional[int] = None,
+        auto_train: bool = True,
+    ):
+        if np is None:
+            raise ImportError(
+                "IVFFlatIndex needs numpy; use EmbeddingMatrix for exact search"
+            )
+        self.dtype = dtype
+        self.rescore = rescore
+        self.full_store = full_store
+        self.nlist = nlist
+        self.nprobe = nprobe
+        self.train_size = max(train_size or nlist * 16, nlist)
+        self.retrain_factor = retrain_factor
+        self.iterations = iterations
+        # k-means runs on at most this many vectors, however large the index grows
+        self.sample_size = max(sample_size or nlist * 64, nlist)
+        self.auto_train = auto_train
+        self._lock = threading.RLock()
+        self._rng = np.random.default_rng(seed)
+        self.centroids: Optional['np.ndarray'] = None
+        self._lists: List[EmbeddingMatrix] = [
+            EmbeddingMatrix(dtype, rescore, full_store)
+        ]
+        self._where: Dict[int, int] = {}  # key -> bucket
+        self._trained_size = 0
+
+    def __len__(self) -> int:
+        return len(self._where)
+
+    def __contains__(self, key: int) -> bool:
+        return key in self._where
+
+    def _bucket(self, embedding: array) -> int:
+        if self.centroids is None:
+            return 0
+        return int(np.argmax(self.centroids @ np.asarray(embedding, dtype=np.float32)))
+
+    @property
+    def needs_training(self) -> bool:
+        """Whether the index has grown enough since the last training to (re)train"""
+        threshold = (
+            self.train_size
+            if self.centroids is None
+            else self._trained_size * self.retrain_factor
+        )
+        return len(self) >= threshold
+
+    def add(self, key: int, embedding: array):
+        """Insert or replace the embedding stored under key"""
+        with self._lock:
+            bucket = self._bucket(embedding)
+            if self._where.get(key, bucket) != bucket:
+                self.remove(key)
+            self._lists[bucket].add(key, embedding)
+            self._where[key] = bucket
+        if self.auto_train and self.needs_training:
+            self.train()
+
+    def remove(self, key: int):
+        with self._lock:
+            bucket = self._where.pop(key, None)
+            if bucket is not None:
+                self._lists[bucket].remove(key)
+
+    def get(self, key: int) -> Optional[array]:
+        with self._lock:
+            bucket = self._where.get(key)
+            return None if bucket is None else self._lists[bucket].get(key)
+
+    def train(self):
+        """
+        Fit the centroids to a random sample of at most sample_size stored
+        vectors, then re-bucket every vector. Only drawing the sample and the
+        re-bucketing hold the lock; k-means runs without it.
+        """
+        with self._lock:
+            if len(self) < self.nlist:
+                return
+            sample = self._sample(min(len(self), self.sample_size))
+        centroids = self._fit(sample)
+        with self._lock:
+            self._rebucket(centroids)
+
+    def _sample(self, count: int) -> 'np.ndarray':
+        """`count` stored vectors picked uniformly at random, as a float32 matrix"""
+        offsets = np.cumsum([0] + [len(bucket) for bucket in self._lists])
+        picks = np.sort(self._rng.choice(offsets[-1], count, replace=False))
+        bounds = np.searchsorted(picks, offsets)
+        return np.concatenate(
+            [
+                bucket.to_numpy(picks[low:high] - offset)
+                for bucket, low, high, offset in zip(
+                    self._lists, bounds, bounds[1:], offsets
+                )
+                if high > low
+            ]
+        )
+
+    def _fit(self, sample: 'np.ndarray') -> 'np.ndarray':
+        """Spherical k-means centroids for the sample"""
+        norms = np.linalg.norm(sample, axis=1, keepdims=True)
+        unit = sample / np.where(norms > 0, norms, 1)
+        centroids = unit[self._rng.choice(len(unit), self.nlist, replace=False)]
+        members = np.zeros((len(unit), self.nlist), dtype=np.float32)
+        for _ in range(self.iterations):
+            assignment = np.argmax(unit @ centroids.T, axis=1)
+            # Cluster sums as one matrix product; np.add.at is far slower
+            members[:] = 0
+            members[np.arange(len(unit)), assignment] = 1
+            sums = members.T @ unit
+            lengths = np.linalg.norm(sums, axis=1, keepdims=True)
+            # Empty clusters keep their previous centroid
+            centroids = np.where(
+                lengths > 0, sums / np.where(lengths > 0, lengths, 1), centroids
+            )
+        return centroids.astype(np.float32)
+
+    def _rebucket(self, centroids: 'np.ndarray'):
+        """Move every row to its nearest centroid's bucket, scored and copied at
+        storage precision one old bucket at a time"""
+        lists = [
+            EmbeddingMatrix(self.dtype, self.rescore, self.full_store)
+            for _ in range(self.nlist)
+        ]
+        where: Dict[int, int] = {}
+        for bucket in self._lists:
+            if not len(bucket):
+                continue
+            # Row norms do not change which centroid scores highest
+            assignment = np.argmax(bucket._approximate_scores(centroids.T), axis=1)
+            order = np.argsort(assignment, kind='stable')
+            bounds = np.searchsorted(assignment[order], np.arange(self.nlist + 1))
+            for target, (low, high) in enumerate(zip(bounds, bounds[1:])):
+                if high > low:
+                    lists[target].extend_rows(bucket, order[low:high])
+            where.update(zip(bucket.keys(), assignment.tolist()))
+        self.centroids = centroids
+        self._lists = lists
+        self._where = where
+        self._trained_size = len(where)
+
+    def search(self, query_embedding: array, top_k: int = 5, exact: bool = False,
+               keys: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """
+        Top-k (key, cosine similarity) pairs, best first. exact=True scans every
+        bucket, giving brute-force results to measure recall against. Given
+        `keys`, only those are scored, exactly, in whichever buckets hold them.
+        """
+        with self._lock:
+            if keys is not None:
+                by_bucket: Dict[int, List[int]] = {}
+                for key in keys:
+                    if key in self._where:
+                        by_bucket.setdefault(self._where[key], []).append(key)
+                candidates = chain.from_iterable(
+                    self._lists[bucket].search(query_embedding, top_k, keys=subset)
+                    for bucket, subset in by_bucket.items()
+                )
+                return heapq.nlargest(top_k, candidates, key=lambda x: x[1])
+            if self.centroids is None or exact or self.nprobe >= self.nlist:
+                probes = range(len(self._lists))
+            else:
+                scores = self.centroids @ np.asarray(query_embedding, dtype=np.float32)
+                probes = np.argpartition(-scores, self.nprobe - 1)[
+                    : self.nprobe
+                ].tolist()
+            candidates = chain.from_iterable(
+                self._lists[bucket].search(query_embedding, top_k) for bucket in probes
+            )
+            return heapq.nlargest(top_k, candidates, key=lambda x: x[1])
+
+    def recall(self, queries: Iterable[array], top_k: int = 5) -> float:
+        """Mean fraction of the exact top-k that the approximate search returns"""
+        hits = total = 0
+        for query in queries:
+            exact = {key for key, _ in self.search(query, top_k, exact=True)}
+            hits += len(exact & {key for key, _ in self.search(query, top_k)})
+            total += len(exact)
+        return hits / total if total else 1.0
+
 class EmbeddingSegment(MemorySegment):
-    """Extends MemorySegment to handle embeddings"""
-    def __init__(self):
+    """
+    Extends MemorySegment to handle embeddings. They are kept only in
+    `embeddings`, either the segment's own EmbeddingMatrix or an index shared
+    by all segments, where this segment's keys are `base | address`.
+    """
+    def __init__(
+        self,
+        index: Optional[Union[EmbeddingMatrix, 'IVFFlatIndex']] = None,
+        base: int = 0,
+        store: Optional[EmbeddingStore] = None,
+    ):
         super().__init__()
-        self.embedding_index: Dict[int, array] = {}
+        self.embeddings = index if index is not None else EmbeddingMatrix()
+        self.shared = index is not None
+        self.base = base
+        # Embeddings dropped here are tombstoned in the store too, so they stay
+        # gone after a reload
+        self.store = store
+        self._embedded: Set[int] = set()
         
     def write(self, address: int, value: bytes, embedding: Optional[array] = None):
         """Write value and optional embedding"""
-        cell = EmbeddingCell(value, embedding)
-        self.cells[address] = cell
+        self.cells[address] = EmbeddingCell(value)
         if embedding is not None:
-            self.embedding_index[address] = embedding
+            self.embeddings.add(self.base | address, embedding)
+            self._embedded.add(address)
+        else:
+            self.delete_embedding(address)
+
+    def write_range(self, address: int, data: bytes):
+        """Write consecutive bytes from address, dropping the embeddings under them"""
+        end = address + len(data)
+        self.cells.update(
+            (offset, EmbeddingCell(data[offset - address:offset - address + 1]))
+            for offset in range(address, end)
+        )
+        for offset in [offset for offset in self._embedded if address <= offset < end]:
+            self.delete_embedding(offset)
+
+    def delete_embedding(self, address: int):
+        self.embeddings.remove(self.base | address)
+        self._embedded.discard(address)
+        if self.store is not None:
+            self.store.delete(self.base | address)
+
+    def embedding(self, address: int) -> Optional[array]:
+        """Copy of the stored embedding for an address"""
+        return (
+            self.embeddings.get(self.base | address)
+            if address in self._embedded
+            else None
+        )
+
+    @property
+    def embedding_index(self) -> Dict[int, array]:
+        """Address -> embedding, built on demand"""
+        return {address: self.embedding(address) for address in self._embedded}
             
     def search_similar(self, query_embedding: array, top_k: int = 5) -> List[tuple]:
-        """Find most similar embeddings using cosine similarity"""
-        if not self.embedding_index:
-            return []
-            
-        def cosine_similarity(a: array, b: array) -> float:
-            dot_product = sum(x * y for x, y in zip(a, b))
-            norm_a = math.sqrt(sum(x * x for x in a))
-            norm_b = math.sqrt(sum(x * x for x in b))
-            return dot_product / (norm_a * norm_b)
-            
-        similarities = []
-        for addr, emb in self.embedding_index.items():
-            similarity = cosine_similarity(query_embedding, emb)
-            similarities.append((addr, similarity))
-            
-        return sorted(similarities, key=lambda x: x[1], reverse=True)[:top_k]
+        """Find the most similar embeddings by cosine, as (address, similarity)"""
+        # A shared index is searched among this segment's keys only
+        keys = (
+            [self.base | address for address in self._embedded] if self.shared else None
+        )
+        return [
+            (key & 0xFF, similarity)
+            for key, similarity in self.embeddings.search(
+                query_embedding, top_k, keys=keys
+            )
+        ]
+
+class EmbeddingCache:
+    """
+    Content-addressed embedding cache keyed by sha256(model, text). Hot entries sit
+    in an in-memory LRU; with a path, every entry is also written to
+    <path>/<xx>/<digest>.f32 and the directory is trimmed oldest-first to max_bytes.
+    Concurrent misses on one key share a single computation.
+    
+    get_or_compute() reads, writes and trims disk files in the default executor so
+    the event loop never waits on the filesystem; drain() waits for pending writes.
+    get() and put() do the same work inline for synchronous callers.
+    """
+    SUFFIX = '.f32'
+    PARTIAL_SUFFIX = '.tmp'
+
+    def __init__(self, path: Optional[Union[str, Path]] = None, capacity: int = 1024,
+                 max_bytes: Optional[int] = 256 << 20):
+        if capacity < 1:
+            raise ValueError("Capacity must be at least one entry")
+        self.capacity = capacity
+        self.max_bytes = max_bytes
+        self.path = Path(path) if path is not None else None
+        self._entries: 'OrderedDict[str, array]' = OrderedDict()
+        self._inflight: Dict[str, asyncio.Future] = {}
+        # digest -> file size, oldest first; a disk hit moves the entry to the end
+        self._files: 'OrderedDict[str, int]' = OrderedDict()
+        self._saving: Set[str] = set()
+        self._saves: Set[asyncio.Future] = set()
+        self.disk_bytes = 0
+        self.hits = self.disk_hits = self.misses = self.coalesced = 0
+        self.evictions = self.disk_evictions = 0
+        if self.path is not None:
+            self.path.mkdir(parents=True, exist_ok=True)
+            # Left behind by writes that died before their rename
+            for partial in self.path.glob('*/*' + self.PARTIAL_SUFFIX):
+                partial.unlink(missing_ok=True)
+            found = []
+            for file in self.path.glob('*/*' + self.SUFFIX):
+                info = file.stat()
+                found.append((info.st_mtime, file.stem, info.st_size))
+            for _, digest, size in sorted(found):
+                self._files[digest] = size
+                self.disk_bytes += size
+            self._remove_files(self._trim())
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(model: str, text: str) -> str:
+        return hashlib.sha256(f"{model}\0{text}".encode('utf-8')).hexdigest()
+
+    def _file(self, digest: str) -> Path:
+        return self.path / digest[:2] / (digest + self.SUFFIX)
+
+    def _remember(self, digest: str, embedding: array):
+        self._entries[digest] = embedding
+        self._entries.move_to_end(digest)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    # _read_file, _write_file and _remove_files only touch the filesystem, so
+    # they may run in a worker thread; the bookkeeping stays on the loop
+
+    def _read_file(self, digest: str) -> Optional[bytes]:
+        try:
+            data = self._file(digest).read_bytes()
+            os.utime(self._file(digest))  # recency survives a reopen
+        except OSError:
+            return None
+        return data
+
+    def _write_file(self, digest: str, data: bytes):
+        file = self._file(digest)
+        file.parent.mkdir(exist_ok=True)
+        partial = file.with_suffix(self.PARTIAL_SUFFIX)
+        try:
+            partial.write_bytes(data)
+            os.replace(partial, file)
+        finally:
+            partial.unlink(missing_ok=True)
+
+    def _remove_files(self, digests: List[str]):
+        for digest in digests:
+            try:
+                self._file(digest).unlink()
+            except FileNotFoundError:
+                pass
+
+    def _loaded(self, digest: str, data: Optional[bytes]) -> Optional[array]:
+        """Account for a disk read; data is None when the file has gone"""
+        if data is None:
+            if digest in self._files:
+                self.disk_bytes -= self._files.pop(digest)
+            return None
+        if digest in self._files:
+            self._files.move_to_end(digest)
+        embedding = array('f')
+        embedding.frombytes(data[:len(data) // 4 * 4])
+        return embedding
+
+    def _saved(self, digest: str, size: int) -> List[str]:
+        """Account for a written file; returns the digests to trim"""
+        self._files[digest] = size
+        self.disk_bytes += size
+        return self._trim()
+
+    def _trim(self) -> List[str]:
+        victims = []
+        while (
+            self.max_bytes is not None
+            and self.disk_bytes > self.max_bytes
+            and self._files
+        ):
+            digest, size = self._files.popitem(last=False)
+            self.disk_bytes -= size
+            self.disk_evictions += 1
+            victims.append(digest)
+        return victims
+
+    def _on_disk(self, digest: str) -> bool:
+        return self.path is not None and digest in self._files
+
+    def _cached(self, digest: str) -> Optional[array]:
+        embedding = self._entries.get(digest)
+        if embedding is not None:
+            self._entries.move_to_end(digest)
+            self.hits += 1
+        return embedding
+
+    def _disk_hit(self, digest: str, data: Optional[bytes]) -> Optional[array]:
+        embedding = self._loaded(digest, data)
+        if embedding is not None:
+            self.disk_hits += 1
+            self._remember(digest, embedding)
+        return embedding
+
+    def get(self, model: str, text: str) -> Optional[array]:
+        digest = self.key(model, text)
+        embedding = self._cached(digest)
+        if embedding is None and self._on_disk(digest):
+            embedding = self._disk_hit(digest, self._read_file(digest))
+        if embedding is None:
+            self.misses += 1
+        return embedding
+
+    def put(self, model: str, text: str, embedding: array):
+        vector = (
+            embedding
+            if isinstance(embedding, array) and embedding.typecode == 'f'
+            else array('f', embedding)
+        )
+        digest = self.key(model, text)
+        self._remember(digest, vector)
+        if self.path is not None and digest not in self._files:
+            data = vector.tobytes()
+            self._write_file(digest, data)
+            self._remove_files(self._saved(digest, len(data)))
+
+    async def get_or_compute(self, model: str, text: str,
+                             compute: Callable[[], Awaitable[array]]) -> array:
+        """Return the cached embedding, or await compute() once for all callers"""
+        digest = self.key(model, text)
+        embedding = self._cached(digest)
+        if embedding is not None:
+            return embedding
+        pending = self._inflight.get(digest)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        pending = asyncio.ensure_future(self._fetch(digest, compute))
+        self._inflight[digest] = pending
+        pending.add_done_callback(lambda task: self._settle(digest, task))
+        # A caller being cancelled must not cancel the computation others wait on
+        return await asyncio.shield(pending)
+
+    async def _fetch(
+        self, digest: str, compute: Callable[[], Awaitable[array]]
+    ) -> array:
+        """The disk tier, then compute(); concurrent callers share this"""
+        if self._on_disk(digest):
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, self._read_file, digest
+            )
+            embedding = self._disk_hit(digest, data)
+            if embedding is not None:
+                return embedding
+        self.misses += 1
+        embedding = await compute()
+        return (
+            embedding
+            if isinstance(embedding, array) and embedding.typecode == 'f'
+            else array('f', embedding)
+        )
+
+    def _settle(self, digest: str, task: asyncio.Future):
+        del self._inflight[digest]
+        if task.cancelled() or task.exception() is not None:
+            return
+        self._remember(digest, task.result())
+        if (
+            self.path is not None
+            and digest not in self._files
+            and digest not in self._saving
+        ):
+            save = asyncio.ensure_future(self._save(digest, task.result()))
+            self._saves.add(save)
+            save.add_done_callback(self._saves.discard)
+
+    async def _save(self, digest: str, embedding: array):
+        loop = asyncio.get_running_loop()
+        data = embedding.tobytes()
+        self._saving.add(digest)
+        try:
+            await loop.run_in_executor(None, self._write_file, digest, data)
+        finally:
+            self._saving.discard(digest)
+        victims = self._saved(digest, len(data))
+        if victims:
+            await loop.run_in_executor(None, self._remove_files, victims)
+
+    async def drain(self):
+        """Wait until every embedding computed so far is on disk"""
+        while self._saves:
+            await asyncio.gather(*self._saves)
+
+    def clear(self):
+        """Drop both tiers"""
+        self._entries.clear()
+        if self.path is not None:
+            self._remove_files(list(self._files))
+        self._files.clear()
+        self.disk_bytes = 0
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.disk_hits + self.coalesced + self.misses
+        return {
+            'hits': self.hits,
+            'disk_hits': self.disk_hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            # Coalesced lookups avoided a computation too
+            'hit_rate': (lookups - self.misses) / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+            'disk_evictions': self.disk_evictions,
+            'entries': len(self._entries),
+            'disk_entries': len(self._files),
+            'disk_bytes': self.disk_bytes,
+        }
+
+class HTTPError(IOError):
+    """Non-2xx response from an HTTP endpoint"""
+    def __init__(self, status: int, reason: str, body: bytes = b''):
+        super().__init__(
+            f"HTTP {status} {reason}: {body[:200].decode('utf-8', errors='replace')}"
+        )
+        self.status = status
+        self.reason = reason
+        self.body = body
+
+class HTTPResponse:
+    """Status line and headers of a response whose body arrives as a stream of chunks"""
+    def __init__(
+        self,
+        status: int,
+        reason: str,
+        headers: Dict[str, str],
+        connection: '_PooledConnection',
+    ):
+        self.status = status
+        self.reason = reason
+        self.headers = headers
+        self.done = False
+        self._connection = connection
+        self._chunks: asyncio.Queue = asyncio.Queue()
+
+    def _feed(self, chunk: Union[bytes, BaseException, None]):
+        self._chunks.put_nowait(chunk)
+
+    async def iter_chunks(self) -> AsyncIterator[bytes]:
+        while not self.done:
+            chunk = await self._chunks.get()
+            if chunk is None:
+                self.done = True
+            elif isinstance(chunk, BaseException):
+                self.done = True
+                raise chunk
+            else:
+                yield chunk
+
+    async def iter_lines(self) -> AsyncIterator[bytes]:
+        """Body split on newlines, as for newline-delimited JSON"""
+        buffer = b''
+        async for chunk in self.iter_chunks():
+            buffer += chunk
+            *lines, buffer = buffer.split(b'\n')
+            for line in lines:
+                yield line
+        if buffer:
+            yield buffer
+
+    async def read(self) -> bytes:
+        return b''.join([chunk async for chunk in self.iter_chunks()])
+
+    async def json(self) -> Any:
+        return json.loads(await self.read())
+
+    def abort(self):
+        """Stop receiving the body by dropping the connection.
+        Requests pipelined behind it are retried."""
+        if not self.done:
+            self.done = True
+            self._connection.close(ConnectionResetError("Response aborted"))
+
+class _PooledConnection:
+    """
+    One keep-alive connection. Requests are written as soon as they are sent and
+    a reader task matches responses to them in order, so several can be in flight.
+    `streams` counts those sent with stream=True, whose bodies may take a long time.
+    """
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 timeout: Optional[float], on_free: Callable[[], None]):
+        self.reader = reader
+        self.writer = writer
+        self.timeout = timeout
+        self.closed = False
+        self.pending: 'deque[asyncio.Future]' = deque()
+        self._streaming: 'deque[bool]' = deque()  # parallel to pending
+        self.streams = 0
+        self._on_free = on_free
+        self._current: Optional[HTTPResponse] = None
+        self._wakeup = asyncio.Event()
+        self._task = asyncio.ensure_future(self._read_responses())
+
+    @property
+    def inflight(self) -> int:
+        return len(self.pending)
+
+    async def send(self, data: bytes, stream: bool = False) -> HTTPResponse:
+        """Write a request and wait for its response head"""
+        if self.closed:
+            raise ConnectionResetError("Connection closed")
+        future = asyncio.get_running_loop().create_future()
+        self.pending.append(future)
+        self._streaming.append(stream)
+        self.streams += stream
+        self.writer.write(data)
+        self._wakeup.set()
+        try:
+            await self.writer.drain()
+        except ConnectionError as exc:
+            self.close(exc)  # fails this request's future too
+        return await future
+
+    async def _read(self, operation: Awaitable[bytes]) -> bytes:
+        return await asyncio.wait_for(operation, self.timeout)
+
+    async def _read_responses(self):
+        error: Optional[BaseException] = None
+        try:
+            while not self.closed:
+                if not self.pending:
+                    self._wakeup.clear()
+                    await self._wakeup.wait()
+                    continue
+                status_line = await self._read(self.reader.readline())
+                if not status_line:
+                    raise ConnectionResetError("Connection closed by server")
+                _, status, reason = (
+                    status_line.decode('latin-1').rstrip('\r\n').split(' ', 2) + ['']
+                )[:3]
+                headers: Dict[str, str] = {}
+                while (line := await self._read(self.reader.readline())) not in (
+                    b'\r\n',
+                    b'\n',
+                    b'',
+                ):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                response = self._current = HTTPResponse(
+                    int(status), reason, headers, self
+                )
+                future = self.pending[0]
+                if not future.done():
+                    future.set_result(response)
+                keep_alive = await self._read_body(response)
+                if self.closed:
+                    return  # aborted while the body was streaming
+                self._current = None
+                self.pending.popleft()
+                self.streams -= self._streaming.popleft()
+                self._on_free()
+                if not keep_alive:
+                    break
+        except (
+            OSError,
+            EOFError,
+            ValueError,
+            asyncio.TimeoutError,
+            asyncio.IncompleteReadError,
+        ) as exc:
+            error = exc
+        self.close(error)
+
+    async def _read_body(self, response: HTTPResponse) -> bool:
+        """Feed the body into the response; returns whether the connection is free"""
+        headers = response.headers
+        if headers.get('transfer-encoding', '').lower() == 'chunked':
+            while True:
+                size = int(
+                    (await self._read(self.reader.readline())).split(b';')[0].strip()
+                    or b'0',
+                    16,
+                )
+                if size == 0:
+                    while (await self._read(self.reader.readline())) not in (
+                        b'\r\n',
+                        b'\n',
+                        b'',
+                    ):
+                        pass  # trailers
+                    break
+                response._feed(await self._read(self.reader.readexactly(size)))
+                await self._read(self.reader.readexactly(2))
+        elif 'content-length' in headers:
+            remaining = int(headers['content-length'])
+            while remaining:
+                chunk = await self._read(self.reader.read(min(remaining, 1 << 16)))
+                if not chunk:
+                    raise ConnectionResetError("Connection closed mid-body")
+                response._feed(chunk)
+                remaining -= len(chunk)
+        elif response.status >= 200 and response.status not in (204, 304):
+            while chunk := await self._read(self.reader.read(1 << 16)):
+                response._feed(chunk)
+            response._feed(None)
+            return False
+        response._feed(None)
+        return headers.get('connection', '').lower() != 'close'
+
+    def close(self, error: Optional[BaseException] = None):
+        if self.closed:
+            return
+        self.closed = True
+        failure = error or ConnectionResetError("Connection closed")
+        if self._current is not None and not self._current.done:
+            self._current._feed(failure)
+        for position, future in enumerate(self.pending):
+            if future.done():
+                continue
+            if position == 0 and isinstance(error, asyncio.TimeoutError):
+                future.set_exception(error)  # the request that timed out is not retried
+            else:
+                # Never got a response head, so the pool may retry it
+                future.set_exception(ConnectionResetError(str(failure)))
+        self.pending.clear()
+        self._streaming.clear()
+        self.streams = 0
+        self.writer.close()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._on_free()
+
+class HTTPConnectionPool:
+    """
+    asyncio HTTP/1.1 client for a single host. Connections are kept alive and
+    reused, at most max_connections are opened, and once they are all busy up
+    to pipeline_depth requests are pipelined on each. Nothing is pipelined onto
+    a connection carrying a stream=True request, so a long streamed body never
+    holds up the requests behind it. connect_timeout bounds connecting and
+    timeout bounds every wait for response bytes. A request whose connection
+    drops before its response starts is retried once.
+    """
+    def __init__(
+        self,
+        host: str,
+        port: int,
+        max_connections: int = 8,
+        pipeline_depth: int = 4,
+        timeout: Optional[float] = 60.0,
+        connect_timeout: Optional[float] = 5.0,
+    ):
+        self.host = host
+        self.port = port
+        self.max_connections = max_connections
+        self.pipeline_depth = max(pipeline_depth, 1)
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self._connections: List[_PooledConnection] = []
+        self._connecting = 0
+        self._freed = asyncio.Event()
+
+    def _notify_free(self):
+        self._freed.set()
+
+    async def _acquire(self) -> _PooledConnection:
+        while True:
+            self._connections = [c for c in self._connections if not c.closed]
+            idle = next((c for c in self._connections if not c.inflight), None)
+            if idle is not None:
+                return idle
+            if len(self._connections) + self._connecting < self.max_connections:
+                self._connecting += 1
+                try:
+                    reader, writer = await asyncio.wait_for(
+                        asyncio.open_connection(self.host, self.port),
+                        self.connect_timeout,
+                    )
+                finally:
+                    self._connecting -= 1
+                connection = _PooledConnection(
+                    reader, writer, self.timeout, self._notify_free
+                )
+                self._connections.append(connection)
+                return connection
+            shared = [c for c in self._connections if not c.streams]
+            if shared:
+                least = min(shared, key=lambda c: c.inflight)
+                if least.inflight < self.pipeline_depth:
+                    return least
+            self._freed.clear()
+            await self._freed.wait()
+
+    def _encode(
+        self, method: str, path: str, body: bytes, headers: Optional[Dict[str, str]]
+    ) -> bytes:
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {self.host}:{self.port}",
+                 "Connection: keep-alive", f"Content-Length: {len(body)}"]
+        lines.extend(f"{name}: {value}" for name, value in (headers or {}).items())
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1') + body
+
+    async def request(
+        self,
+        method: str,
+        path: str,
+        body: bytes = b'',
+        headers: Optional[Dict[str, str]] = None,
+        stream: bool = False,
+    ) -> HTTPResponse:
+        """Send a request and return once its response head arrives; the body
+        streams from the response. Pass stream=True when the body may take long,
+        so no request is pipelined behind it.
+        """
+        data = self._encode(method, path, body, headers)
+        for attempt in range(2):
+            connection = await self._acquire()
+            try:
+                return await connection.send(data, stream)
+            except (ConnectionResetError, BrokenPipeError):
+                if attempt:
+                    raise
+
+    async def post_json(self, path: str, payload: Any) -> Any:
+        """POST a JSON document and decode the reply; HTTPError on a non-2xx status"""
+        response = await self.request("POST", path, json.dumps(payload).encode(),
+                                      {'Content-Type': 'application/json'})
+        body = await response.read()
+        if not 200 <= response.status < 300:
+            raise HTTPError(response.status, response.reason, body)
+        return json.loads(body)
+
+    async def close(self):
+        for connection in self._connections:
+            connection.close()
+        self._connections = []
+
+class EmbeddingBatcher:
+    """
+    Coalesces concurrent embedding requests into batched calls. Requests for one
+    model gather for up to `window` seconds, or until max_batch are waiting, then
+    go out together as one /api/embed call with an "input" list; at most
+    max_inflight batches are outstanding. Servers without /api/embed (404) are
+    served one /api/embeddings request per text instead.
+    """
+    def __init__(
+        self,
+        http: 'HTTPConnectionPool',
+        max_batch: int = 32,
+        window: float = 0.002,
+        max_inflight: int = 4,
+    ):
+        if max_batch < 1 or max_inflight < 1:
+            raise ValueError("Batch size and in-flight limit must be at least one")
+        self.http = http
+        self.max_batch = max_batch
+        self.window = window
+        self.batch_endpoint = True
+        self._pending: Dict[str, List[Tuple[str, asyncio.Future]]] = {}
+        self._timers: Dict[str, asyncio.TimerHandle] = {}
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._tasks: Set[asyncio.Task] = set()
+        self.batches = self.items = 0
+
+    async def embed(self, text: str, model: str) -> array:
+        future = asyncio.get_running_loop().create_future()
+        waiting = self._pending.setdefault(model, [])
+        waiting.append((text, future))
+        if len(waiting) >= self.max_batch:
+            self._flush(model)
+        elif model not in self._timers:
+            self._timers[model] = asyncio.get_running_loop().call_later(
+                self.window, self._flush, model
+            )
+        return await future
+
+    def _flush(self, model: str):
+        timer = self._timers.pop(model, None)
+        if timer is not None:
+            timer.cancel()
+        waiting = self._pending.pop(model, [])
+        for start in range(0, len(waiting), self.max_batch):
+            task = asyncio.ensure_future(
+                self._send(model, waiting[start:start + self.max_batch])
+            )
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, model: str, batch: List[Tuple[str, asyncio.Future]]):
+        batch = [(text, future) for text, future in batch if not future.done()]
+        if not batch:
+            return
+        async with self._slots:
+            self.batches += 1
+            self.items += len(batch)
+            try:
+                embeddings = await self._request(model, [text for text, _ in batch])
+            except Exception as exc:
+                for _, future in batch:
+                    if not future.done():
+                        future.set_exception(exc)
+                return
+        for (_, future), embedding in zip(batch, embeddings):
+            if not future.done():
+                future.set_result(array('f', embedding))
+
+    async def _request(self, model: str, texts: List[str]) -> List[List[float]]:
+        if self.batch_endpoint:
+            try:
+                result = await self.http.post_json(
+                    "/api/embed", {"model": model, "input": texts}
+                )
+            except HTTPError as exc:
+                if exc.status != 404:
+                    raise
+                self.batch_endpoint = False
+            else:
+                if len(result['embeddings']) != len(texts):
+                    raise ValueError(
+                        f"Asked for {len(texts)} embeddings, "
+                        f"got {len(result['embeddings'])}"
+                    )
+                return result['embeddings']
+        results = await asyncio.gather(
+            *(
+                self.http.post_json("/api/embeddings", {"model": model, "prompt": text})
+                for text in texts
+            )
+        )
+        return [result['embedding'] for result in results]
+
+    async def close(self):
+        """Send anything still waiting and let outstanding batches finish"""
+        for model in list(self._pending):
+            self._flush(model)
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        return {
+            'batches': self.batches,
+            'items': self.items,
+            'mean_batch': self.items / self.batches if self.batches else 0.0,
+            'waiting': sum(len(waiting) for waiting in self._pending.values()),
+        }
+
+class InferenceCache:
+    """
+    LRU of finished generations keyed by model, prompt and a digest of the
+    context, each entry expiring `ttl` seconds after it was stored. Concurrent
+    misses on one key share a single upstream call.
+    """
+    def __init__(self, capacity: int = 256, ttl: Optional[float] = 300.0):
+        if capacity < 1:
+            raise ValueError("Capacity must be at least one entry")
+        self.capacity = capacity
+        self.ttl = ttl
+        self._entries: 'OrderedDict[str, Tuple[float, str]]' = (
+            OrderedDict()
+        )  # key -> (expiry, response)
+        self._inflight: Dict[str, asyncio.Future] = {}
+        self.hits = self.misses = self.coalesced = self.expirations = self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @staticmethod
+    def key(model: str, prompt: str, context: Optional[List[bytes]] = None) -> str:
+        digest = hashlib.sha256()
+        for part in (model.encode('utf-8'), prompt.encode('utf-8'), *(context or ())):
+            # Length-prefixed so no two splits of the same bytes collide
+            digest.update(struct.pack('<Q', len(part)))
+            digest.update(part)
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        expiry, response = entry
+        if time.monotonic() >= expiry:
+            del self._entries[key]
+            self.expirations += 1
+            return None
+        self._entries.move_to_end(key)
+        return response
+
+    def put(self, key: str, response: str):
+        expiry = time.monotonic() + self.ttl if self.ttl is not None else math.inf
+        self._entries[key] = (expiry, response)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.capacity:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    async def get_or_compute(
+        self, key: str, compute: Callable[[], Awaitable[str]]
+    ) -> str:
+        """Return the cached response, or await compute() once for all callers"""
+        response = self.get(key)
+        if response is not None:
+            self.hits += 1
+            return response
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.coalesced += 1
+            return await asyncio.shield(pending)
+        self.misses += 1
+        pending = asyncio.ensure_future(compute())
+        self._inflight[key] = pending
+        pending.add_done_callback(lambda task: self._settle(key, task))
+        return await asyncio.shield(pending)
+
+    def _settle(self, key: str, task: asyncio.Future):
+        del self._inflight[key]
+        if not task.cancelled() and task.exception() is None:
+            self.put(key, task.result())
+
+    def clear(self):
+        self._entries.clear()
+
+    def stats(self) -> Dict[str, Union[int, float]]:
+        lookups = self.hits + self.coalesced + self.misses
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'coalesced': self.coalesced,
+            'hit_rate': (lookups - self.misses) / lookups if lookups else 0.0,
+            'expirations': self.expirations,
+            'evictions': self.evictions,
+            'entries': len(self._entries),
+        }
+
+class InferenceStream:
+    """
+    Tokens of one streamed /api/generate call, as an async iterator. The request
+    goes out on first iteration. Records time to first token and decode rate;
+    cancel() drops the connection rather than reading the remaining chunks, and
+    leaving an `async with` block early does the same.
+    """
+    def __init__(self, http: 'HTTPConnectionPool', payload: Dict):
+        self.http = http
+        self.payload = payload
+        self.response: Optional[HTTPResponse] = None
+        self.final: Dict = {}  # the closing "done" chunk, with Ollama's own counters
+        self.tokens = 0
+        self.done = self.cancelled = False
+        self.started = self.first_token_at = self.last_token_at = None
+        self._lines: Optional[AsyncIterator[bytes]] = None
+
+    def __aiter__(self) -> 'InferenceStream':
+        return self
+
+    async def __aenter__(self) -> 'InferenceStream':
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.aclose()
+
+    async def _open(self):
+        self.started = time.perf_counter()
+        self.response = await self.http.request(
+            "POST",
+            "/api/generate",
+            json.dumps(self.payload).encode(),
+            {'Content-Type': 'application/json'},
+            stream=True,
+        )
+        if not 200 <= self.response.status < 300:
+            self.done = True
+            raise HTTPError(
+                self.response.status, self.response.reason, await self.response.read()
+            )
+        self._lines = self.response.iter_lines()
+
+    async def __anext__(self) -> str:
+        if self.done:
+            raise StopAsyncIteration
+        try:
+            if self._lines is None:
+                await self._open()
+            while True:
+                line = await self._lines.__anext__()
+                if not line.strip():
+                    continue
+                chunk = json.loads(line)
+                if chunk.get('done'):
+                    self.final = chunk
+                    raise StopAsyncIteration
+                token = chunk.get('response', '')
+                if token:
+                    self.last_token_at = time.perf_counter()
+                    if self.first_token_at is None:
+                        self.first_token_at = self.last_token_at
+                    self.tokens += 1
+                    return token
+        except StopAsyncIteration:
+            self.done = True
+            raise
+        except asyncio.CancelledError:
+            self.cancel()
+            raise
+
+    def cancel(self):
+        """Stop generation partway; the tokens already yielded stand"""
+        if not self.done:
+            self.done = self.cancelled = True
+            if self.response is not None:
+                self.response.abort()
+
+    async def aclose(self):
+        self.cancel()
+        if self._lines is not None:
+            await self._lines.aclose()
+
+    @property
+    def time_to_first_token(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return self.first_token_at - self.started
+
+    @property
+    def tokens_per_second(self) -> Optional[float]:
+        """Decode rate after the first token"""
+        if self.tokens < 2 or self.last_token_at == self.first_token_at:
+            return None
+        return (self.tokens - 1) / (self.last_token_at - self.first_token_at)
+
+    def stats(self) -> Dict[str, Union[int, float, bool, None]]:
+        return {
+            'tokens': self.tokens,
+            'time_to_first_token': self.time_to_first_token,
+            'tokens_per_second': self.tokens_per_second,
+            'done': self.done,
+            'cancelled': self.cancelled,
+        }
+
+class OllamaStub:
+    """
+    Local stand-in for the Ollama endpoints InferenceHead calls, for offline
+    benchmarks. Speaks keep-alive HTTP/1.1, answers pipelined requests in order,
+    returns deterministic pseudo-random embeddings of `dim` floats (singly from
+    /api/embeddings, as a list from /api/embed), and
+    generates `tokens` tokens, streamed as newline-delimited JSON unless the
+    request sets "stream": false.
+    """
+    def __init__(
+        self,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        dim: int = 4096,
+        tokens: int = 32,
+        token_delay: float = 0.0,
+        latency: float = 0.0,
+    ):
+        self.host = host
+        self.port = port
+        self.dim = dim
+        self.tokens = tokens
+        self.token_delay = token_delay
+        self.latency = latency
+        self.requests = 0
+        self._server: Optional[asyncio.AbstractServer] = None
+        self._clients: Dict[asyncio.Task, asyncio.StreamWriter] = {}
+
+    async def start(self) -> 'OllamaStub':
+        self._server = await asyncio.start_server(self._serve, self.host, self.port)
+        self.port = self._server.sockets[0].getsockname()[1]
+        return self
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            for writer in self._clients.values():
+                writer.close()
+            await asyncio.gather(*self._clients, return_exceptions=True)
+            await self._server.wait_closed()
+
+    async def __aenter__(self) -> 'OllamaStub':
+        return await self.start()
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def embedding(self, model: str, text: str) -> List[float]:
+        rng = random.Random(
+            hashlib.blake2b(f"{model}\0{text}".encode(), digest_size=8).digest()
+        )
+        return [rng.gauss(0.0, 1.0) for _ in range(self.dim)]
+
+    def completion(self, prompt: str) -> List[str]:
+        words = prompt.split() or ["..."]
+        return [f" {words[i % len(words)]}" for i in range(self.tokens)]
+
+    async def _serve(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        task = asyncio.current_task()
+        self._clients[task] = writer
+        try:
+            while request_line := await reader.readline():
+                method, path, _ = request_line.decode('latin-1').split(' ', 2)
+                headers: Dict[str, str] = {}
+                while (line := await reader.readline()) not in (b'\r\n', b'\n', b''):
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip()
+                body = await reader.readexactly(int(headers.get('content-length', 0)))
+                self.requests += 1
+                if self.latency:
+                    await asyncio.sleep(self.latency)
+                await self._respond(writer, method, path, json.loads(body or b'{}'))
+                if headers.get('connection', '').lower() == 'close':
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError, ValueError):
+            pass
+        finally:
+            del self._clients[task]
+            writer.close()
+
+    @staticmethod
+    def _head(status: int, reason: str, headers: Dict[str, str]) -> bytes:
+        lines = [f"HTTP/1.1 {status} {reason}"] + [
+            f"{name}: {value}" for name, value in headers.items()
+        ]
+        return ('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1')
+
+    async def _send_json(
+        self,
+        writer: asyncio.StreamWriter,
+        payload: Any,
+        status: int = 200,
+        reason: str = "OK",
+    ):
+        body = json.dumps(payload).encode()
+        writer.write(
+            self._head(
+                status,
+                reason,
+                {'Content-Type': 'application/json', 'Content-Length': str(len(body))},
+            )
+            + body
+        )
+        await writer.drain()
+
+    async def _respond(
+        self, writer: asyncio.StreamWriter, method: str, path: str, payload: Dict
+    ):
+        model = payload.get('model', '')
+        if method == "POST" and path == "/api/embeddings":
+            await self._send_json(
+                writer, {'embedding': self.embedding(model, payload.get('prompt', ''))}
+            )
+        elif method == "POST" and path == "/api/embed":
+            texts = payload.get('input', '')
+            texts = [texts] if isinstance(texts, str) else texts
+            await self._send_json(
+                writer,
+                {
+                    'model': model,
+                    'embeddings': [self.embedding(model, text) for text in texts],
+                },
+            )
+        elif method == "POST" and path == "/api/generate":
+            tokens = self.completion(payload.get('prompt', ''))
+            if not payload.get('stream', True):
+                await asyncio.sleep(self.token_delay * len(tokens))
+                await self._send_json(
+                    writer,
+                    {
+                        'model': model,
+                        'response': ''.join(tokens),
+                        'done': True,
+                        'eval_count': len(tokens),
+                    },
+                )
+                return
+            writer.write(self._head(200, "OK", {'Content-Type': 'application/x-ndjson',
+                                                'Transfer-Encoding': 'chunked'}))
+            chunks = [
+                {'model': model, 'response': token, 'done': False} for token in tokens
+            ]
+            chunks.append(
+                {
+                    'model': model,
+                    'response': '',
+                    'done': True,
+                    'eval_count': len(tokens),
+                }
+            )
+            for chunk in chunks:
+                if self.token_delay:
+                    await asyncio.sleep(self.token_delay)
+                line = json.dumps(chunk).encode() + b'\n'
+                writer.write(b'%x\r\n%s\r\n' % (len(line), line))
+                await writer.drain()
+            writer.write(b'0\r\n\r\n')
+            await writer.drain()
+        else:
+            await self._send_json(
+                writer, {'error': f"{method} {path} not found"}, 404, "Not Found"
+            )
+
+
+async def benchmark_http(
+    requests: int = 2000,
+    concurrency: int = 64,
+    max_connections: int = 8,
+    pipeline_depth: int = 4,
+    dim: int = 256,
+) -> Dict[str, float]:
+    """
+    Embedding requests per second against a local OllamaStub, through the pool
+    versus a fresh blocking connection per request as InferenceHead used to do.
+    """
+    async with OllamaStub(dim=dim) as stub:
+        pool = HTTPConnectionPool(stub.host, stub.port, max_connections, pipeline_depth)
+        limit = asyncio.Semaphore(concurrency)
+
+        async def embed(i: int):
+            async with limit:
+                await pool.post_json(
+                    "/api/embeddings", {'model': 'stub', 'prompt': f"text {i}"}
+                )
+
+        start = time.perf_counter()
+        await asyncio.gather(*(embed(i) for i in range(requests)))
+        pooled = time.perf_counter() - start
+        await pool.close()
+
+        def per_request(count: int):
+            for i in range(count):
+                conn = http.client.HTTPConnection(stub.host, stub.port)
+                conn.request(
+                    "POST",
+                    "/api/embeddings",
+                    json.dumps({'model': 'stub', 'prompt': f"text {i}"}),
+                    {'Content-Type': 'application/json'},
+                )
+                json.loads(conn.getresponse().read())
+                conn.close()
+
+        baseline_requests = max(requests // 10, 1)
+        start = time.perf_counter()
+        await asyncio.get_running_loop().run_in_executor(
+            None, per_request, baseline_requests
+        )
+        baseline = time.perf_counter() - start
+    return {
+        'pooled_rps': requests / pooled,
+        'per_request_rps': baseline_requests / baseline,
+    }
+
+
+async def benchmark_embedding_batches(
+    requests: int = 2000,
+    concurrency: int = 256,
+    max_batch: int = 32,
+    window: float = 0.002,
+    latency: float = 0.005,
+    dim: int = 256,
+) -> Dict[str, float]:
+    """
+    Embeddings per second through EmbeddingBatcher versus one /api/embeddings
+    request each, against a local OllamaStub adding `latency` per request.
+    """
+    async with OllamaStub(dim=dim, latency=latency) as stub:
+        pool = HTTPConnectionPool(stub.host, stub.port)
+        batcher = EmbeddingBatcher(pool, max_batch, window)
+        limit = asyncio.Semaphore(concurrency)
+
+        async def batched(i: int):
+            async with limit:
+                await batcher.embed(f"text {i}", 'stub')
+
+        async def single(i: int):
+            async with limit:
+                await pool.post_json(
+                    "/api/embeddings", {'model': 'stub', 'prompt': f"text {i}"}
+                )
+
+        start = time.perf_counter()
+        await asyncio.gather(*(batched(i) for i in range(requests)))
+        batched_time = time.perf_counter() - start
+        start = time.perf_counter()
+        await asyncio.gather(*(single(i) for i in range(requests)))
+        single_time = time.perf_counter() - start
+        await pool.close()
+    return {
+        'batched_eps': requests / batched_time,
+        'single_eps': requests / single_time,
+        'mean_batch': batcher.stats()['mean_batch'],
+    }
+
 
 class InferenceHead(MemoryHead):
-    def __init__(self, vmem: 'VirtualMemoryFS', ollama_host: str = "localhost", ollama_port: int = 11434):
+
+    def __init__(
+        self,
+        vmem: 'VirtualMemoryFS',
+        ollama_host: str = "localhost",
+        ollama_port: int = 11434,
+        index: Optional[Union[EmbeddingMatrix, IVFFlatIndex]] = None,
+        embedding_dtype: str = 'float32',
+        store_path: Optional[Union[str, Path]] = None,
+        max_connections: int = 8,
+        pipeline_depth: int = 4,
+        timeout: Optional[float] = 120.0,
+        embedding_cache: Optional[EmbeddingCache] = None,
+        embedding_batch: int = 32,
+        embedding_window: float = 0.002,
+        inference_cache: Optional[InferenceCache] = None,
+        embedding_rescore: Optional[int] = None,
+    ):
         super().__init__(vmem)
         self.ollama_host = ollama_host
         self.ollama_port = ollama_port
+        self.http = HTTPConnectionPool(
+            ollama_host, ollama_port, max_connections, pipeline_depth, timeout
+        )
+        self.inference_cache = (
+            inference_cache if inference_cache is not None else InferenceCache()
+        )
+        self.embedder = EmbeddingBatcher(self.http, embedding_batch, embedding_window)
+        # Pass EmbeddingCache(path) to keep embeddings across runs; the default
+        # lives in memory only
+        self.embedding_cache = (
+            embedding_cache if embedding_cache is not None else EmbeddingCache()
+        )
+        # Embeddings written through this head persist here, and quantized
+        # indexes rescore from it
+        self.store = EmbeddingStore(store_path) if store_path else None
+        # One index over every segment, keyed by full address; it holds the only
+        # in-memory copy of each embedding. A quantized index rescores from the
+        # store's mapped matrix when there is one. Without a store,
+        # embedding_rescore > 0 opts in to keeping a full-precision copy as well.
+        if embedding_rescore is None:
+            embedding_rescore = 4 if self.store is not None else 0
+        if index is None:
+            if np is not None:
+                # Trained in an executor by write_with_embedding, not inside add()
+                index = IVFFlatIndex(
+                    dtype=embedding_dtype,
+                    rescore=embedding_rescore,
+                    full_store=self.store,
+                    auto_train=False,
+                )
+            else:
+                index = EmbeddingMatrix(embedding_dtype, embedding_rescore, self.store)
+        self.index = index
+        self._training: Optional[asyncio.Future] = None
+        self._store_flush_pending = False
         self._init_embedding_segments()
+        if self.store is not None:
+            self._restore_embeddings()
 
     def _init_embedding_segments(self):
-        """Initialize segments as EmbeddingSegments"""
+        """Initialize segments as EmbeddingSegments sharing the head's index"""
         for addr in range(0x100):
-            self.vmem._segments[addr] = EmbeddingSegment()
+            self.vmem._segments[addr] = EmbeddingSegment(
+                self.index, addr << 8, self.store
+            )
+
+    def _restore_embeddings(self):
+        """Reload embeddings persisted by earlier runs into the segments and index"""
+        for address, cell in self.store.items():
+            segment = self.vmem._segments[(address >> 8) & 0xFF]
+            segment.write(address & 0xFF, cell.value, cell.embedding)
+            segment.cells[address & 0xFF].metadata = cell.metadata
+        # Train once for the whole restore rather than at every growth step
+        if getattr(self.index, 'needs_training', False):
+            self.index.train()
+
+    def _schedule_training(self):
+        """Retrain the index centroids in a worker thread once it has grown enough,
+        one training at a time"""
+        if not getattr(self.index, 'needs_training', False):
+            return
+        if self._training is not None and not self._training.done():
+            return
+        self._training = asyncio.get_running_loop().run_in_executor(
+            None, self.index.train
+        )
+
+    def _schedule_store_flush(self):
+        """Flush the store once the writes woken by the same embedding batch have
+        appended, so a crash loses at most that batch"""
+        if not self._store_flush_pending:
+            self._store_flush_pending = True
+            asyncio.get_running_loop().call_soon(self._flush_store)
+
+    def _flush_store(self):
+        if self._store_flush_pending:
+            self._store_flush_pending = False
+            self.store.flush()
 
     async def generate_embedding(self, text: str, model: str = "llama3.1") -> array:
-        """Generate embedding using Ollama API"""
-        conn = http.client.HTTPConnection(self.ollama_host, self.ollama_port)
-        headers = {'Content-Type': 'application/json'}
-        body = json.dumps({"model": model, "prompt": text})
-        
-        conn.request("POST", "/api/embeddings", body, headers)
-        response = conn.getresponse()
-        embedding_data = json.loads(response.read().decode())
-        conn.close()
-        
-        # Convert to standard library array instead of numpy
-        return array('f', embedding_data['embedding'])
+        """Generate embedding using Ollama API, served from the cache when possible"""
+        return await self.embedding_cache.get_or_compute(
+            model, text, lambda: self._fetch_embedding(text, model)
+        )
+
+    async def _fetch_embedding(self, text: str, model: str) -> array:
+        return await self.embedder.embed(text, model)
 
-    async def infer(self, prompt: str, model: str = "llama3.1", context: Optional[List[bytes]] = None) -> str:
-        """Run inference using Ollama API with optional context"""
+    @staticmethod
+    def _prompt(prompt: str, context: Optional[List[bytes]]) -> str:
         context_text = ""
         if context:
             context_text = "\n".join([bytes.decode('utf-8', errors='ignore') for bytes in context])
-            
-        full_prompt = f"{context_text}\n{prompt}" if context_text else prompt
-        
-        conn = http.client.HTTPConnection(self.ollama_host, self.ollama_port)
-        headers = {'Content-Type': 'application/json'}
-        body = json.dumps({"model": model, "prompt": full_prompt})
-        
-        conn.request("POST", "/api/generate", body, headers)
-        response = conn.getresponse()
-        result = json.loads(response.read().decode())
-        conn.close()
-        
+        return f"{context_text}\n{prompt}" if context_text else prompt
+
+    async def infer(
+        self,
+        prompt: str,
+        model: str = "llama3.1",
+        context: Optional[List[bytes]] = None,
+        cache: bool = True,
+    ) -> str:
+        """Run inference using Ollama API with optional context. Identical calls share
+        one cached generation; pass cache=False when sampling should differ per call."""
+        if not cache:
+            return await self._generate(prompt, model, context)
+        return await self.inference_cache.get_or_compute(
+            InferenceCache.key(model, prompt, context),
+            lambda: self._generate(prompt, model, context),
+        )
+
+    async def _generate(
+        self, prompt: str, model: str, context: Optional[List[bytes]]
+    ) -> str:
+        full_prompt = self._prompt(prompt, context)
+
+        result = await self.http.post_json(
+            "/api/generate", {"model": model, "prompt": full_prompt, "stream": False}
+        )
         return result['response']
+
+    def infer_stream(self, prompt: str, model: str = "llama3.1",
+                     context: Optional[List[bytes]] = None) -> InferenceStream:
+        """Like infer(), but yields tokens as they arrive:
+        async with head.infer_stream(prompt) as stream:
+            async for token in stream: ...
+        """
+        return InferenceStream(
+            self.http, {"model": model, "prompt": self._prompt(prompt, context)}
+        )
+
+    async def close(self):
+        """Finish queued embedding batches, cache writes and index training, then
+        close the embedding store and pooled connections"""
+        await self.embedder.close()
+        try:
+            await self.embedding_cache.drain()
+            if self._training is not None:
+                await self._training
+        finally:
+            if self.store is not None:
+                self._store_flush_pending = False
+                self.store.close()
+            await self.http.close()
        
     async def write_with_embedding(self, address: int, value: bytes, text: Optional[str] = None):
         """Write value with automatically generated embedding"""
@@ -345,22 +2738,30 @@ class InferenceHead(MemoryHead):
         segment = self.vmem._segments[segment_addr]
         
         if isinstance(segment, EmbeddingSegment):
+            if self.store is not None:
+                self.store.append(
+                    address, embedding, value, {'text': text} if text else {}
+                )
+                self._schedule_store_flush()
             segment.write(address & 0xFF, value, embedding)
+            self._schedule_training()
         else:
             # Fallback to normal write if segment doesn't support embeddings
             segment.write(address & 0xFF, value)
 
-    async def search_similar_across_segments(self, query_text: str, top_k: int = 5) -> List[tuple]:
-        """Search for similar content across all segments"""
+    async def search_similar_across_segments(
+        self, query_text: str, top_k: int = 5, exact: bool = False
+    ) -> List[tuple]:
+        """Search for similar content across all segments through the shared index.
+        exact=True forces a brute-force scan."""
         query_embedding = await self.generate_embedding(query_text)
-        results = []
-        
-        for segment_addr, segment in self.vmem._segments.items():
-            if isinstance(segment, EmbeddingSegment):
-                segment_results = segment.search_similar(query_embedding, top_k)
-                results.extend([(segment_addr, addr, sim) for addr, sim in segment_results])
-                
-        return sorted(results, key=lambda x: x[2], reverse=True)[:top_k]
+        return [
+            ((address >> 8) & 0xFF, address & 0xFF, similarity)
+            for address, similarity in self.index.search(
+                query_embedding, top_k, exact=exact
+            )
+        ]
+
 
 async def main():
     vmem = VirtualMemoryFS()
@@ -413,6 +2814,7 @@ async def main():
     await inference_head.write_with_embedding(0x1234, b'\x42', "test text")
     results = await inference_head.search_similar_across_segments("query text")
     print(results)
+    await inference_head.close()
 
 if __name__ == "__main__":
     async def run_vmem_operations():
@@ -0,0 +1,222 @@
+import itertools
+
+import pytest
+
+from src.classes import (
+    Atom,
+    AtomTable,
+    CompiledFormula,
+    FormalTheory,
+    HypercubeEmbedding,
+)
+
+
+def sample_atoms(count):
+    kinds = [lambda i: i, lambda i: i * 0.5, lambda i: f"s{i}", lambda i: [i, i + 1]]
+    return [
+        Atom('int' if i % 4 == 0 else 'other', kinds[i % 4](i)) for i in range(count)
+    ]
+
+
+# add_atoms (user-026)
+
+@pytest.mark.parametrize('count, chunk_size', [(0, 8), (7, 3), (250, 16), (1000, 4096)])
+def test_add_atoms_matches_add_atom(count, chunk_size):
+    atoms = sample_atoms(count)
+    one_by_one, batched = FormalTheory(), FormalTheory()
+    for atom in atoms:
+        one_by_one.add_atom(atom)
+    assert batched.add_atoms(iter(atoms), chunk_size=chunk_size) == count
+    assert batched.atom_count == one_by_one.atom_count
+    assert batched.value == one_by_one.value
+    assert (
+        batched.hypercube_embedding.hypercube
+        == one_by_one.hypercube_embedding.hypercube
+    )
+
+
+def test_embed_batch_matches_embed_bytecode():
+    cells = {(1, 2): b'\x01\x02\x03', (3, 4): b'\xff'}
+    single, batch = HypercubeEmbedding(M=4, K=5, N=6), HypercubeEmbedding(M=4, K=5, N=6)
+    for (stream, config), bytecode in cells.items():
+        single.embed_bytecode(bytecode, stream, config)
+    batch.embed_batch(cells)
+    assert batch.hypercube == single.hypercube
+
+
+# CompiledFormula (user-027)
+
+FORMULAS = [
+    ('→', ('∧', 'p', 'q'), 'p'),
+    ('∨', 'p', ('¬', 'p')),
+    ('∧', 'p', ('¬', 'p')),
+    ('↔', ('¬∧', 'p', 'q'), ('∨', ('¬', 'p'), ('¬', 'q'))),
+    ('¬∨', ('a', 'p', 'r'), ('contrapositive', 'q', True)),
+]
+
+
+def reference(theory, node, row):
+    if isinstance(node, bool):
+        return node
+    if isinstance(node, str):
+        return row[node]
+    symbol, *operands = node
+    return bool(
+        theory.case_base[symbol](*(reference(theory, op, row) for op in operands))
+    )
+
+
+@pytest.mark.parametrize('formula', FORMULAS)
+def test_compiled_formula_matches_case_base(formula):
+    theory = FormalTheory()
+    compiled = theory.compile_formula(formula)
+    rows = [
+        dict(zip(compiled.variables, bits))
+        for bits in itertools.product([False, True], repeat=len(compiled.variables))
+    ]
+    expected = [reference(theory, formula, row) for row in rows]
+    assert compiled.evaluate_batch(rows) == expected
+    assert compiled.is_satisfiable() == any(expected)
+    assert compiled.is_tautology() == all(expected)
+    assert compiled.count_models() == sum(expected)
+
+
+def test_compiled_formula_blocks_cover_truth_table():
+    formula = ('∨', ('∧', 'a', 'b'), ('∧', 'c', ('¬', 'd')))
+    compiled = CompiledFormula(formula)
+    whole = compiled.truth_table()
+    pieces = 0
+    for first, _, bits in compiled.iter_blocks(block_bits=2):
+        pieces |= bits << first
+    assert pieces == whole
+    assert compiled.count_models() == bin(whole).count('1')
+
+
+def test_compile_formula_rejects_unknown_operator():
+    with pytest.raises(ValueError):
+        FormalTheory().compile_formula(('xor', 'p', 'q'))
+
+
+# FormalTheory codec (user-028)
+
+def test_encode_decode_round_trip():
+    theory = FormalTheory()
+    theory.add_atoms(sample_atoms(40))
+    decoded = FormalTheory.decode(theory.encode())
+    assert list(decoded.case_base) == list(theory.case_base)
+    assert decoded.case_base['→'](True, False) is False
+    assert decoded.symmetry(3, 3)
+    assert decoded.hypercube_embedding.hypercube == theory.hypercube_embedding.hypercube
+
+
+def test_to_dict_from_dict_round_trip():
+    theory = FormalTheory()
+    theory.add_atoms(sample_atoms(9))
+    theory.complete_atom()
+    restored = FormalTheory.from_dict(theory.to_dict())
+    assert (restored.atom_count, restored.completed_atoms, restored.value) == \
+        (theory.atom_count, theory.completed_atoms, theory.value)
+    assert (
+        restored.hypercube_embedding.hypercube == theory.hypercube_embedding.hypercube
+    )
+
+
+def test_load_function_reuses_decoded_functions():
+    encoded = FormalTheory().encode()
+    first, second = FormalTheory.decode(encoded), FormalTheory.decode(encoded)
+    assert first.reflexivity is second.reflexivity
+
+
+def test_hypercube_decode_rejects_truncated_data():
+    data = HypercubeEmbedding(M=2, K=2, N=2).encode()
+    with pytest.raises(ValueError):
+        HypercubeEmbedding.decode(data[:-1])
+
+
+# AtomTable (user-029)
+
+def test_atom_table_round_trips_values_and_digests():
+    atoms = sample_atoms(50) + [Atom('big', 1 << 70)]
+    table = AtomTable.from_atoms(atoms)
+    assert len(table) == len(atoms)
+    assert table.values() == [atom.value for atom in atoms]
+    assert [view.type for view in table] == [atom.type for atom in atoms]
+    assert [view.to_atom() for view in table] == atoms
+    assert table[-1].digest == bytes.fromhex(atoms[-1].hash)[:AtomTable.DIGEST_SIZE]
+
+
+def test_atom_table_filter_take_group_dedup():
+    atoms = sample_atoms(40)
+    table = AtomTable.from_atoms(atoms + atoms[:10])
+    ints = table.filter(type='int')
+    assert ints.values() == [a.value for a in atoms + atoms[:10] if a.type == 'int']
+    assert table.filter(type='missing').values() == []
+    big = table.filter(lambda v: isinstance(v, int) and v > 20)
+    assert big.values() == [v for v in table.values() if isinstance(v, int) and v > 20]
+    assert table.take([3, 1, 3]).values() == [
+        atoms[3].value,
+        atoms[1].value,
+        atoms[3].value,
+    ]
+    assert table.dedup().values() == [a.value for a in atoms]
+    groups = table.group_by_type()
+    assert sorted(groups) == ['int', 'other']
+    assert sum(len(group) for group in groups.values()) == len(table)
+
+
+def test_atom_table_msgpack_round_trip():
+    table = AtomTable.from_atoms(sample_atoms(30))
+    restored = AtomTable.from_msgpack(table.to_msgpack())
+    assert restored.values() == table.values()
+    assert [v.digest for v in restored] == [v.digest for v in table]
+
+
+def mixed_table():
+    table = AtomTable()
+    table.extend_values('int', [3, -1, 1 << 70, 3])
+    table.extend_values('float', [0.5, 2.5, 0.5])
+    table.extend_values('str', ['a', 'b', 'a'])
+    table.extend_values('list', [[1, 2], [1, 2]])
+    table.extend_values('int', [7, -1])
+    return table
+
+
+def snapshot(table):
+    return [(view.type, view.value, view.digest) for view in table]
+
+
+@pytest.mark.parametrize('use_numpy', [True, False])
+def test_atom_table_selections_with_and_without_numpy(monkeypatch, use_numpy):
+    import src.classes as classes
+    if not use_numpy:
+        monkeypatch.setattr(classes, 'np', None)
+    elif classes.np is None:
+        pytest.skip("numpy not installed")
+    table = mixed_table()
+    rows = snapshot(table)
+    assert snapshot(table.take([5, 0, -1, 0])) == [rows[5], rows[0], rows[-1], rows[0]]
+    assert snapshot(table.take(())) == []
+    assert snapshot(table.filter(type='int')) == [r for r in rows if r[0] == 'int']
+    assert snapshot(table.filter(lambda v: v == 0.5 or v == [1, 2])) == \
+        [r for r in rows if r[1] == 0.5 or r[1] == [1, 2]]
+    seen, expected = set(), []
+    for row in rows:
+        if row[2] not in seen:
+            seen.add(row[2])
+            expected.append(row)
+    assert snapshot(table.dedup()) == expected
+    groups = table.group_by_type()
+    assert list(groups) == ['int', 'float', 'str', 'list']
+    assert snapshot(groups['int']) == [r for r in rows if r[0] == 'int']
+    assert table.filter(type='int').take([1]).values() == [-1]
+
+
+def test_atom_table_dedup_compares_whole_digests():
+    table = AtomTable()
+    table.type_names, table._type_index = ['int'], {'int': 0}
+    for digest in (b'A' * 8 + b'x' * 8, b'A' * 8 + b'y' * 8, b'A' * 8 + b'x' * 8):
+        table._append(0, 1, digest)
+    assert [view.digest for view in table.dedup()] == [
+        b'A' * 8 + b'x' * 8,
+        b'A' * 8 + b'y' * 8,
+    ]
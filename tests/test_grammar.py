@@ -0,0 +1,441 @@
+import random
+from array import array
+from collections import OrderedDict
+
+import pytest
+
+from src import grammar
+from src.grammar import (
+    TAG_BIGINT,
+    TAG_FLOAT64_ARRAY,
+    TAG_INT64_ARRAY,
+    TAG_INTEGER,
+    TAG_LIST,
+    TAG_STRING_ARRAY,
+    AtomDataclass,
+    GrammarParser,
+    GrammarRule,
+    Lexer,
+    ParseError,
+    ParseTreeAtom,
+    atom_lexer,
+    atom_terminal_rules,
+    compile_grammar,
+    decode_tlv,
+    encode_tlv,
+)
+
+
+LIST_RULES = [
+    GrammarRule('LIST', ['[', 'ELEMENTS', ']']),
+    GrammarRule('ELEMENTS', ['VALUE', 'REST']),
+    GrammarRule('ELEMENTS', []),
+    GrammarRule('REST', [',', 'VALUE', 'REST']),
+    GrammarRule('REST', []),
+    GrammarRule('VALUE', ['INTEGER']),
+    GrammarRule('VALUE', ['STRING']),
+    GrammarRule('VALUE', ['LIST']),
+]
+# Left-recursive, so not LL(1)
+SUM_RULES = [
+    GrammarRule('SUM', ['SUM', '+', 'TERM']),
+    GrammarRule('SUM', ['TERM']),
+    GrammarRule('TERM', ['INTEGER']),
+    GrammarRule('TERM', ['(', 'SUM', ')']),
+]
+
+
+def list_parser():
+    return compile_grammar(LIST_RULES, terminal_rules=atom_terminal_rules())
+
+
+def sum_parser():
+    return compile_grammar(SUM_RULES, terminal_rules=atom_terminal_rules())
+
+
+def shape(node):
+    """Preorder (symbol, start, end, child count) tuples, for comparing trees."""
+    return [(n.symbol, n.start, n.end, len(n.children)) for n in node.walk()]
+
+
+def lex(lexer, text):
+    return [(kind, text[start:end]) for kind, start, end in lexer.tokenize(text)]
+
+
+# TLV codec (user-030)
+
+NESTED = {
+    'name': 'atom',
+    'items': [1, 'two', 3.5, True, [False, {'k': []}]],
+    'empty': {},
+}
+
+
+@pytest.mark.parametrize(
+    'value', [0, -1, 'text', '', 1.25, True, False, [], {}, NESTED]
+)
+def test_tlv_round_trip(value):
+    assert decode_tlv(encode_tlv(value)) == value
+
+
+def test_tlv_decodes_from_memoryview_and_rejects_garbage():
+    data = encode_tlv(NESTED)
+    assert decode_tlv(memoryview(data)) == NESTED
+    for cut in (1, len(data) // 2, len(data) - 1):
+        with pytest.raises(ValueError):
+            decode_tlv(data[:cut])
+    with pytest.raises(ValueError, match='trailing'):
+        decode_tlv(data + b'\x00')
+    with pytest.raises(ValueError, match='tag'):
+        decode_tlv(b'\xff')
+
+
+def test_tlv_deep_nesting_does_not_recurse():
+    value = []
+    for _ in range(5000):
+        value = [value]
+    decoded, depth = decode_tlv(encode_tlv(value)), 0
+    while decoded:
+        decoded, depth = decoded[0], depth + 1
+    assert depth == 5000
+
+
+def test_atom_dataclass_round_trip():
+    atom = AtomDataclass(NESTED)
+    decoded = AtomDataclass(None)
+    decoded.decode(atom.encode())
+    assert decoded.value == NESTED and decoded.data_type == 'dictionary'
+    with pytest.raises(ValueError):
+        AtomDataclass(object()).encode()
+
+
+def test_benchmark_codec_checks_the_round_trip(monkeypatch):
+    result = grammar.benchmark_codec(size=4096, rounds=1)
+    assert result['bytes'] > 0 and result['encode'] >= 0 and result['decode'] >= 0
+    decode = AtomDataclass.decode
+
+    def lossy(self, data):
+        decode(self, data)
+        self.value = self.value[:-1]
+
+    monkeypatch.setattr(AtomDataclass, 'decode', lossy)
+    with pytest.raises(ValueError):
+        grammar.benchmark_codec(size=4096, rounds=1)
+
+
+# Tags and varints (user-031)
+
+@pytest.mark.parametrize('value', [
+    1, -1, 63, -64, 64, 2 ** 62, -(2 ** 62), 2 ** 63 - 1, -(2 ** 63),
+    2 ** 63, -(2 ** 63) - 1, 2 ** 64, -(2 ** 200), 10 ** 40,
+])
+def test_integer_round_trip(value):
+    assert decode_tlv(encode_tlv(value)) == value
+
+
+def test_integer_tags_switch_at_int64_range():
+    assert encode_tlv(2 ** 63 - 1)[0] == TAG_INTEGER
+    assert encode_tlv(-(2 ** 63))[0] == TAG_INTEGER
+    assert encode_tlv(2 ** 63)[0] == TAG_BIGINT
+    assert encode_tlv(-(2 ** 63) - 1)[0] == TAG_BIGINT
+
+
+def test_small_values_take_few_bytes():
+    assert len(encode_tlv(0)) == 2
+    assert len(encode_tlv(-64)) == 2
+    assert len(encode_tlv(64)) == 3
+    assert len(encode_tlv(True)) == 1
+    assert len(encode_tlv('abc')) == 5
+
+
+# Packed blocks (user-032)
+
+@pytest.mark.parametrize('value, tag', [
+    (list(range(-5, 100)), TAG_INT64_ARRAY),
+    ([2 ** 63 - 1, -(2 ** 63), 0, 1], TAG_INT64_ARRAY),
+    ([i / 7 for i in range(50)], TAG_FLOAT64_ARRAY),
+    (['', 'a', 'héllo', '日本語', 'x' * 300], TAG_STRING_ARRAY),
+])
+def test_homogeneous_lists_pack_and_round_trip(value, tag):
+    data = encode_tlv(value)
+    assert data[0] == tag
+    assert decode_tlv(data) == value
+
+
+@pytest.mark.parametrize('value', [
+    [1, 2, 3],  # too short to pack
+    [1, 2.0, 3, 4],  # mixed
+    [1, 2, 3, 2 ** 63],  # out of int64 range
+    [True, False, True, False],  # bools are not ints here
+])
+def test_other_lists_use_per_element_records(value):
+    data = encode_tlv(value)
+    assert data[0] == TAG_LIST
+    decoded = decode_tlv(data)
+    assert decoded == value and list(map(type, decoded)) == list(map(type, value))
+
+
+def test_packed_arrays_and_array_input():
+    ints, floats = array('q', range(10)), array('d', [0.5] * 10)
+    assert decode_tlv(encode_tlv(ints), packed_arrays=True) == ints
+    assert decode_tlv(encode_tlv(floats), packed_arrays=True) == floats
+    assert decode_tlv(encode_tlv(array('i', range(10)))) == list(range(10))
+    nested = decode_tlv(encode_tlv({'v': list(range(8))}), packed_arrays=True)
+    assert isinstance(nested['v'], array) and nested['v'].typecode == 'q'
+    # Strings always come back as lists
+    assert decode_tlv(encode_tlv(['a', 'b', 'c', 'd']), packed_arrays=True) == [
+        'a',
+        'b',
+        'c',
+        'd',
+    ]
+
+
+@pytest.mark.parametrize('value', [list(range(100)), [0.5] * 100, ['ab'] * 100])
+def test_truncated_packed_block(value):
+    data = encode_tlv(value)
+    with pytest.raises(ValueError):
+        decode_tlv(data[:-3])
+
+
+# Parser (user-033)
+
+def test_ll1_table_and_tree():
+    parser = list_parser()
+    assert parser.is_ll1
+    tree = parser.parse('[1, "a", [2]]')
+    assert tree.symbol == 'LIST' and tree.text == '[1, "a", [2]]'
+    values = [node.text for node in tree.walk() if node.symbol == 'VALUE']
+    assert values == ['1', '"a"', '[2]', '2']
+    assert tree.source is tree.children[1].source
+    empty = parser.parse('[]')
+    assert [child.symbol for child in empty.children] == ['[', 'ELEMENTS', ']']
+    assert empty.children[1].start == empty.children[1].end == 1
+
+
+def test_earley_fallback_for_left_recursion():
+    parser = sum_parser()
+    assert not parser.is_ll1
+    tree = parser.parse('1 + (2 + 3) + 4')
+    assert tree.text == '1 + (2 + 3) + 4'
+    # Left recursion nests to the left
+    assert tree.children[0].text == '1 + (2 + 3)'
+    assert tree.children[2].text == '4'
+
+
+@pytest.mark.parametrize('make, text, offset', [
+    (list_parser, '[1, 2', 5),
+    (list_parser, '[1 2]', 3),
+    (list_parser, '[1]]', 3),
+    (list_parser, '[1, ?]', 4),
+    (sum_parser, '1 + + 2', 4),
+    (sum_parser, '1 +', 3),
+])
+def test_parse_errors_report_offsets(make, text, offset):
+    with pytest.raises(ParseError) as info:
+        make().parse(text)
+    assert info.value.offset == offset
+
+
+def test_compiled_grammars_are_shared():
+    assert list_parser() is list_parser()
+    assert list_parser().fingerprint != sum_parser().fingerprint
+    assert (
+        GrammarParser(LIST_RULES, terminal_rules=atom_terminal_rules()).fingerprint
+        == list_parser().fingerprint
+    )
+    with pytest.raises(ValueError):
+        GrammarParser([])
+
+
+def test_compiled_grammar_cache_evicts_least_recently_used(monkeypatch):
+    monkeypatch.setattr(grammar, 'PARSER_CACHE_SIZE', 2)
+    monkeypatch.setattr(grammar, '_PARSER_CACHE', OrderedDict())
+    grammars = [[GrammarRule('S', [f'k{n}'])] for n in range(3)]
+    first, second = compile_grammar(grammars[0]), compile_grammar(grammars[1])
+    assert compile_grammar(grammars[0]) is first
+    compile_grammar(grammars[2])
+    assert len(grammar._PARSER_CACHE) == 2
+    assert compile_grammar(grammars[0]) is first
+    assert compile_grammar(grammars[1]) is not second
+
+
+def test_parse_tree_encode_round_trip():
+    tree = list_parser().parse('[1, [2, 3], "x"]')
+    decoded = ParseTreeAtom('')
+    decoded.decode(tree.encode())
+    assert shape(decoded) == shape(tree)
+
+
+# Incremental reparse (user-035)
+
+def edit_and_compare(parser, text, start, end, replacement):
+    tree = parser.parse(text)
+    edited = text[:start] + replacement + text[end:]
+    try:
+        expected = parser.parse(edited)
+    except ParseError:
+        with pytest.raises(ParseError):
+            tree.edit(start, end, replacement)
+        return None
+    assert tree.edit(start, end, replacement) is tree
+    assert tree.source == edited
+    assert shape(tree) == shape(expected)
+    leaves = tree._source.leaves
+    assert [(leaf.symbol, leaf.start, leaf.end) for leaf in leaves] == parser.tokenize(
+        edited
+    )
+    for node in tree.walk():
+        assert all(child.parent is node for child in node.children)
+    return tree
+
+
+@pytest.mark.parametrize('start, end, replacement', [
+    (13, 13, ', 4'),  # append before ]
+    (13, 13, ' '),
+    (12, 13, '33'),  # grow the last token
+    (13, 13, '3'),
+    (1, 2, '9'),  # first token
+    (0, 0, ' '),
+    (4, 4, '[5, 6], '),
+    (3, 6, ''),
+    (1, 13, ''),
+    (5, 6, '"a"'),
+    (13, 14, ''),  # breaks the list
+    (4, 5, ','),
+])
+def test_list_reparse_matches_full_parse(start, end, replacement):
+    edit_and_compare(list_parser(), '[1, [2, 3], 3]', start, end, replacement)
+
+
+@pytest.mark.parametrize(
+    'parser, alphabet, text',
+    [
+        (
+            list_parser,
+            ['[', ']', ',', ' ', '1', '22', '"s"', ', 4'],
+            '[1, [2, [], "x"], 345, [[6]]]',
+        ),
+        (
+            sum_parser,
+            ['+', '(', ')', ' ', '1', '22', ' + 3'],
+            '1 + (2 + 3) + 45 + ((6))',
+        ),
+    ],
+)
+def test_random_edits_match_full_parse(parser, alphabet, text):
+    parser = parser()
+    rng = random.Random(35)
+    tree = parser.parse(text)
+    for _ in range(400):
+        start = rng.randrange(len(text) + 1)
+        end = min(len(text), start + rng.choice([0, 0, 1, 2, 5]))
+        replacement = ''.join(
+            rng.choice(alphabet) for _ in range(rng.choice([0, 1, 1, 2]))
+        )
+        # Once from a fresh tree, then on the tree carried over from earlier edits
+        if edit_and_compare(parser, text, start, end, replacement) is None:
+            continue
+        text = text[:start] + replacement + text[end:]
+        tree.edit(start, end, replacement)
+        assert shape(tree) == shape(parser.parse(text))
+        assert tree._source.leaves == [node for node in tree.walk() if not node.children
+                                       and node.symbol not in parser.nonterminals]
+
+
+def test_chained_edits_keep_untouched_nodes():
+    parser = list_parser()
+    tree = parser.parse('[[1, 2], [3, 4], [5]]')
+    first, second = (
+        tree.children[1].children[0],
+        tree.children[1].children[1].children[1],
+    )
+    tree.edit(len(tree.source) - 2, len(tree.source) - 2, ', 6')
+    tree.edit(0, 0, '  ')
+    assert tree.source == '  [[1, 2], [3, 4], [5, 6]]'
+    assert tree.children[1].children[0] is first and first.text == '[1, 2]'
+    assert (
+        tree.children[1].children[1].children[1] is second and second.text == '[3, 4]'
+    )
+    assert shape(tree) == shape(parser.parse(tree.source))
+
+
+def test_tail_append_replaces_only_the_end():
+    parser = list_parser()
+    text = '[' + ', '.join(map(str, range(2000))) + ']'
+    tree = parser.parse(text)
+    before = {id(node) for node in tree.walk()}
+    tree.edit(len(text) - 1, len(text) - 1, ', 2000')
+    after = [node for node in tree.walk()]
+    fresh = [node for node in after if id(node) not in before]
+    assert len(fresh) < 10
+    assert shape(tree) == shape(parser.parse(tree.source))
+
+
+def test_failed_region_is_undone_before_falling_back():
+    parser = list_parser()
+    # The inner list parses on its own, but the merged token does not fit after it
+    edit_and_compare(parser, '[[1], 2]', 4, 4, ', 3], [4')
+    edit_and_compare(parser, '[[1, 2], 3]', 3, 5, '')
+
+
+# Lexer (user-034)
+
+def test_atom_lexer_kinds():
+    assert lex(atom_lexer(), '12 -3 1.5 .5 true false "x"') == [
+        ('INTEGER', '12'), ('INTEGER', '-3'), ('FLOAT', '1.5'), ('FLOAT', '.5'),
+        ('BOOLEAN', 'true'), ('BOOLEAN', 'false'), ('STRING', '"x"'),
+    ]
+
+
+def test_string_does_not_span_lines_or_other_strings():
+    assert lex(atom_lexer(), '"a"\n12\n"b"') == [
+        ('STRING', '"a"'),
+        ('INTEGER', '12'),
+        ('STRING', '"b"'),
+    ]
+    assert lex(atom_lexer(), '"a" "b"') == [('STRING', '"a"'), ('STRING', '"b"')]
+    assert lex(atom_lexer(), r'"say \"hi\""') == [('STRING', r'"say \"hi\""')]
+
+
+def test_user_dot_patterns_keep_their_meaning():
+    lexer = Lexer([GrammarRule('LINE', ['#.*'])])
+    assert lex(lexer, '#one\n#two') == [('LINE', '#one'), ('LINE', '#two')]
+
+
+def test_unmatched_character_reports_offset():
+    lexer = Lexer([GrammarRule('X', ['x'])], skip=None)
+    with pytest.raises(ParseError) as error:
+        list(lexer.tokenize('xx\n'))
+    assert error.value.offset == 2
+
+
+def test_literals_and_longest_pattern_first():
+    lexer = Lexer([GrammarRule('NUM', ['[0-9]+'])], literals=['(', ')', '+', '++'])
+    assert lex(lexer, '(1++2)') == [
+        ('(', '('),
+        ('NUM', '1'),
+        ('++', '++'),
+        ('NUM', '2'),
+        (')', ')'),
+    ]
+
+
+def test_keywords_win_over_identifiers():
+    lexer = Lexer([GrammarRule('IDENT', ['[a-z]+'])], literals=['if', 'else', '(', ')'])
+    assert lex(lexer, 'if (iffy) else elsewhere') == [
+        ('if', 'if'),
+        ('(', '('),
+        ('IDENT', 'iffy'),
+        (')', ')'),
+        ('else', 'else'),
+        ('IDENT', 'elsewhere'),
+    ]
+    parser = GrammarParser(
+        [GrammarRule('S', ['if', '(', 'IDENT', ')'])],
+        terminal_rules=[GrammarRule('IDENT', ['[a-z]+'])],
+    )
+    tree = parser.parse('if (x)')
+    assert [child.symbol for child in tree.children] == ['if', '(', 'IDENT', ')']
+    with pytest.raises(ParseError):
+        parser.parse('if (if)')
@@ -0,0 +1,1152 @@
+import asyncio
+import gc
+import json
+import math
+import os
+import random
+import sys
+import threading
+import time
+import weakref
+from array import array
+
+import pytest
+
+from src import ollogic
+from src.ollogic import (
+    EmbeddingBatcher,
+    EmbeddingCache,
+    EmbeddingMatrix,
+    EmbeddingSegment,
+    EmbeddingStore,
+    HTTPConnectionPool,
+    HTTPError,
+    InferenceCache,
+    InferenceHead,
+    InferenceStream,
+    IVFFlatIndex,
+    MemoryHead,
+    MemoryImage,
+    MemoryWavefront,
+    OllamaStub,
+    VirtualMemoryFS,
+)
+
+
+np = ollogic.np
+needs_numpy = pytest.mark.skipif(np is None, reason="numpy is not installed")
+
+
+@pytest.fixture(autouse=True)
+def in_tmp(tmp_path, monkeypatch):
+    # VirtualMemoryFS keeps its tree under ./app/
+    monkeypatch.chdir(tmp_path)
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+# Memory image (user-036)
+
+def test_image_read_write_and_reopen(tmp_path):
+    vmem = VirtualMemoryFS()
+    run(vmem.write(0x1234, b'\x42'))
+    assert run(vmem.read(0x1234)) == b'\x42'
+    assert run(vmem.read(0x4321)) == b'\x00'
+    vmem.close()
+    assert (tmp_path / 'app' / 'memory.img').stat().st_size == MemoryImage.SIZE
+    assert run(VirtualMemoryFS().read(0x1234)) == b'\x42'
+
+
+def test_image_rejects_bad_writes():
+    vmem = VirtualMemoryFS()
+    with pytest.raises(ValueError):
+        run(vmem.write(0x10000, b'\x01'))
+    with pytest.raises(ValueError):
+        run(vmem.write(0x10, b'\x01\x02'))
+
+
+def test_export_and_import_per_file_layout(tmp_path):
+    image = MemoryImage(tmp_path / 'small.img', size=0x200)
+    image.write(0x0102, b'\x07')
+    image.export_files(tmp_path / 'tree')
+    assert (tmp_path / 'tree' / '01' / '02').read_bytes() == b'\x07'
+    other = MemoryImage(tmp_path / 'other.img', size=0x200)
+    other.import_files(tmp_path / 'tree')
+    assert other.read(0x0102) == b'\x07' and other.read(0x0103) == b'\x00'
+    image.close()
+    other.close()
+
+
+def test_per_file_mode_and_migration_to_image(tmp_path):
+    vmem = VirtualMemoryFS(per_file=True, flush_interval=None)
+    run(vmem.write(0x0203, b'\x09'))
+    assert run(vmem.read(0x0203)) == b'\x09'
+    vmem.close()
+    assert (tmp_path / 'app' / '02' / '03').read_bytes() == b'\x09'
+    # A fresh image picks up the per-file cells
+    assert run(VirtualMemoryFS().read(0x0203)) == b'\x09'
+
+
+# Range and vectored I/O (user-037)
+
+@pytest.mark.parametrize('per_file', [False, True])
+def test_ranges_and_vectors(per_file):
+    vmem = VirtualMemoryFS(per_file=per_file, flush_interval=None)
+    run(vmem.write_range(0x00F0, bytes(range(64))))
+    assert bytes(run(vmem.read_range(0x00F0, 64))) == bytes(range(64))
+    assert bytes(run(vmem.dump_segment(0x0100, 4))) == bytes(range(16, 20))
+    run(
+        vmem.writev(
+            [(0x2000, b'abcd'), (0x2002, b'XY'), (0x3000, b''), (0x2004, b'ef')]
+        )
+    )
+    views = run(vmem.readv([(0x2000, 6), (0x2003, 2), (0x3000, 0), (0x00F0, 2)]))
+    assert [bytes(view) for view in views] == [b'abXYef', b'Ye', b'', b'\x00\x01']
+    with pytest.raises(ValueError):
+        run(vmem.read_range(0xFFFF, 2))
+    vmem.close()
+
+
+def test_write_range_skips_plain_segment_mirror_in_image_mode():
+    vmem = VirtualMemoryFS()
+    run(vmem.write_range(0x0000, bytes(0x10000)))
+    assert not any(segment.cells for segment in vmem._segments.values())
+    per_file = VirtualMemoryFS(per_file=True, flush_interval=None)
+    run(per_file.write_range(0x01FE, b'\x01\x02\x03'))
+    assert per_file._segments[0x01].cells[0xFE].value == b'\x01'
+    assert per_file._segments[0x02].cells[0x00].value == b'\x03'
+    per_file.close()
+
+
+def test_write_range_drops_embeddings_under_it():
+    vmem = VirtualMemoryFS()
+    segment = vmem._segments[0x12] = EmbeddingSegment(base=0x1200)
+    segment.write(0x34, b'\x01', array('f', [1.0, 0.0]))
+    segment.write(0x40, b'\x02', array('f', [0.0, 1.0]))
+    run(vmem.write_range(0x1230, b'\x00' * 8))
+    assert segment.embedding(0x34) is None
+    assert segment.embedding(0x40) is not None
+    assert segment.cells[0x34].value == b'\x00'
+
+
+# Page cache (user-038)
+
+def test_collected_per_file_vmem_flushes_dirty_pages(tmp_path):
+    vmem = VirtualMemoryFS(per_file=True, flush_interval=None)
+    run(vmem.write(0x0304, b'\x05'))
+    assert not (tmp_path / 'app' / '03' / '04').exists()
+    ref = weakref.ref(vmem)
+    del vmem
+    gc.collect()
+    assert ref() is None
+    assert (tmp_path / 'app' / '03' / '04').read_bytes() == b'\x05'
+
+
+# Lazy initialization (user-039)
+
+def test_per_file_tree_is_created_on_first_write(tmp_path):
+    vmem = VirtualMemoryFS(per_file=True, flush_interval=None)
+    assert not (tmp_path / 'app').exists()
+    assert run(vmem.read(0x4567)) == b'\x00'
+    assert bytes(run(vmem.read_range(0x1000, 0x300))) == bytes(0x300)
+    assert not (tmp_path / 'app').exists()
+    run(vmem.write(0x4567, b'\x01'))
+    vmem.flush()
+    assert sorted(path.name for path in (tmp_path / 'app').iterdir()) == ['45']
+    assert (tmp_path / 'app' / '45' / '__init__.py').read_text() == vmem.segment_source(
+        0x45
+    )
+    assert VirtualMemoryFS(per_file=True, flush_interval=None).materialized == {0x45}
+    vmem.close()
+
+
+def test_image_mode_materializes_only_written_segments(tmp_path):
+    vmem = VirtualMemoryFS()
+    assert [path.name for path in (tmp_path / 'app').iterdir()] == ['memory.img']
+    run(vmem.write_range(0x12FF, b'\x01\x02'))
+    assert vmem.materialized == {0x12, 0x13}
+    assert (tmp_path / 'app' / '13' / '__init__.py').exists()
+    vmem.close()
+
+
+# Wavefront (user-040)
+
+def test_wavefront_bitmap_matches_marked_ranges():
+    rng = random.Random(40)
+    wavefront = MemoryWavefront()
+    marked = set()
+    for _ in range(200):
+        start = rng.randrange(0x10000)
+        stop = min(start + rng.choice([1, 2, 7, 8, 9, 300]), 0x10000)
+        wavefront.mark(start, stop)
+        marked.update(range(start, stop))
+    assert wavefront.visited_count() == len(marked)
+    assert all(
+        wavefront.is_visited(address) == (address in marked)
+        for address in range(0x10000)
+    )
+    wavefront.mark(5, 5)
+    assert wavefront.visited_count() == len(marked)
+
+
+def test_wavefront_timestamps():
+    wavefront = MemoryWavefront()
+    wavefront.mark(0xFFF0, 0x10000)
+    assert wavefront.visited_at(0x0000) is None
+    assert abs(wavefront.visited_at(0xFFFF) - time.time()) < 1
+
+
+def test_sweep_marks_path_and_touches_each_segment_once():
+    head = MemoryHead(VirtualMemoryFS())
+    loads = []
+    load = head._load_segment_module
+    head._load_segment_module = lambda segment: loads.append(segment) or load(segment)
+    assert head.propagate(0x0302) == list(range(0x0000, 0x0302))
+    assert loads == [0x00, 0x01, 0x02, 0x03]
+    assert head.wavefront.position == 0x0302
+    assert head.wavefront.visited_count() == 0x0302
+    assert head.propagate(0x0300) == [0x0302, 0x0301]
+    assert head.wavefront.is_visited(0x0302) and not head.wavefront.is_visited(0x0303)
+    assert head.propagate(0x0300) == []
+    assert head.propagate(0x1000, max_steps=16) == list(range(0x0300, 0x0310))
+    assert head.wavefront.position == 0x0310
+
+
+def test_seek_jumps_and_records_an_interval():
+    head = MemoryHead(VirtualMemoryFS())
+    path = head.propagate(0xFFFF, seek=True)
+    assert path == range(0x0000, 0xFFFF)
+    assert head.wavefront.position == 0xFFFF
+    assert head.wavefront.intervals == [(0x0000, 0xFFFF)]
+    assert head.wavefront.visited_count() == 0
+    assert list(head.module_cache) == [0xFF]
+    info = run(head.get_wavefront_info())
+    assert info['position'] == '0xffff' and info['current_segment'] == '0xff'
+
+
+# Segment module cache (user-041)
+
+def test_module_cache_evicts_lru_and_unregisters():
+    head = MemoryHead(VirtualMemoryFS(), module_cache_size=2)
+    first = head._load_segment_module(0x01)
+    head._load_segment_module(0x02)
+    assert head._load_segment_module(0x01) is first
+    head._load_segment_module(0x03)
+    assert list(head.module_cache) == [0x01, 0x03]
+    assert 'vmem.seg_02' not in sys.modules
+    assert sys.modules['vmem.seg_01'] is first
+
+
+def test_module_cache_throttles_stat_and_reloads_rewritten_segments(tmp_path):
+    vmem = VirtualMemoryFS()
+    run(vmem.write(0x0500, b'\x01'))
+    head = MemoryHead(vmem, stat_interval=3600)
+    stats = []
+    mtime = head._segment_mtime
+    head._segment_mtime = lambda segment: stats.append(segment) or mtime(segment)
+    module = head._load_segment_module(0x05)
+    for _ in range(100):
+        assert head._load_segment_module(0x05) is module
+    assert stats == [0x05]
+
+    init = tmp_path / 'app' / '05' / '__init__.py'
+    init.write_text(init.read_text() + "MARK = 1\n")
+    os.utime(init, (0, 0))
+    assert head._load_segment_module(0x05) is module
+    head.stat_interval = 0
+    reloaded = head._load_segment_module(0x05)
+    assert reloaded is not module and reloaded.MARK == 1
+    assert sys.modules['vmem.seg_05'] is reloaded
+    assert len(head.module_cache) == 1
+
+
+def test_warm_up_preloads_crossed_segments():
+    head = MemoryHead(VirtualMemoryFS(), module_cache_size=4)
+    head.wavefront.position = 0x0A00
+    assert head.warm_up(0x0700) == 4
+    assert list(head.module_cache) == [0x0A, 0x09, 0x08, 0x07]
+    assert head.preload([0x20, 0x21]) == 4
+    assert list(head.module_cache) == [0x08, 0x07, 0x20, 0x21]
+
+
+# Embedding matrix (user-042)
+
+def random_vectors(count, dim=16, seed=42):
+    rng = random.Random(seed)
+    return [array('f', (rng.gauss(0, 1) for _ in range(dim))) for _ in range(count)]
+
+
+def brute_force(vectors, query, top_k):
+    def cosine(a, b):
+        norms = math.sqrt(sum(x * x for x in a)) * math.sqrt(sum(y * y for y in b))
+        return sum(x * y for x, y in zip(a, b)) / norms
+    scores = [(key, cosine(vector, query)) for key, vector in vectors.items()]
+    return sorted(scores, key=lambda x: -x[1])[:top_k]
+
+
+@pytest.fixture(params=['numpy', 'python'])
+def backend(request, monkeypatch):
+    if request.param == 'python':
+        monkeypatch.setattr(ollogic, 'np', None)
+    return request.param
+
+
+def test_matrix_search_matches_brute_force(backend):
+    vectors = dict(enumerate(random_vectors(300)))
+    matrix = EmbeddingMatrix()
+    for key, vector in vectors.items():
+        matrix.add(key, vector)
+    for key in range(0, 300, 3):
+        matrix.remove(key)
+        del vectors[key]
+    for key in range(1, 300, 7):
+        vectors[key] = random_vectors(1, seed=key)[0]
+        matrix.add(key, vectors[key])
+    assert len(matrix) == len(vectors) and sorted(matrix.keys()) == sorted(vectors)
+    for query in random_vectors(10, seed=7):
+        expected = brute_force(vectors, query, 5)
+        found = matrix.search(query, 5)
+        assert [key for key, _ in found] == [key for key, _ in expected]
+        assert [score for _, score in found] == pytest.approx(
+            [score for _, score in expected], abs=1e-5)
+
+
+def test_matrix_remove_moves_last_row():
+    matrix = EmbeddingMatrix()
+    vectors = random_vectors(3, dim=4)
+    for key, vector in enumerate(vectors):
+        matrix.add(key, vector)
+    matrix.remove(0)
+    matrix.remove(0)
+    assert matrix.keys() == [2, 1]
+    assert matrix.get(2) == vectors[2] and matrix.get(0) is None
+    matrix.remove(1)
+    matrix.remove(2)
+    assert len(matrix) == 0 and matrix.search(vectors[0]) == []
+    matrix.add(5, array('f', [1.0, 0.0]))
+    assert matrix.search(array('f', [0.0, 0.0])) == [(5, 0.0)]
+
+
+def test_matrix_rejects_other_dimensions(backend):
+    matrix = EmbeddingMatrix()
+    matrix.add(1, array('f', [1.0, 0.0, 0.0]))
+    with pytest.raises(ValueError):
+        matrix.add(2, array('f', [1.0, 0.0]))
+    with pytest.raises(ValueError):
+        matrix.search(array('f', [1.0, 0.0]))
+    with pytest.raises(ValueError):
+        EmbeddingMatrix(dtype='float64')
+
+
+# IVF index (user-043)
+
+
+def clustered_vectors(count, dim=32, clusters=16, seed=43):
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((clusters, dim))
+    points = centers[rng.integers(clusters, size=count)] + 0.1 * rng.standard_normal(
+        (count, dim)
+    )
+    return [array('f', row.astype(np.float32).tobytes()) for row in points]
+
+
+@needs_numpy
+@pytest.mark.parametrize('dtype', ['float32', 'float16', 'int8'])
+def test_ivf_training_keeps_rows_and_finds_neighbours(dtype):
+    vectors = clustered_vectors(1000)
+    index = IVFFlatIndex(nlist=16, nprobe=4, dtype=dtype, auto_train=False)
+    for key, vector in enumerate(vectors):
+        index.add(key, vector)
+    assert index.centroids is None and index.needs_training
+    before = {key: index.get(key) for key in range(0, 1000, 37)}
+    index.train()
+    assert index.centroids is not None and not index.needs_training
+    assert len(index) == 1000 and sum(len(bucket) for bucket in index._lists) == 1000
+    # Rows move at storage precision, so nothing is re-quantized
+    assert all(index.get(key) == vector for key, vector in before.items())
+    assert index.recall(vectors[:50], top_k=5) > 0.9
+    matrix = EmbeddingMatrix(dtype)
+    for key, vector in enumerate(vectors):
+        matrix.add(key, vector)
+    query = vectors[7]
+    assert [key for key, _ in index.search(query, 10, exact=True)] == \
+        [key for key, _ in matrix.search(query, 10)]
+
+
+@needs_numpy
+def test_ivf_auto_train_and_retrain_on_growth():
+    index = IVFFlatIndex(nlist=4, train_size=32, retrain_factor=2)
+    vectors = clustered_vectors(200, clusters=4)
+    for key, vector in enumerate(vectors[:31]):
+        index.add(key, vector)
+    assert index.centroids is None
+    index.add(31, vectors[31])
+    assert index._trained_size == 32
+    for key, vector in enumerate(vectors[32:64], 32):
+        index.add(key, vector)
+    assert index._trained_size == 64
+    index.remove(5)
+    assert 5 not in index and index.get(5) is None and len(index) == 63
+
+
+@needs_numpy
+def test_ivf_trains_while_other_threads_add():
+    vectors = clustered_vectors(2000)
+    index = IVFFlatIndex(nlist=16, auto_train=False)
+    for key, vector in enumerate(vectors[:1000]):
+        index.add(key, vector)
+    trainer = threading.Thread(target=index.train)
+    trainer.start()
+    for key, vector in enumerate(vectors[1000:], 1000):
+        index.add(key, vector)
+        index.search(vector, 1)
+    trainer.join()
+    assert index.centroids is not None and len(index) == 2000
+    assert sum(len(bucket) for bucket in index._lists) == 2000
+    assert all(index.get(key) == vectors[key] for key in range(0, 2000, 101))
+
+
+@needs_numpy
+def test_head_trains_its_index_off_the_event_loop():
+    async def scenario():
+        async with OllamaStub(dim=8) as stub:
+            head = InferenceHead(
+                VirtualMemoryFS(),
+                stub.host,
+                stub.port,
+                index=IVFFlatIndex(nlist=4, train_size=16, auto_train=False),
+            )
+            trained_in = []
+            train = head.index.train
+            head.index.train = (
+                lambda: trained_in.append(threading.current_thread()) or train()
+            )
+            for offset in range(20):
+                await head.write_with_embedding(
+                    0x0100 + offset, b'\x01', f"text {offset}"
+                )
+            assert (
+                len(await head.search_similar_across_segments("text 3", top_k=3)) == 3
+            )
+            await head.close()
+            assert head.index.centroids is not None
+            assert trained_in and threading.main_thread() not in trained_in
+    run(scenario())
+
+
+# Quantized embeddings (user-044)
+
+@pytest.mark.parametrize('dtype', ['float16', 'int8'])
+def test_quantized_search_rescores_to_full_precision(dtype, backend, tmp_path):
+    vectors = dict(enumerate(random_vectors(200)))
+    store = EmbeddingStore(tmp_path / 'store')
+    in_memory = EmbeddingMatrix(dtype, rescore=4)
+    from_store = EmbeddingMatrix(dtype, rescore=4, full_store=store)
+    quantized_only = EmbeddingMatrix(dtype, rescore=0)
+    for key, vector in vectors.items():
+        store.append(key, vector)
+        for matrix in (in_memory, from_store, quantized_only):
+            matrix.add(key, vector)
+    assert in_memory._full is not None
+    assert from_store._full is None and quantized_only._full is None
+    assert from_store.get(3) == vectors[3]
+    for query in random_vectors(5, seed=9):
+        expected = brute_force(vectors, query, 5)
+        for matrix in (in_memory, from_store):
+            found = matrix.search(query, 5)
+            assert [key for key, _ in found] == [key for key, _ in expected]
+            assert [score for _, score in found] == pytest.approx(
+                [score for _, score in expected], abs=1e-5)
+        approximate = quantized_only.search(query, 5)
+        assert [score for _, score in approximate] == pytest.approx(
+            [score for _, score in expected], abs=0.05)
+    store.close()
+
+
+def test_matrix_search_among_keys(backend):
+    vectors = dict(enumerate(random_vectors(100)))
+    matrix = EmbeddingMatrix('int8')
+    for key, vector in vectors.items():
+        matrix.add(key, vector)
+    subset = {key: vectors[key] for key in range(0, 100, 3)}
+    query = vectors[50]
+    found = matrix.search(query, 4, keys=list(subset) + [1000])
+    assert [key for key, _ in found] == [
+        key for key, _ in brute_force(subset, query, 4)
+    ]
+    assert matrix.search(query, 4, keys=[1000]) == []
+
+
+@pytest.mark.parametrize('shared', ['matrix', pytest.param('ivf', marks=needs_numpy)])
+def test_segment_search_stays_in_its_segment(shared):
+    index = (
+        EmbeddingMatrix()
+        if shared == 'matrix'
+        else IVFFlatIndex(nlist=4, train_size=16)
+    )
+    segments = [EmbeddingSegment(index, base) for base in (0x0100, 0x0200)]
+    vectors = random_vectors(40)
+    for offset, vector in enumerate(vectors):
+        segments[offset % 2].write(offset, b'\x01', vector)
+    found = segments[1].search_similar(vectors[5], top_k=3)
+    assert found[0][0] == 5 and found[0][1] == pytest.approx(1.0)
+    assert all(address % 2 == 1 for address, _ in found)
+    expected = brute_force(
+        {offset: vectors[offset] for offset in range(1, 40, 2)}, vectors[5], 3
+    )
+    assert [address for address, _ in found] == [address for address, _ in expected]
+    own = EmbeddingSegment(base=0x0300)
+    own.write(0x10, b'\x01', vectors[0])
+    assert own.search_similar(vectors[0], top_k=1)[0][0] == 0x10
+
+
+def test_head_quantized_index_keeps_no_full_copy_unless_asked(tmp_path):
+    def buckets(head):
+        return (
+            head.index._lists if isinstance(head.index, IVFFlatIndex) else [head.index]
+        )
+    default = InferenceHead(VirtualMemoryFS(), embedding_dtype='int8')
+    assert all(bucket._full is None for bucket in buckets(default))
+    stored = InferenceHead(
+        VirtualMemoryFS(), embedding_dtype='int8', store_path=tmp_path / 'store'
+    )
+    assert all(bucket._full is None and bucket.full_store is stored.store
+               for bucket in buckets(stored))
+    copied = InferenceHead(
+        VirtualMemoryFS(), embedding_dtype='int8', embedding_rescore=2
+    )
+    assert all(bucket._full is not None for bucket in buckets(copied))
+
+
+# Embedding store (user-045)
+
+def filled_store(path, count=3):
+    store = EmbeddingStore(path)
+    for key in range(count):
+        store.append(key, array('f', [key, 1.0, 2.0]), bytes([key]), {'n': key})
+    store.close()
+    return path
+
+
+def reopen_and_append(path):
+    store = EmbeddingStore(path)
+    store.append(10, array('f', [9.0, 9.0, 9.0]), b'\x0a')
+    store.close()
+    return EmbeddingStore(path)
+
+
+def test_store_reopens_and_compacts(tmp_path):
+    store = EmbeddingStore(filled_store(tmp_path / 's'))
+    assert store.keys() == [0, 1, 2] and store.dim == 3
+    assert store.cell(1) == ollogic.EmbeddingCell(
+        b'\x01', array('f', [1.0, 1.0, 2.0]), {'n': 1}
+    )
+    store.append(1, array('f', [5.0, 5.0, 5.0]))
+    store.delete(2)
+    store.compact()
+    store.close()
+    store = EmbeddingStore(tmp_path / 's')
+    assert store.keys() == [0, 1] and store.get(1) == array('f', [5.0, 5.0, 5.0])
+    assert (tmp_path / 's' / 'matrix.f32').stat().st_size == 2 * 3 * 4
+    with pytest.raises(ValueError):
+        EmbeddingStore(tmp_path / 's', dim=4)
+
+
+@pytest.mark.parametrize('tear', ['partial json', 'no newline'])
+def test_store_reopens_after_torn_metadata_line(tmp_path, tear):
+    path = filled_store(tmp_path / 's')
+    metadata = path / 'metadata.jsonl'
+    lines = metadata.read_bytes().splitlines(keepends=True)
+    last = lines[-1][:10] if tear == 'partial json' else lines[-1].rstrip(b'\n')
+    metadata.write_bytes(b''.join(lines[:-1]) + last)
+    store = reopen_and_append(path)
+    assert store.keys() == [0, 1, 2, 10]
+    assert store.cell(2).value == b'' and store.cell(1).value == b'\x01'
+    assert store.cell(10).value == b'\x0a'
+
+
+def test_store_reopens_after_torn_index_record(tmp_path):
+    path = filled_store(tmp_path / 's')
+    index = path / 'index.bin'
+    index.write_bytes(index.read_bytes()[:-5])
+    store = reopen_and_append(path)
+    assert store.keys() == [0, 1, 10]
+    assert store.cell(10).value == b'\x0a' and store.get(10) == array(
+        'f', [9.0, 9.0, 9.0]
+    )
+
+
+def test_store_drops_records_past_the_matrix(tmp_path):
+    path = filled_store(tmp_path / 's')
+    matrix = path / 'matrix.f32'
+    matrix.write_bytes(matrix.read_bytes()[:-6])
+    store = reopen_and_append(path)
+    assert store.keys() == [0, 1, 10]
+    assert store.get(10) == array('f', [9.0, 9.0, 9.0])
+    assert store.cell(10).value == b'\x0a'
+
+
+def test_store_with_metadata_but_no_index(tmp_path):
+    path = filled_store(tmp_path / 's')
+    (path / 'index.bin').unlink()
+    store = EmbeddingStore(path)
+    assert len(store) == 0
+    assert (path / 'metadata.jsonl').read_bytes() == b''
+    store.close()
+    assert reopen_and_append(path).keys() == [10]
+
+
+def test_store_created_without_dim(tmp_path):
+    EmbeddingStore(tmp_path / 's').close()
+    store = EmbeddingStore(tmp_path / 's', dim=3)
+    store.append(1, array('f', [1.0, 2.0, 3.0]))
+    store.close()
+    assert EmbeddingStore(tmp_path / 's').get(1) == array('f', [1.0, 2.0, 3.0])
+
+
+def test_overwritten_embeddings_are_tombstoned_in_the_store(tmp_path):
+    async def scenario():
+        async with OllamaStub(dim=8) as stub:
+            head = InferenceHead(
+                VirtualMemoryFS(), stub.host, stub.port, store_path=tmp_path / 'store'
+            )
+            await head.write_with_embedding(0x0120, b'a', "kept")
+            await head.write_with_embedding(0x0121, b'b', "overwritten")
+            await head.write_with_embedding(0x0122, b'c', "cleared")
+            await head.vmem.write(0x0121, b'x')
+            head.vmem._segments[0x01].write(0x22, b'y')
+            await head.close()
+            reloaded = InferenceHead(
+                VirtualMemoryFS(), stub.host, stub.port, store_path=tmp_path / 'store'
+            )
+            assert reloaded.store.keys() == [0x0120]
+            assert reloaded.vmem._segments[0x01].embedding(0x20) is not None
+            assert reloaded.vmem._segments[0x01].embedding(0x21) is None
+    run(scenario())
+
+
+def test_head_close_persists_the_store(tmp_path):
+    path = tmp_path / 'store'
+    index_bytes = EmbeddingStore.HEADER.size + 300 * EmbeddingStore.RECORD.size
+
+    async def scenario():
+        async with OllamaStub(dim=8) as stub:
+            head = InferenceHead(
+                VirtualMemoryFS(), stub.host, stub.port, store_path=path
+            )
+            await asyncio.gather(*(
+                head.write_with_embedding(0x0100 + n, bytes([n % 256]), f"text {n}")
+                for n in range(300)
+            ))
+            await asyncio.sleep(0)
+            # Each batch is flushed as it lands, before close()
+            assert (path / 'index.bin').stat().st_size == index_bytes
+            expected = await head.search_similar_across_segments("text 7", exact=True)
+            await head.close()
+            store = EmbeddingStore(path)
+            assert len(store) == 300 and store.dim == 8
+            store.close()
+            reloaded = InferenceHead(
+                VirtualMemoryFS(), stub.host, stub.port, store_path=path
+            )
+            found = await reloaded.search_similar_across_segments("text 7", exact=True)
+            assert [hit[:2] for hit in found] == [hit[:2] for hit in expected]
+            assert found[0][:2] == (0x01, 7)
+            await reloaded.close()
+    run(scenario())
+
+
+# HTTP pool and stub (user-046)
+
+class ScriptedServer:
+    """Bare HTTP server that hands each request to respond(path, connection number,
+    writer); respond returns False to drop the connection without answering"""
+    def __init__(self, respond):
+        self.respond = respond
+        self.requests = []  # (path, connection number)
+        self.connections = 0
+        self.release = asyncio.Event()  # lets hanging responses finish
+        self._clients = {}
+
+    async def __aenter__(self):
+        self.server = await asyncio.start_server(self._serve, '127.0.0.1', 0)
+        self.port = self.server.sockets[0].getsockname()[1]
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self.release.set()
+        self.server.close()
+        for writer in self._clients.values():
+            writer.close()
+        await asyncio.gather(*self._clients, return_exceptions=True)
+
+    async def _serve(self, reader, writer):
+        number = self.connections
+        self.connections += 1
+        self._clients[asyncio.current_task()] = writer
+        try:
+            while line := await reader.readline():
+                length = 0
+                while (header := await reader.readline()) not in (b'\r\n', b''):
+                    name, _, value = header.partition(b':')
+                    if name.strip().lower() == b'content-length':
+                        length = int(value)
+                await reader.readexactly(length)
+                path = line.split()[1].decode()
+                self.requests.append((path, number))
+                if await self.respond(self, path, number, writer) is False:
+                    break
+        except ConnectionError:
+            pass
+        finally:
+            del self._clients[asyncio.current_task()]
+            writer.close()
+
+    @staticmethod
+    async def ok(writer, body=b'{"ok": true}'):
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nContent-Length: %d\r\n\r\n%s' % (len(body), body)
+        )
+        await writer.drain()
+
+    async def hang(self, writer):
+        """Start a chunked body, then stall until released"""
+        writer.write(
+            b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5\r\nfirst\r\n'
+        )
+        await writer.drain()
+        await self.release.wait()
+
+
+def test_pool_reuses_and_pipelines_connections():
+    async def scenario():
+        async with OllamaStub(dim=4) as stub:
+            pool = HTTPConnectionPool(stub.host, stub.port, max_connections=1)
+            for i in range(5):
+                result = await pool.post_json(
+                    "/api/embeddings", {'model': 'm', 'prompt': f"t{i}"}
+                )
+                assert result['embedding'] == stub.embedding('m', f"t{i}")
+            assert len(pool._connections) == 1
+            await pool.close()
+
+            pool = HTTPConnectionPool(
+                stub.host, stub.port, max_connections=2, pipeline_depth=4
+            )
+            results = await asyncio.gather(
+                *(
+                    pool.post_json("/api/embeddings", {'model': 'm', 'prompt': str(i)})
+                    for i in range(40)
+                )
+            )
+            assert [r['embedding'] for r in results] == [
+                stub.embedding('m', str(i)) for i in range(40)
+            ]
+            assert len(pool._connections) == 2 and stub.requests == 45
+            await pool.close()
+    run(scenario())
+
+
+def test_stub_endpoints():
+    async def scenario():
+        async with OllamaStub(dim=3, tokens=4) as stub:
+            pool = HTTPConnectionPool(stub.host, stub.port)
+            batch = await pool.post_json(
+                "/api/embed", {'model': 'm', 'input': ['a', 'b']}
+            )
+            assert batch['embeddings'] == [
+                stub.embedding('m', 'a'),
+                stub.embedding('m', 'b'),
+            ]
+            reply = await pool.post_json(
+                "/api/generate", {'model': 'm', 'prompt': 'x y', 'stream': False}
+            )
+            assert reply['response'] == ' x y x y' and reply['done']
+            response = await pool.request("POST", "/api/generate", b'{"prompt": "z"}')
+            lines = [json.loads(line) async for line in response.iter_lines()]
+            assert [line['response'] for line in lines] == [' z'] * 4 + [''] and lines[
+                -1
+            ]['done']
+            with pytest.raises(HTTPError) as error:
+                await pool.post_json("/api/missing", {})
+            assert error.value.status == 404
+            assert (await pool.post_json("/api/embeddings", {'prompt': 'a'}))[
+                'embedding'
+            ]
+            await pool.close()
+    run(scenario())
+
+
+def test_pool_retries_a_dropped_request_once():
+    async def drop_first_connection(server, path, number, writer):
+        if number == 0 or path == '/always':
+            return False
+        await server.ok(writer)
+
+    async def scenario():
+        async with ScriptedServer(drop_first_connection) as server:
+            pool = HTTPConnectionPool('127.0.0.1', server.port)
+            assert await pool.post_json('/retry', {}) == {'ok': True}
+            assert server.requests == [('/retry', 0), ('/retry', 1)]
+            with pytest.raises(ConnectionResetError):
+                await pool.post_json('/always', {})
+            assert len(server.requests) == 4
+            await pool.close()
+    run(scenario())
+
+
+def test_abort_retries_requests_pipelined_behind_it():
+    async def respond(server, path, number, writer):
+        if path == '/hang':
+            await server.hang(writer)
+        else:
+            await server.ok(writer)
+
+    async def scenario():
+        async with ScriptedServer(respond) as server:
+            pool = HTTPConnectionPool(
+                '127.0.0.1', server.port, max_connections=1, pipeline_depth=2
+            )
+            response = await pool.request('POST', '/hang')
+            behind = asyncio.ensure_future(pool.post_json('/ok', {}))
+            await asyncio.sleep(0.05)
+            assert pool._connections[0].inflight == 2
+            assert await response.iter_chunks().__anext__() == b'first'
+            response.abort()
+            assert await behind == {'ok': True}
+            # The server never got past /hang on the first connection
+            assert server.requests == [('/hang', 0), ('/ok', 1)]
+            assert response.done and await response.read() == b''
+            await pool.close()
+    run(scenario())
+
+
+def test_timed_out_request_is_not_retried():
+    async def respond(server, path, number, writer):
+        if path == '/slow':
+            await server.release.wait()
+        await server.ok(writer)
+
+    async def scenario():
+        async with ScriptedServer(respond) as server:
+            pool = HTTPConnectionPool('127.0.0.1', server.port, timeout=0.1)
+            with pytest.raises(asyncio.TimeoutError):
+                await pool.post_json('/slow', {})
+            assert server.requests == [('/slow', 0)]
+            assert await pool.post_json('/fast', {}) == {'ok': True}
+            await pool.close()
+    run(scenario())
+
+
+# Embedding cache (user-047)
+
+class Embedder:
+    """compute() stand-in that counts calls and records the threads doing disk I/O"""
+    def __init__(self, delay=0.0):
+        self.calls = 0
+        self.delay = delay
+
+    def __call__(self, text):
+        async def compute():
+            self.calls += 1
+            await asyncio.sleep(self.delay)
+            return [float(len(text)), 1.0]
+        return compute
+
+
+def watch_disk_threads(cache):
+    threads = []
+    def watched(method):
+        return lambda *args: threads.append(threading.current_thread()) or method(*args)
+    for name in ('_read_file', '_write_file', '_remove_files'):
+        setattr(cache, name, watched(getattr(cache, name)))
+    return threads
+
+
+def test_cache_memory_lru_and_stats():
+    cache = EmbeddingCache(capacity=2)
+    for text in ('a', 'bb', 'a', 'ccc'):
+        if cache.get('m', text) is None:
+            cache.put('m', text, [float(len(text))])
+    assert cache.get('m', 'bb') is None and cache.get('m', 'a') == array('f', [1.0])
+    stats = cache.stats()
+    assert stats['hits'] == 2 and stats['misses'] == 4 and stats['evictions'] == 1
+    assert stats['hit_rate'] == pytest.approx(2 / 6)
+
+
+def test_cache_disk_tier_runs_off_the_loop(tmp_path):
+    embedder = Embedder()
+
+    async def scenario():
+        cache = EmbeddingCache(tmp_path / 'cache', capacity=1)
+        threads = watch_disk_threads(cache)
+        assert await cache.get_or_compute('m', 'one', embedder('one')) == array(
+            'f', [3.0, 1.0]
+        )
+        await cache.get_or_compute('m', 'three', embedder('three'))
+        await cache.drain()
+        assert cache.stats()['disk_entries'] == 2
+        assert await cache.get_or_compute('m', 'one', embedder('one')) == array(
+            'f', [3.0, 1.0]
+        )
+        assert embedder.calls == 2 and cache.disk_hits == 1
+        assert threads and threading.main_thread() not in threads
+    run(scenario())
+    reopened = EmbeddingCache(tmp_path / 'cache')
+    assert reopened.disk_bytes == 16 and reopened.get('m', 'three') == array(
+        'f', [5.0, 1.0]
+    )
+    reopened.clear()
+    assert not list((tmp_path / 'cache').glob('*/*.f32'))
+
+
+def test_cache_trims_disk_oldest_first(tmp_path):
+    async def scenario():
+        cache = EmbeddingCache(tmp_path / 'cache', max_bytes=24)
+        for text in ('a', 'b', 'c', 'd'):
+            await cache.get_or_compute('m', text, Embedder()(text))
+            await cache.drain()
+        assert cache.disk_bytes == 24 and cache.disk_evictions == 1
+        assert not cache._file(cache.key('m', 'a')).exists()
+        assert cache._file(cache.key('m', 'd')).exists()
+    run(scenario())
+
+
+def test_cache_leaves_no_partial_files(tmp_path, monkeypatch):
+    stale = tmp_path / 'cache' / 'ab' / ('ab' * 32 + '.tmp')
+    stale.parent.mkdir(parents=True)
+    stale.write_bytes(b'torn')
+    cache = EmbeddingCache(tmp_path / 'cache')
+    assert not stale.exists()
+
+    def fail(source, target):
+        raise OSError("rename failed")
+    monkeypatch.setattr(ollogic.os, 'replace', fail)
+    with pytest.raises(OSError):
+        cache.put('m', 'x', [1.0])
+    assert not list((tmp_path / 'cache').glob('*/*'))
+
+
+def test_cache_coalesces_concurrent_misses():
+    embedder = Embedder(delay=0.01)
+
+    async def scenario():
+        cache = EmbeddingCache()
+        first = asyncio.ensure_future(cache.get_or_compute('m', 'x', embedder('x')))
+        others = [cache.get_or_compute('m', 'x', embedder('x')) for _ in range(9)]
+        await asyncio.sleep(0)
+        first.cancel()  # the shared computation carries on for the others
+        results = await asyncio.gather(*others)
+        assert results == [array('f', [1.0, 1.0])] * 9
+        assert embedder.calls == 1 and cache.coalesced == 9 and cache.misses == 1
+
+        async def fail():
+            raise ConnectionRefusedError
+        with pytest.raises(ConnectionRefusedError):
+            await cache.get_or_compute('m', 'y', fail)
+        assert cache.get('m', 'y') is None
+    run(scenario())
+
+
+# Embedding batches (user-048)
+
+def test_batcher_groups_concurrent_requests_per_model():
+    async def scenario():
+        async with OllamaStub(dim=4) as stub:
+            pool = HTTPConnectionPool(stub.host, stub.port)
+            batcher = EmbeddingBatcher(pool, max_batch=32, window=0.01)
+            requests = [(f"t{i}", 'a' if i < 70 else 'b') for i in range(75)]
+            results = await asyncio.gather(
+                *(batcher.embed(text, model) for text, model in requests)
+            )
+            assert results == [
+                array('f', stub.embedding(model, text)) for text, model in requests
+            ]
+            # 32 + 32 + 6 for model a, 5 for model b
+            assert stub.requests == 4 and batcher.stats()['batches'] == 4
+            assert (
+                batcher.stats()['mean_batch'] == 75 / 4
+                and batcher.stats()['waiting'] == 0
+            )
+
+            batcher = EmbeddingBatcher(pool, window=60)
+            waiting = asyncio.ensure_future(batcher.embed('late', 'a'))
+            await asyncio.sleep(0)
+            assert batcher.stats()['waiting'] == 1
+            await batcher.close()
+            assert await waiting == array('f', stub.embedding('a', 'late'))
+            await pool.close()
+    run(scenario())
+
+
+def test_batcher_falls_back_without_a_batch_endpoint():
+    async def respond(server, path, number, writer):
+        if path == '/api/embed':
+            writer.write(b'HTTP/1.1 404 Not Found\r\nContent-Length: 0\r\n\r\n')
+        else:
+            await server.ok(writer, b'{"embedding": [1.0, 2.0]}')
+
+    async def scenario():
+        async with ScriptedServer(respond) as server:
+            pool = HTTPConnectionPool('127.0.0.1', server.port)
+            batcher = EmbeddingBatcher(pool)
+            results = await asyncio.gather(
+                *(batcher.embed(str(i), 'm') for i in range(3))
+            )
+            assert (
+                results == [array('f', [1.0, 2.0])] * 3 and not batcher.batch_endpoint
+            )
+            assert [path for path, _ in server.requests] == ['/api/embed'] + [
+                '/api/embeddings'
+            ] * 3
+            await pool.close()
+    run(scenario())
+
+
+def test_batch_failure_reaches_every_caller():
+    async def respond(server, path, number, writer):
+        writer.write(b'HTTP/1.1 500 Server Error\r\nContent-Length: 4\r\n\r\noops')
+
+    async def scenario():
+        async with ScriptedServer(respond) as server:
+            pool = HTTPConnectionPool('127.0.0.1', server.port)
+            batcher = EmbeddingBatcher(pool)
+            results = await asyncio.gather(
+                *(batcher.embed(str(i), 'm') for i in range(3)), return_exceptions=True
+            )
+            assert all(
+                isinstance(result, HTTPError) and result.status == 500
+                for result in results
+            )
+            assert len(server.requests) == 1
+            await pool.close()
+    run(scenario())
+
+
+# Streaming inference (user-049)
+
+def test_stream_yields_tokens_with_timings():
+    async def scenario():
+        async with OllamaStub(tokens=5, token_delay=0.002) as stub:
+            head = InferenceHead(VirtualMemoryFS(), stub.host, stub.port)
+            async with head.infer_stream("red green", context=[b'ctx']) as stream:
+                tokens = [token async for token in stream]
+            assert ''.join(tokens) == ''.join(stub.completion("ctx\nred green"))
+            stats = stream.stats()
+            assert stats['tokens'] == 5 and stats['done'] and not stats['cancelled']
+            assert stats['time_to_first_token'] > 0 and stats['tokens_per_second'] > 0
+            assert stream.final['eval_count'] == 5
+            await head.close()
+    run(scenario())
+
+
+def test_stream_cancel_partway_keeps_the_pool_usable():
+    async def scenario():
+        async with OllamaStub(dim=2, tokens=100, token_delay=0.01) as stub:
+            pool = HTTPConnectionPool(stub.host, stub.port, max_connections=1)
+            async with InferenceStream(pool, {'model': 'm', 'prompt': 'a b'}) as stream:
+                async for token in stream:
+                    break
+            assert stream.cancelled and stream.tokens == 1
+            with pytest.raises(StopAsyncIteration):
+                await stream.__anext__()
+            assert (await pool.post_json("/api/embeddings", {'prompt': 'x'}))[
+                'embedding'
+            ]
+            await pool.close()
+    run(scenario())
+
+
+@pytest.mark.parametrize('max_connections', [1, 2])
+def test_nothing_is_pipelined_behind_a_stream(max_connections):
+    async def scenario():
+        async with OllamaStub(dim=2, tokens=20, token_delay=0.01) as stub:
+            pool = HTTPConnectionPool(
+                stub.host, stub.port, max_connections, pipeline_depth=4
+            )
+            stream = InferenceStream(pool, {'model': 'm', 'prompt': 'a'})
+            await stream.__anext__()
+            streaming = pool._connections[0]
+            replies = await asyncio.gather(
+                *(
+                    pool.post_json("/api/embeddings", {'prompt': str(i)})
+                    for i in range(6)
+                )
+            )
+            # With a second connection the embeddings overtake the stream; with
+            # one they wait for it
+            overtaken = max_connections == 2
+            assert len(replies) == 6 and stream.tokens == 1
+            assert streaming.streams == streaming.inflight == overtaken
+            assert len([token async for token in stream]) == 19
+            await pool.close()
+    run(scenario())
+
+
+# Inference cache (user-050)
+
+def test_inference_cache_keys():
+    key = InferenceCache.key
+    assert key('m', 'p') == key('m', 'p', []) != key('m', 'p', [b''])
+    assert key('m', 'p', [b'ab', b'c']) != key('m', 'p', [b'a', b'bc'])
+    assert key('m', 'p') != key('n', 'p')
+
+
+def test_inference_cache_ttl_and_lru(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(ollogic.time, 'monotonic', lambda: now[0])
+    cache = InferenceCache(capacity=2, ttl=10)
+    cache.put('a', 'A')
+    cache.put('b', 'B')
+    assert cache.get('a') == 'A'
+    cache.put('c', 'C')
+    assert cache.get('b') is None and cache.evictions == 1
+    now[0] = 110.0
+    assert cache.get('a') is None and cache.expirations == 1
+    forever = InferenceCache(ttl=None)
+    forever.put('a', 'A')
+    now[0] = 1e12
+    assert forever.get('a') == 'A'
+
+
+def test_identical_inferences_share_one_generation():
+    async def scenario():
+        async with OllamaStub(tokens=3, token_delay=0.01) as stub:
+            head = InferenceHead(VirtualMemoryFS(), stub.host, stub.port)
+            replies = await asyncio.gather(
+                *(head.infer("same prompt") for _ in range(5))
+            )
+            assert replies == [''.join(stub.completion("same prompt"))] * 5
+            assert await head.infer("same prompt") == replies[0]
+            assert stub.requests == 1
+            stats = head.inference_cache.stats()
+            assert (
+                stats['misses'] == 1 and stats['coalesced'] == 4 and stats['hits'] == 1
+            )
+            assert stats['hit_rate'] == pytest.approx(5 / 6)
+            await head.infer("same prompt", context=[b'other'])
+            await head.infer("same prompt", cache=False)
+            assert stub.requests == 3 and head.inference_cache.stats()['misses'] == 2
+            await head.close()
+    run(scenario())
+
+
+def test_failed_generation_is_not_cached():
+    calls = []
+
+    async def flaky():
+        calls.append(1)
+        if len(calls) == 1:
+            raise ConnectionRefusedError
+        return 'ok'
+
+    async def scenario():
+        cache = InferenceCache()
+        with pytest.raises(ConnectionRefusedError):
+            await cache.get_or_compute('k', flaky)
+        assert len(cache) == 0
+        assert await cache.get_or_compute('k', flaky) == 'ok'
+        assert await cache.get_or_compute('k', flaky) == 'ok' and len(calls) == 2
+    run(scenario())
@@ -0,0 +1,162 @@
+import gc
+import time
+import weakref
+
+import pytest
+
+from src.mem import virtual
+from src.mem.pages import PageCache, coalesce, gather, scatter
+from src.mem.virtual import VirtualMemoryFS
+
+
+@pytest.fixture
+def vmem(tmp_path, monkeypatch):
+    monkeypatch.setattr(virtual, 'BASE_DIR', str(tmp_path / 'vmem'))
+    return VirtualMemoryFS(flush_interval=None)
+
+
+# Range and vectored I/O (user-037)
+
+def test_coalesce_gather_scatter():
+    ranges = [(10, 5), (0, 2), (12, 10), (30, 0), (2, 1)]
+    runs = coalesce(ranges)
+    assert runs == [(0, 3), (10, 12)]
+    data = [memoryview(bytes(range(start, start + length))) for start, length in runs]
+    assert [bytes(view) for view in gather(ranges, runs, data)] == [
+        bytes(range(10, 15)), bytes(range(0, 2)), bytes(range(12, 22)), b'', b'\x02',
+    ]
+    assert scatter([(0, b'aaaa'), (2, b'bb'), (10, b'c')]) == [
+        (0, bytearray(b'aabb')),
+        (10, bytearray(b'c')),
+    ]
+    assert scatter([(1, b'xxyy'), (2, b'zz')], unit=2) == [(1, bytearray(b'xxzz'))]
+
+
+def test_word_ranges_and_vectors(vmem):
+    vmem.write_range(0x00FF, b'\x00\x01\x00\x02')
+    assert bytes(vmem.read_range(0x00FF, 2)) == b'\x00\x01\x00\x02'
+    vmem.writev([(0x10, b'aabb'), (0x11, b'cc'), (0x20, b'dd')])
+    views = vmem.readv([(0x10, 2), (0x11, 1), (0x20, 1), (0x30, 0)])
+    assert [bytes(view) for view in views] == [b'aacc', b'cc', b'dd', b'']
+    with pytest.raises(ValueError):
+        vmem.write_range(0, b'\x01')
+    with pytest.raises(ValueError):
+        vmem.writev([(0, b'abc')])
+    with pytest.raises(ValueError):
+        vmem.read_range(0xFFFF, 2)
+
+
+# Page cache (user-038)
+
+class Store:
+    def __init__(self, size=1 << 16):
+        self.data = bytearray(size)
+        self.batches = []
+        self.fail = 0
+
+    def load(self, address, length):
+        return bytes(self.data[address:address + length])
+
+    def store(self, spans):
+        if self.fail:
+            self.fail -= 1
+            raise OSError("disk full")
+        self.batches.append(spans)
+        for address, data in spans:
+            self.data[address:address + len(data)] = data
+
+
+def test_page_cache_lru_and_dirty_spans():
+    store = Store()
+    cache = PageCache(
+        store.load, store.store, capacity=2, page_size=16, flush_interval=None
+    )
+    cache.write(3, b'ab')
+    cache.write(20, b'c')
+    assert cache.read(3, 2) == b'ab' and store.data[3:5] == b'\0\0'
+    cache.flush()
+    assert store.batches == [[(3, b'ab'), (20, b'c')]]
+    cache.read(40, 1)  # page 1 is least recently used
+    assert cache.resident(0, 1) and not cache.resident(16, 1) and cache.resident(32, 1)
+    cache.write(33, b'x')
+    cache.read(0, 1)
+    cache.read(50, 1)  # evicts page 2, writing back only its dirty span
+    assert store.batches[-1] == [(33, b'x')]
+    stats = cache.stats()
+    assert (
+        stats['evictions'] == 2 and stats['flushes'] == 1 and stats['dirty_pages'] == 0
+    )
+    assert 0 < stats['hit_rate'] < 1
+
+
+def test_failed_flush_keeps_pages_dirty():
+    store = Store()
+    cache = PageCache(
+        store.load, store.store, capacity=4, page_size=16, flush_interval=None
+    )
+    cache.write(0, b'abc')
+    store.fail = 1
+    with pytest.raises(OSError):
+        cache.flush()
+    assert cache.stats()['dirty_pages'] == 1
+    cache.flush()
+    assert store.data[:3] == b'abc' and cache.stats()['dirty_pages'] == 0
+
+
+def test_failed_eviction_keeps_page_and_retries():
+    store = Store()
+    cache = PageCache(
+        store.load, store.store, capacity=1, page_size=16, flush_interval=None
+    )
+    cache.write(0, b'abc')
+    store.fail = 1
+    with pytest.raises(OSError):
+        cache.read(16, 1)
+    assert cache.resident(0, 1) and cache.stats()['dirty_pages'] == 1
+    assert cache.read(32, 1) == b'\0'
+    assert store.data[:3] == b'abc'
+    assert cache.stats()['resident_pages'] == 1
+
+
+def test_timed_flush():
+    store = Store()
+    cache = PageCache(store.load, store.store, page_size=16, flush_interval=0.01)
+    cache.write(0, b'z')
+    deadline = time.monotonic() + 5
+    while not store.batches and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert store.data[0:1] == b'z'
+
+
+def test_collected_vmem_flushes_dirty_pages(tmp_path, monkeypatch):
+    monkeypatch.setattr(virtual, 'BASE_DIR', str(tmp_path / 'vmem'))
+    vmem = VirtualMemoryFS(flush_interval=None)
+    vmem.write(0x0102, b'\xab\xcd')
+    ref = weakref.ref(vmem)
+    del vmem
+    gc.collect()
+    assert ref() is None
+    assert (tmp_path / 'vmem' / '01' / '02.mem').read_bytes() == b'\xab\xcd'
+
+
+# Lazy initialization (user-039)
+
+def test_tree_is_created_on_first_write(vmem, tmp_path):
+    assert not (tmp_path / 'vmem').exists()
+    assert vmem.read(0xABCD) == b'\0\0'
+    assert not (tmp_path / 'vmem').exists()
+    vmem.write(0xABCD, b'\x12\x34')
+    vmem.flush()
+    assert sorted(path.name for path in (tmp_path / 'vmem').iterdir()) == ['ab']
+    assert (tmp_path / 'vmem' / 'ab' / 'cd.mem').read_bytes() == b'\x12\x34'
+    assert VirtualMemoryFS(flush_interval=None).read(0xABCD) == b'\x12\x34'
+
+
+def test_directory_segment_without_a_package(vmem, tmp_path):
+    segment = vmem.get_directory_segment(0x42)
+    assert len(segment.data) == 256 and not (tmp_path / 'vmem').exists()
+    vmem.write(0x4200, b'\0\1')
+    vmem.flush()
+    assert len(vmem.get_directory_segment(0x42).data) == 256
+    with pytest.raises(ValueError):
+        vmem.get_directory_segment(0x100)